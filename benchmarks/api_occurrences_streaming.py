@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compares the peak resident memory of api_occurrences building its whole
+response with json.dumps against streaming it (STREAM_API_OCCURRENCES), for a
+year of daily events.  Each mode runs in its own process, since the peak RSS
+of a process never goes down.
+
+Run it from the root of the repository:
+
+    python benchmarks/api_occurrences_streaming.py [number of events]
+"""
+from __future__ import print_function
+import datetime
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+
+
+def peak_rss_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak / 1024.0 if sys.platform == 'darwin' else float(peak)
+
+
+def run(mode, count):
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES['default']['NAME'] = ':memory:'
+
+    import pytz
+    from django.core.management import call_command
+    from django.test import RequestFactory
+
+    from schedule import views
+    from schedule.models import Calendar, Event, Rule
+
+    call_command('migrate', verbosity=0)
+    calendar = Calendar.objects.create(name='Benchmark', slug='benchmark')
+    rule = Rule.objects.create(frequency='DAILY', name='Daily')
+    for i in range(count):
+        start = datetime.datetime(2015, 1, 1, i % 24, 0, tzinfo=pytz.utc)
+        Event.objects.create(title='Event %d' % i, description='', calendar=calendar, rule=rule,
+                             start=start, end=start + datetime.timedelta(minutes=45))
+
+    views.STREAM_API_OCCURRENCES = mode == 'stream'
+    request = RequestFactory().get('/api/occurrences', {
+        'calendar_slug': 'benchmark', 'start': '2015-01-01', 'end': '2016-01-01'})
+    baseline = peak_rss_kib()
+    began = time.time()
+    response = views.api_occurrences(request)
+    size = 0
+    for chunk in (response.streaming_content if response.streaming else [response.content]):
+        # a server writes each chunk to the socket and drops it
+        size += len(chunk)
+    elapsed = time.time() - began
+    print('%s %f %f %f %d' % (mode, elapsed, baseline, peak_rss_kib(), size))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print('%d daily events over a year' % count)
+    print('%-10s %10s %16s %16s %12s' % ('', 'seconds', 'RSS before KiB', 'peak RSS KiB', 'JSON KiB'))
+    for mode in ('list', 'stream'):
+        output = subprocess.check_output([sys.executable, __file__, '--run', mode, str(count)])
+        name, elapsed, baseline, peak, size = output.decode().split()
+        print('%-10s %10.3f %16.0f %16.0f %12.0f' % (
+            name, float(elapsed), float(baseline), float(peak), int(size) / 1024.0))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
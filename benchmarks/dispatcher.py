@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of the Dispatcher on recurring events: loading the
+heap, dispatching a simulated day minute by minute, and refreshing edited
+events.  It compares asking "what starts in the next minute" of the
+dispatcher with asking EventListManager.occurrences_after, which expands
+every event again for each question.  A third of the events recur daily, a
+third hourly, and a third on weekdays through a BYWEEKDAY rule, which dateutil
+has to walk instead of the closed form of FixedIntervalRule.
+
+Run it from the root of the repository:
+
+    python benchmarks/dispatcher.py [number of events]
+"""
+from __future__ import print_function
+import datetime
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = ':memory:'
+
+import pytz
+from django.core.management import call_command
+
+from schedule.dispatcher import Dispatcher
+from schedule.models import Calendar, Event, Rule
+from schedule.utils import EventListManager
+
+NOW = datetime.datetime(2015, 1, 5, tzinfo=pytz.utc)
+
+
+def create_events(count):
+    calendar = Calendar.objects.create(name='Benchmark', slug='benchmark')
+    rules = [Rule.objects.create(frequency='DAILY', name='Daily'),
+             Rule.objects.create(frequency='HOURLY', name='Hourly'),
+             Rule.objects.create(frequency='DAILY', name='Weekdays', params='byweekday:0,1,2,3,4')]
+    events = []
+    for i in range(count):
+        # the bounds are set by Event.save, which bulk_create skips
+        start = datetime.datetime(2015, 1, 1, i % 24, i % 60, tzinfo=pytz.utc)
+        events.append(Event(title='Event %d' % i, description='', calendar=calendar, rule=rules[i % 3],
+                            start=start, end=start + datetime.timedelta(minutes=45),
+                            first_occurrence_start=start))
+    Event.objects.bulk_create(events, batch_size=500)
+
+
+def timed(function):
+    began = time.time()
+    result = function()
+    return time.time() - began, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    call_command('migrate', verbosity=0)
+    create_events(count)
+    print('%d recurring events' % count)
+
+    dispatcher = Dispatcher()
+    elapsed, _ = timed(lambda: dispatcher.load(NOW))
+    print('%-40s %10.3f s' % ('load', elapsed))
+
+    def dispatch_day():
+        fired = 0
+        for minute in range(1, 24 * 60 + 1):
+            fired += len(dispatcher.dispatch(NOW + datetime.timedelta(minutes=minute)))
+        return fired
+    elapsed, fired = timed(dispatch_day)
+    print('%-40s %10.3f s %10d occurrences %10.0f /s' % ('dispatch a day by minute', elapsed, fired,
+                                                          fired / elapsed))
+
+    edited = list(Event.objects.values_list('pk', flat=True)[:1000])
+    elapsed, _ = timed(lambda: dispatcher.refresh(edited))
+    print('%-40s %10.3f s' % ('refresh %d events' % len(edited), elapsed))
+
+    # a single question to occurrences_after already expands every event
+    after = NOW + datetime.timedelta(days=1)
+
+    def next_minute():
+        occurrences = EventListManager(Event.objects.all()).occurrences_after(after)
+        return len(list(itertools.takewhile(lambda o: o.start <= after + datetime.timedelta(minutes=1),
+                                            occurrences)))
+    elapsed, found = timed(next_minute)
+    print('%-40s %10.3f s %10d occurrences' % ('occurrences_after, next minute once', elapsed, found))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Compares the expansion of plain DAILY, WEEKLY and HOURLY rules over a year
+by dateutil's rrule with the closed form FixedIntervalRule, both for the
+bare rule and for Event._get_occurrence_list.
+
+Run it from the root of the repository:
+
+    python benchmarks/fixed_interval_rules.py
+"""
+from __future__ import print_function
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+
+import django
+django.setup()
+
+import pytz
+from dateutil import rrule
+
+from schedule.models import Event, Rule, FixedIntervalRule
+
+
+def timed(function, repeat=5):
+    best = None
+    for i in range(repeat):
+        began = time.time()
+        function()
+        elapsed = time.time() - began
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    tzinfo = pytz.timezone('Europe/Amsterdam')
+    start = tzinfo.localize(datetime.datetime(2015, 1, 1))
+    end = tzinfo.localize(datetime.datetime(2016, 1, 1))
+    print('%-18s %-22s %10s %10s %8s' % ('', '', 'rrule', 'fixed', 'speedup'))
+    for frequency, params in (('WEEKLY', None), ('DAILY', None), ('DAILY', 'interval:3'), ('HOURLY', None)):
+        rule = Rule(frequency=frequency, params=params)
+        event = Event(rule=rule, start=tzinfo.localize(datetime.datetime(2010, 3, 1, 9, 30)),
+                      end=tzinfo.localize(datetime.datetime(2010, 3, 1, 10, 30)))
+        fixed = event.get_rrule_object(tzinfo)
+        assert isinstance(fixed, FixedIntervalRule)
+        dtstart = tzinfo.normalize(event.start).replace(tzinfo=None)
+        walked = rrule.rrule(rule.rrule_frequency(), dtstart=dtstart, **rule.get_params())
+        after, before = start.replace(tzinfo=None), end.replace(tzinfo=None)
+        assert walked.between(after, before, inc=True) == fixed.between(after, before, inc=True)
+
+        label = '%s %s' % (frequency, params or '')
+        results = [timed(lambda: compiled.between(after, before, inc=True)) for compiled in (walked, fixed)]
+        print('%-18s %-22s %10.5f %10.5f %7.1fx' % (label, 'between', results[0], results[1],
+                                                     results[0] / results[1]))
+
+        results = []
+        for compiled in (walked, fixed):
+            event.get_rrule_object = lambda tzinfo, compiled=compiled: compiled
+            results.append(timed(lambda: event._get_occurrence_list(start, end)))
+        del event.get_rrule_object
+        print('%-18s %-22s %10.5f %10.5f %7.1fx' % (label, '_get_occurrence_list', results[0], results[1],
+                                                     results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compares the time and memory needed to expand a year of recurring events
+into OccurrenceView objects with building an Occurrence model instance for
+every generated occurrence, which is what Event._create_occurrence used to do.
+
+Run it from the root of the repository:
+
+    python benchmarks/occurrence_views.py [number of events]
+"""
+from __future__ import print_function
+import datetime
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+
+import django
+django.setup()
+
+import pytz
+
+from schedule.models import Event, Occurrence, Rule
+
+
+def legacy_create_occurrence(self, start, end=None):
+    if end is None:
+        end = start + (self.end - self.start)
+    return Occurrence(event=self, start=start, end=end, original_start=start, original_end=end)
+
+
+def build_events(count):
+    rule = Rule(id=1, frequency='DAILY', name='Daily')
+    events = []
+    for i in range(count):
+        start = datetime.datetime(2015, 1, 1, i % 24, 0, tzinfo=pytz.utc)
+        events.append(Event(id=i + 1, title='Event %d' % i, description='', rule=rule, start=start,
+                            end=start + datetime.timedelta(minutes=45)))
+    return events
+
+
+def expand(events, start, end):
+    occurrences = []
+    for event in events:
+        occurrences += event._get_occurrence_list(start, end)
+    return occurrences
+
+
+def measure(events, start, end):
+    gc.collect()
+    began = time.time()
+    occurrences = expand(events, start, end)
+    elapsed = time.time() - began
+    del occurrences
+    gc.collect()
+    tracemalloc.start()
+    occurrences = expand(events, start, end)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(occurrences), elapsed, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    events = build_events(count)
+    start = datetime.datetime(2015, 1, 1, tzinfo=pytz.utc)
+    end = datetime.datetime(2016, 1, 1, tzinfo=pytz.utc)
+    # compile the rules once so both runs only pay for the occurrences
+    expand(events, start, end)
+
+    current = Event._create_occurrence
+    Event._create_occurrence = legacy_create_occurrence
+    try:
+        legacy = measure(events, start, end)
+    finally:
+        Event._create_occurrence = current
+    views = measure(events, start, end)
+
+    print('%d events, %d occurrences over a year' % (count, views[0]))
+    print('%-20s %10s %14s' % ('', 'seconds', 'retained KiB'))
+    for name, (_, elapsed, size) in (('Occurrence models', legacy), ('OccurrenceView', views)):
+        print('%-20s %10.3f %14.0f' % (name, elapsed, size / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
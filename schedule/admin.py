@@ -10,6 +10,7 @@ class CalendarAdminOptions(admin.ModelAdmin):
 
 class EventAdmin(admin.ModelAdmin):
     form = EventAdminForm
+    list_display = ('title', 'calendar', 'first_occurrence_start', 'last_occurrence_end')
 
 
 admin.site.register(Calendar, CalendarAdminOptions)
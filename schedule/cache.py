@@ -0,0 +1,120 @@
+from __future__ import unicode_literals
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db.models.query import QuerySet
+from django.views.decorators.http import condition
+
+from schedule.conf import settings
+from schedule.models import Event
+
+VERSION_KEY = 'schedule:calendar-version:%s'
+OCCURRENCES_KEY = 'schedule:occurrences:%s'
+
+
+def get_cache():
+    """
+    Returns the cache backend named by OCCURRENCE_CACHE, or None while the
+    occurrence cache is disabled.
+    """
+    if not settings.OCCURRENCE_CACHE:
+        return None
+    return caches[settings.OCCURRENCE_CACHE]
+
+
+def get_calendar_versions(cache, calendar_ids):
+    """
+    Returns the current version of each calendar, creating the missing ones.
+    Versions are random so that a version dropped by the backend never comes
+    back and revives the entries stored with it.
+    """
+    keys = dict((VERSION_KEY % calendar_id, calendar_id) for calendar_id in calendar_ids)
+    versions = cache.get_many(list(keys))
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return sorted((keys[key], version) for key, version in versions.items())
+
+
+def bump_calendar_versions(calendar_ids):
+    """
+    Invalidates every cached occurrence of the calendars in O(1) each.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.set_many(dict((VERSION_KEY % calendar_id, uuid.uuid4().hex) for calendar_id in set(calendar_ids)),
+                   None)
+
+
+def get_versions(events):
+    """
+    Returns the current versions of the calendars of the queryset
+    ``events``, looked up with one query, or None while the occurrence cache
+    is disabled.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    return get_calendar_versions(cache, events.order_by().values_list('calendar', flat=True).distinct())
+
+
+def get_or_expand(key, calendar_ids, expand):
+    """
+    Returns the value cached for ``key`` and the current versions of
+    ``calendar_ids``, or stores the result of ``expand()`` under it.
+    """
+    cache = get_cache()
+    if cache is None:
+        return expand()
+    versions = get_calendar_versions(cache, calendar_ids)
+    digest = hashlib.md5(repr((key, versions)).encode('utf-8')).hexdigest()
+    value = cache.get(OCCURRENCES_KEY % digest)
+    if value is None:
+        value = expand()
+        cache.set(OCCURRENCES_KEY % digest, value, settings.OCCURRENCE_CACHE_TIMEOUT)
+    return value
+
+
+def occurrences_between(events, start, end, calendar_ids=None):
+    """
+    Returns Event.objects.occurrences_between(events, start, end) from the
+    occurrence cache, or None if it is disabled or ``events`` is not a
+    queryset.  ``calendar_ids`` are the calendars of the events, which are
+    looked up with one query when they are not given.
+    """
+    if get_cache() is None or not isinstance(events, QuerySet):
+        return None
+    try:
+        sql = str(events.query)
+    except Exception:
+        # empty querysets have no SQL
+        return None
+    if calendar_ids is None:
+        calendar_ids = events.order_by().values_list('calendar', flat=True).distinct()
+    key = (sql, start.isoformat(), end.isoformat(), getattr(start.tzinfo, 'zone', None))
+    return get_or_expand(key, calendar_ids, lambda: Event.objects.occurrences_between(events, start, end))
+
+
+def condition_on_events(get_events, get_extra=None):
+    """
+    Decorator answering conditional GET requests with 304 Not Modified while
+    the calendars of the events returned by ``get_events(request, *args,
+    **kwargs)`` keep their version, which every save or deletion of one of
+    their events or occurrences bumps.  The ETag also depends on the url and
+    on ``get_extra(request, *args, **kwargs)``, for responses which depend on
+    more than the events.  No ETag is sent while the occurrence cache, which
+    holds the versions, is disabled.
+    """
+    def get_etag(request, *args, **kwargs):
+        if get_cache() is None:
+            return None
+        events = get_events(request, *args, **kwargs)
+        if not isinstance(events, QuerySet):
+            return None
+        extra = get_extra(request, *args, **kwargs) if get_extra else None
+        return hashlib.md5(repr((get_versions(events), request.get_full_path(), extra)).encode('utf-8')).hexdigest()
+
+    return condition(etag_func=get_etag)
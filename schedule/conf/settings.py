@@ -48,7 +48,7 @@ CALENDAR_VIEW_PERM = get_config('CALENDAR_VIEW_PERM', False)
 GET_EVENTS_FUNC = get_config('GET_EVENTS_FUNC', None)
 if not GET_EVENTS_FUNC:
     def get_events(request, calendar):
-        return calendar.event_set.prefetch_related('occurrence_set', 'rule')
+        return calendar.event_set.select_related('rule')
 
     GET_EVENTS_FUNC = get_events
 
@@ -60,4 +60,39 @@ SCHEDULER_PREVNEXT_LIMIT_SECONDS = get_config('SCHEDULER_PREVNEXT_LIMIT_SECONDS'
 USE_FULLCALENDAR = get_config('USE_FULLCALENDAR', False)
 
 #This name is used when a new event is created through selecting in fullcalendar
-EVENT_NAME_PLACEHOLDER = get_config('EVENT_NAME_PLACEHOLDER', 'Event Name')
\ No newline at end of file
+EVENT_NAME_PLACEHOLDER = get_config('EVENT_NAME_PLACEHOLDER', 'Event Name')
+
+# Maximum number of compiled rrules kept in memory by Event.get_rrule_object
+# (0 disables the cache)
+RRULE_CACHE_SIZE = get_config('RRULE_CACHE_SIZE', 1024)
+
+# Keep the occurrences of every event materialized in the OccurrenceIndex table
+# (see the refresh_occurrence_index management command)
+OCCURRENCE_INDEX = get_config('OCCURRENCE_INDEX', False)
+
+# Number of days before and after today covered by the OccurrenceIndex
+OCCURRENCE_INDEX_HORIZON = get_config('OCCURRENCE_INDEX_HORIZON', 548)
+
+# Number of expanded windows of occurrences (a period and its neighbours) kept
+# in memory by the periods (0 disables the cache)
+EXPANSION_CACHE_SIZE = get_config('EXPANSION_CACHE_SIZE', 0)
+
+# Alias of the Django cache storing the expanded occurrences of calendars
+# (None disables the cache)
+OCCURRENCE_CACHE = get_config('OCCURRENCE_CACHE', None)
+
+# Number of seconds the expanded occurrences are cached
+OCCURRENCE_CACHE_TIMEOUT = get_config('OCCURRENCE_CACHE_TIMEOUT', 3600)
+
+# Log the saved and deleted events and occurrences of each calendar in the
+# EventChange table, for the api_occurrences_delta view
+CHANGE_LOG = get_config('CHANGE_LOG', False)
+
+# The seconds the sync tokens lag behind the change log, which must exceed
+# the longest transaction saving events, as such a transaction may commit a
+# change after later ones were read
+CHANGE_LOG_OVERLAP = get_config('CHANGE_LOG_OVERLAP', 60)
+
+# Stream the JSON of api_occurrences while the events are expanded instead of
+# building the whole response in memory (the occurrences are not sorted then)
+STREAM_API_OCCURRENCES = get_config('STREAM_API_OCCURRENCES', False)
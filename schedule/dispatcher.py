@@ -0,0 +1,281 @@
+from __future__ import unicode_literals
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+from django.conf import settings as django_settings
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
+from django.utils import timezone
+
+from schedule.conf import settings
+from schedule.models import Event, EventChange, Occurrence, Rule
+from schedule.models.events import events_changed
+
+logger = logging.getLogger(__name__)
+
+# sent by a Dispatcher for each occurrence coming due
+occurrence_due = Signal(providing_args=['occurrence'])
+
+# the most ids queried at once, below the variable limit of SQLite
+BATCH_SIZE = 500
+
+
+class Dispatcher(object):
+    """
+    Keeps the next occurrence of every event of ``events`` (all of them by
+    default) in a heap keyed on start, and fires the ``occurrence_due``
+    signal and the callbacks given to ``connect`` for each occurrence as it
+    starts, or ``lead`` before.  Firing an occurrence of a recurring event
+    pushes its next one, found with the compiled rule of the event, so the
+    rules are never expanded from scratch.
+
+    Persisted occurrences replace the generated ones, cancelled occurrences
+    never come due and moved ones come due at their new start.  Changes made
+    in the same process are picked up by the model signals once ``watch`` is
+    called, those made by other processes by ``sync``.
+    """
+
+    def __init__(self, events=None, lead=datetime.timedelta(0)):
+        self.events = Event.objects.all() if events is None else events
+        self.lead = lead
+        self.horizon = None
+        self.callbacks = []
+        self._heap = []
+        self._seq = itertools.count()
+        # per event id: the event, its compiled rule and the version its heap
+        # entries must carry to be current
+        self._events = {}
+        self._rules = {}
+        self._versions = {}
+        # the persisted occurrences still to come, by event id and original
+        # start
+        self._persisted = {}
+
+    def connect(self, callback):
+        """
+        Registers ``callback``, which is called with each occurrence coming
+        due after the receivers of ``occurrence_due``.
+        """
+        self.callbacks.append(callback)
+
+    def load(self, now=None):
+        """
+        Drops everything and schedules the occurrences of all the events
+        starting after ``now``.
+        """
+        self.horizon = timezone.now() if now is None else now
+        self._heap = []
+        self._events, self._rules, self._versions, self._persisted = {}, {}, {}, {}
+        events = self._upcoming(self.events)
+        self._schedule(events.iterator(), self._persisted_after(Occurrence.objects.filter(event__in=events)))
+
+    def refresh(self, event_ids):
+        """
+        Reschedules the events of ``event_ids`` after they were saved, had
+        occurrences saved or were deleted.  The occurrences which started
+        before the horizon of the last dispatch are not fired again.
+        """
+        event_ids = set(event_ids)
+        if self.horizon is None or not event_ids:
+            return
+        for event_id in event_ids:
+            self._forget(event_id)
+        for ids in _batches(sorted(event_ids)):
+            events = list(self._upcoming(self.events.filter(pk__in=ids)))
+            self._schedule(events, self._persisted_after(Occurrence.objects.filter(event__in=ids)))
+
+    def sync(self, since):
+        """
+        Refreshes the events saved or whose occurrences were saved from
+        ``since`` on, by any process, and returns the time to pass to the
+        next call.  The occurrences deleted by other processes leave no
+        trace but in the change log, which is read as well while the
+        CHANGE_LOG setting is enabled.
+        """
+        now = timezone.now()
+        event_ids = set(Event.objects.filter(updated_on__gte=since).values_list('pk', flat=True))
+        event_ids.update(Occurrence.objects.filter(updated_on__gte=since).values_list('event', flat=True))
+        if settings.CHANGE_LOG:
+            event_ids.update(EventChange.objects.filter(created_on__gte=since).values_list('event_id', flat=True))
+        self.refresh(event_ids)
+        return now
+
+    def next_due(self):
+        """
+        Returns the time the next occurrence comes due, or None if none will.
+        """
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return self._heap[0][0] - self.lead
+
+    def dispatch(self, now=None):
+        """
+        Fires the occurrences coming due until ``now`` and returns them, in
+        order of start.
+        """
+        if self.horizon is None:
+            self.load(now)
+        now = timezone.now() if now is None else now
+        horizon = max(self.horizon, now + self.lead)
+        due = []
+        while self._heap and self._heap[0][0] <= horizon:
+            entry = heapq.heappop(self._heap)
+            if not self._is_current(entry):
+                continue
+            start, event_id, seq, version, occurrence, generated = entry
+            if generated:
+                self._push_next(event_id, start)
+                persisted = self._persisted.get(event_id, {}).pop(start, None)
+                if persisted is not None:
+                    # moved occurrences have an entry of their own
+                    if persisted.cancelled or persisted.start != persisted.original_start:
+                        continue
+                    occurrence = persisted
+            elif occurrence.cancelled:
+                continue
+            due.append(occurrence)
+        self.horizon = horizon
+        # events deleted by another process since the last sync
+        existing = set()
+        for ids in _batches(sorted(set(occurrence.event_id for occurrence in due))):
+            existing.update(Event.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        due = [occurrence for occurrence in due if occurrence.event_id in existing]
+        for occurrence in due:
+            self._fire(occurrence)
+        return due
+
+    def run(self, poll=60, sleep=time.sleep):
+        """
+        Dispatches occurrences as they come due, forever, syncing the changes
+        of other processes every ``poll`` seconds.
+        """
+        self.watch()
+        since = timezone.now()
+        self.load(since)
+        while True:
+            since = self.sync(since)
+            self.dispatch()
+            wait = poll
+            next_due = self.next_due()
+            if next_due is not None:
+                wait = min(poll, max((next_due - timezone.now()).total_seconds(), 0))
+            sleep(wait)
+
+    def watch(self):
+        """
+        Connects the model signals refreshing the events changed by this
+        process.
+        """
+        post_save.connect(self._event_saved, sender=Event)
+        post_delete.connect(self._event_deleted, sender=Event)
+        post_save.connect(self._occurrence_saved, sender=Occurrence)
+        post_delete.connect(self._occurrence_saved, sender=Occurrence)
+        post_save.connect(self._rule_saved, sender=Rule)
+        events_changed.connect(self._events_changed)
+
+    def unwatch(self):
+        post_save.disconnect(self._event_saved, sender=Event)
+        post_delete.disconnect(self._event_deleted, sender=Event)
+        post_save.disconnect(self._occurrence_saved, sender=Occurrence)
+        post_delete.disconnect(self._occurrence_saved, sender=Occurrence)
+        post_save.disconnect(self._rule_saved, sender=Rule)
+        events_changed.disconnect(self._events_changed)
+
+    def _event_saved(self, sender, instance, **kwargs):
+        if not kwargs.get('raw'):
+            self.refresh([instance.pk])
+
+    def _event_deleted(self, sender, instance, **kwargs):
+        self._forget(instance.pk)
+
+    def _occurrence_saved(self, sender, instance, **kwargs):
+        if not kwargs.get('raw') and instance.event_id in self._events:
+            self.refresh([instance.event_id])
+
+    def _rule_saved(self, sender, instance, **kwargs):
+        self.refresh(Event.objects.filter(rule=instance).values_list('pk', flat=True))
+
+    def _events_changed(self, sender, events, **kwargs):
+        self.refresh(event.pk for event in events)
+
+    def _upcoming(self, events):
+        return Event.objects.upcoming(events.select_related('rule'), self.horizon)
+
+    def _persisted_after(self, occurrences):
+        return occurrences.filter(Q(start__gt=self.horizon) | Q(original_start__gt=self.horizon))
+
+    def _schedule(self, events, persisted):
+        for event in events:
+            self._events[event.pk] = event
+            self._versions[event.pk] = next(self._seq)
+            self._rules[event.pk] = event._build_rrule_object(self._tzinfo())
+            self._push_next(event.pk, self.horizon)
+        for occurrence in persisted:
+            event = self._events.get(occurrence.event_id)
+            if event is None:
+                continue
+            occurrence.event = event
+            self._persisted.setdefault(occurrence.event_id, {})[occurrence.original_start] = occurrence
+            if occurrence.start != occurrence.original_start and occurrence.start > self.horizon:
+                self._push(occurrence, generated=False)
+
+    def _forget(self, event_id):
+        self._events.pop(event_id, None)
+        self._rules.pop(event_id, None)
+        self._versions.pop(event_id, None)
+        self._persisted.pop(event_id, None)
+
+    def _push_next(self, event_id, after):
+        """
+        Pushes the first generated occurrence of the event starting after
+        ``after``.
+        """
+        event, rule = self._events[event_id], self._rules[event_id]
+        if rule is None:
+            if event.start > after:
+                self._push(event._create_occurrence(event.start, event.end), generated=True)
+            return
+        tzinfo = self._tzinfo()
+        start = rule.after(Event._wall_clock(after, tzinfo))
+        if start is None:
+            return
+        if tzinfo is not None:
+            start = tzinfo.localize(start)
+        if event.end_recurring_period and start > event.end_recurring_period:
+            return
+        self._push(event._create_occurrence(start), generated=True)
+
+    def _tzinfo(self):
+        # the rules run in UTC, or on the naive datetimes stored without
+        # USE_TZ
+        return timezone.utc if django_settings.USE_TZ else None
+
+    def _push(self, occurrence, generated):
+        event_id = occurrence.event_id
+        heapq.heappush(self._heap, (occurrence.start, event_id, next(self._seq), self._versions[event_id],
+                                    occurrence, generated))
+
+    def _is_current(self, entry):
+        return self._versions.get(entry[1]) == entry[3]
+
+    def _fire(self, occurrence):
+        for receiver, response in occurrence_due.send_robust(sender=self.__class__, occurrence=occurrence):
+            if isinstance(response, Exception):
+                logger.error("%r failed on %s", receiver, occurrence, exc_info=(
+                    type(response), response, getattr(response, '__traceback__', None)))
+        for callback in self.callbacks:
+            try:
+                callback(occurrence)
+            except Exception:
+                logger.exception("%r failed on %s", callback, occurrence)
+
+
+def _batches(ids):
+    for index in range(0, len(ids), BATCH_SIZE):
+        yield ids[index:index + BATCH_SIZE]
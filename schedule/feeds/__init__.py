@@ -1,16 +1,39 @@
 from django.utils.six.moves.builtins import str
+from schedule import cache
 from schedule.models import Calendar
 from django.contrib.syndication.views import Feed, FeedDoesNotExist
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
+from django.utils.decorators import method_decorator
 from schedule.feeds.ical import ICalendarFeed
 import itertools
 from django.utils import timezone
 
 
+def _get_feed_calendar_events(request, cal_id):
+    cal = Calendar.objects.filter(pk=cal_id).first()
+    return cal.events.all() if cal is not None else None
+
+
+def _get_upcoming_feed_events(request, bits):
+    try:
+        return UpcomingEventsFeed().get_object(request, bits).events.all()
+    except ObjectDoesNotExist:
+        return None
+
+
+def _get_upcoming_feed_extra(request, *args, **kwargs):
+    # the upcoming occurrences change every minute
+    return timezone.now().replace(second=0, microsecond=0)
+
+
 class UpcomingEventsFeed(Feed):
     feed_id = "upcoming"
 
+    @method_decorator(cache.condition_on_events(_get_upcoming_feed_events, _get_upcoming_feed_extra))
+    def __call__(self, request, *args, **kwargs):
+        return super(UpcomingEventsFeed, self).__call__(request, *args, **kwargs)
+
     def feed_title(self, obj):
         return "Upcoming Events for %s" % obj.name
 
@@ -25,8 +48,13 @@ class UpcomingEventsFeed(Feed):
         return obj.get_absolute_url()
 
     def items(self, obj):
-        return itertools.islice(obj.occurrences_after(timezone.now()),
-            getattr(settings, "FEED_LIST_LENGTH", 10))
+        count = getattr(settings, "FEED_LIST_LENGTH", 10)
+        if cache.get_cache() is None:
+            return itertools.islice(obj.occurrences_after(timezone.now()), count)
+        # cached for the current minute
+        after = timezone.now().replace(second=0, microsecond=0)
+        return cache.get_or_expand(('upcoming', obj.pk, after.isoformat(), count), [obj.pk],
+                                   lambda: list(itertools.islice(obj.occurrences_after(after), count)))
 
     def item_id(self, item):
         return str(item.id)
@@ -47,6 +75,10 @@ class UpcomingEventsFeed(Feed):
 
 
 class CalendarICalendar(ICalendarFeed):
+    @method_decorator(cache.condition_on_events(_get_feed_calendar_events))
+    def __call__(self, request, *args, **kwargs):
+        return super(CalendarICalendar, self).__call__(request, *args, **kwargs)
+
     def items(self):
         cal_id = self.args[1]
         cal = Calendar.objects.get(pk=cal_id)
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    args = '[days]'
+    help = "Deletes the entries of the EventChange log older than a number of days (30 by default)"
+
+    def handle(self, *args, **options):
+        from schedule.models import EventChange
+
+        try:
+            days = int(args[0]) if args else 30
+        except ValueError:
+            raise CommandError("The number of days must be an integer.")
+        before = timezone.now() - datetime.timedelta(days=days)
+        self.stdout.write("Deleted %d changes" % EventChange.objects.prune(before))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from schedule.conf import settings
+
+
+class Command(BaseCommand):
+    help = "Moves the OccurrenceIndex window to today and materializes all events again"
+
+    def handle(self, *args, **options):
+        from schedule.models import OccurrenceIndex
+
+        if not settings.OCCURRENCE_INDEX:
+            raise CommandError("The occurrence index is disabled, set OCCURRENCE_INDEX = True first.")
+        window = OccurrenceIndex.objects.rebuild()
+        self.stdout.write("Indexed %d occurrences from %s to %s" % (
+            OccurrenceIndex.objects.count(), window.start, window.end))
@@ -0,0 +1,25 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    args = '[poll seconds] [lead seconds]'
+    help = ("Runs a Dispatcher firing the occurrence_due signal for the occurrences of all events as they "
+            "start, or the lead before, and syncing changes every poll seconds (60 by default)")
+
+    def handle(self, *args, **options):
+        from schedule.dispatcher import Dispatcher
+
+        try:
+            poll = int(args[0]) if args else 60
+            lead = int(args[1]) if len(args) > 1 else 0
+        except ValueError:
+            raise CommandError("The poll and lead seconds must be integers.")
+        dispatcher = Dispatcher(lead=datetime.timedelta(seconds=lead))
+        if int(options.get('verbosity', 1)) > 1:
+            dispatcher.connect(lambda occurrence: self.stdout.write("%s: %s" % (occurrence.start, occurrence)))
+        try:
+            dispatcher.run(poll=poll)
+        except KeyboardInterrupt:
+            pass
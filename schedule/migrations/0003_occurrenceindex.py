@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0002_event_color_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('original_start', models.DateTimeField(verbose_name='original start')),
+                ('original_end', models.DateTimeField(verbose_name='original end')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='cancelled')),
+                ('calendar', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='schedule.Calendar', verbose_name='calendar')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='schedule.Event', verbose_name='event')),
+                ('occurrence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='schedule.Occurrence', verbose_name='occurrence')),
+            ],
+            options={
+                'verbose_name': 'occurrence index',
+                'verbose_name_plural': 'occurrence index',
+            },
+        ),
+        migrations.CreateModel(
+            name='OccurrenceIndexWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('tzname', models.CharField(blank=True, max_length=63, verbose_name='timezone')),
+                ('updated_on', models.DateTimeField(auto_now=True, verbose_name='updated on')),
+            ],
+            options={
+                'verbose_name': 'occurrence index window',
+                'verbose_name_plural': 'occurrence index windows',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='occurrenceindex',
+            index_together=set([('calendar', 'start', 'end'), ('event', 'start', 'end')]),
+        ),
+    ]
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from dateutil import rrule
+from django.db import migrations, models
+from django.utils import timezone
+
+# frozen copies of the recurrence logic of Event at the time of this
+# migration, so that later changes of the models don't change its results
+FREQUENCIES = {
+    'YEARLY': (rrule.YEARLY, 0),
+    'MONTHLY': (rrule.MONTHLY, 1),
+    'WEEKLY': (rrule.WEEKLY, 2),
+    'DAILY': (rrule.DAILY, 3),
+    'HOURLY': (rrule.HOURLY, 4),
+    'MINUTELY': (rrule.MINUTELY, 5),
+    'SECONDLY': (rrule.SECONDLY, 6),
+}
+PARAM_ORDER = {
+    'byyearday': 1,
+    'bymonth': 1,
+    'bymonthday': 2,
+    'byweekno': 2,
+    'byweekday': 3,
+    'byhour': 4,
+    'byminute': 5,
+    'bysecond': 6,
+}
+WALL_CLOCK_SLACK = datetime.timedelta(days=1)
+
+
+def rule_params(params):
+    if params is None:
+        return {}
+    param_dict = []
+    for param in params.split(';'):
+        param = param.split(':')
+        if len(param) == 2:
+            param = (str(param[0]), [int(p) for p in param[1].split(',')])
+            if len(param[1]) == 1:
+                param = (param[0], param[1][0])
+            param_dict.append(param)
+    return dict(param_dict)
+
+
+def event_params(start, frequency, params):
+    start_params = {
+        'byyearday': start.timetuple().tm_yday,
+        'bymonth': start.month,
+        'bymonthday': start.day,
+        'byweekno': start.isocalendar()[1],
+        'byweekday': start.weekday(),
+        'byhour': start.hour,
+        'byminute': start.minute,
+        'bysecond': start.second,
+    }
+    freq_order = FREQUENCIES[frequency][1]
+    result = {}
+    for param, value in rule_params(params).items():
+        if param in PARAM_ORDER and PARAM_ORDER[param] > freq_order:
+            sp = start_params[param]
+            if sp == value or (isinstance(value, list) and sp in value):
+                result[param] = [sp]
+            else:
+                return None
+        else:
+            result[param] = value
+    return result
+
+
+def occurrence_bounds(start, end, end_recurring_period, rule):
+    """
+    Returns ``first_occurrence_start`` and ``last_occurrence_end`` of an
+    event with the (historical) ``rule``, which may be None.
+    """
+    if not end_recurring_period:
+        if rule is None:
+            return start, end
+        return start, None
+    difference = end - start
+    if rule is None:
+        if difference > datetime.timedelta(0):
+            return start, end
+        return None, None
+    tzinfo = timezone.utc
+    if timezone.is_aware(start) and hasattr(start.tzinfo, 'localize'):
+        tzinfo = start.tzinfo
+
+    def wall_clock(date):
+        if timezone.is_naive(date):
+            return date
+        return date.astimezone(tzinfo).replace(tzinfo=None)
+
+    def localize(date):
+        if timezone.is_naive(start):
+            return date
+        return tzinfo.localize(date)
+
+    params = event_params(start, rule.frequency, rule.params)
+    if params is None:
+        return None, None
+    dtstart = start if timezone.is_naive(start) else tzinfo.normalize(start).replace(tzinfo=None)
+    recurrence = rrule.rrule(FREQUENCIES[rule.frequency][0], dtstart=dtstart, **params)
+    first = recurrence.after(wall_clock(start - difference) - WALL_CLOCK_SLACK, inc=True)
+    while first is not None and localize(first) + difference <= start:
+        first = recurrence.after(first)
+    if first is None or localize(first) > end_recurring_period:
+        return None, None
+    last = recurrence.before(wall_clock(end_recurring_period) + WALL_CLOCK_SLACK, inc=True)
+    while localize(last) > end_recurring_period:
+        last = recurrence.before(last)
+    return localize(first), localize(last) + difference
+
+
+def compute_occurrence_bounds(apps, schema_editor):
+    Event = apps.get_model('schedule', 'Event')
+    Rule = apps.get_model('schedule', 'Rule')
+    rules = dict((rule.pk, rule) for rule in Rule.objects.all())
+    for event in Event.objects.all():
+        first, last = occurrence_bounds(event.start, event.end, event.end_recurring_period,
+                                        rules.get(event.rule_id))
+        Event.objects.filter(pk=event.pk).update(first_occurrence_start=first, last_occurrence_end=last)
+
+
+def forget_occurrence_bounds(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0003_occurrenceindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='first_occurrence_start',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='first occurrence start'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_occurrence_end',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='Empty if the event recurs without end.', null=True, verbose_name='last occurrence end'),
+        ),
+        migrations.RunPython(compute_occurrence_bounds, forget_occurrence_bounds),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0004_event_occurrence_bounds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.IntegerField(db_index=True, verbose_name='calendar')),
+                ('event_id', models.IntegerField(verbose_name='event')),
+                ('created_on', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created on')),
+            ],
+            options={
+                'verbose_name': 'event change',
+                'verbose_name_plural': 'event changes',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0006_occurrence_start_end_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated on'),
+        ),
+        migrations.AlterField(
+            model_name='occurrence',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated on'),
+        ),
+    ]
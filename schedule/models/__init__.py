@@ -1,5 +1,7 @@
 from schedule.models.calendars import Calendar, CalendarRelation
 from schedule.models.events import *
 from schedule.models.rules import *
+from schedule.models.index import *
+from schedule.models.changes import *
 
 from schedule.signals import *
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+from django.utils.six import with_metaclass
+import datetime
+
+from django.db import models
+from django.db.models import Max
+from django.db.models.base import ModelBase
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from schedule.conf import settings
+from schedule.utils import get_model_bases
+
+
+class EventChangeManager(models.Manager):
+    def sync_token(self):
+        """
+        Returns the id of the latest change made more than CHANGE_LOG_OVERLAP
+        seconds ago, which clients send back to ask for the changes made
+        after it, or None while the change log is disabled.  A transaction
+        still running holds an id lower than those committed after it, so
+        the token lags behind and the changes of the last seconds are sent
+        again, which replaces the same occurrences.
+        """
+        if not settings.CHANGE_LOG:
+            return None
+        before = timezone.now() - datetime.timedelta(seconds=settings.CHANGE_LOG_OVERLAP)
+        # while every change is recent, a running transaction may hold any
+        # id, and a log pruned meanwhile answers the token as expired
+        return self.filter(created_on__lt=before).aggregate(token=Max('pk'))['token'] or 0
+
+    def log(self, changes):
+        """
+        Records a change of each ``(calendar_id, event_id)`` pair of
+        ``changes``.
+        """
+        if not settings.CHANGE_LOG:
+            return
+        self.bulk_create([self.model(calendar_id=calendar_id, event_id=event_id)
+                          for calendar_id, event_id in set(changes) if calendar_id is not None])
+
+    def changed_events(self, calendar, token):
+        """
+        Returns the ids of the events of ``calendar`` changed after the sync
+        token ``token``, including those which were deleted or left it, or
+        None if the changes following the token have been pruned.
+        """
+        first = self.order_by('pk').values_list('pk', flat=True).first()
+        if first is not None and token < first - 1:
+            return None
+        return set(self.filter(calendar_id=calendar.pk, pk__gt=token).values_list('event_id', flat=True))
+
+    def prune(self, before):
+        """
+        Deletes the changes older than ``before``, but always keeps the latest
+        one so that older sync tokens are recognised as pruned.
+        """
+        latest = self.aggregate(token=Max('pk'))['token']
+        if latest is None:
+            return 0
+        changes = self.filter(created_on__lt=before, pk__lt=latest)
+        count = changes.count()
+        changes.delete()
+        return count
+
+
+class EventChange(with_metaclass(ModelBase, *get_model_bases())):
+    """
+    One row per saved or deleted event or occurrence of a calendar, written
+    by signals while the CHANGE_LOG setting is enabled.  The ids are the
+    sync tokens of the api_occurrences_delta view.  Events and calendars are
+    not foreign keys, so the changes of deleted ones stay in the log.
+    """
+    calendar_id = models.IntegerField(_("calendar"), db_index=True)
+    event_id = models.IntegerField(_("event"))
+    created_on = models.DateTimeField(_("created on"), auto_now_add=True, db_index=True)
+
+    objects = EventChangeManager()
+
+    class Meta(object):
+        verbose_name = _("event change")
+        verbose_name_plural = _("event changes")
+        app_label = 'schedule'
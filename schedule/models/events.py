@@ -2,13 +2,16 @@ from __future__ import division, unicode_literals
 from django.utils.six import with_metaclass
 # -*- coding: utf-8 -*-
 from django.conf import settings as django_settings
+from collections import defaultdict
 from dateutil import rrule
 import datetime
 
 from django.contrib.contenttypes import fields
-from django.db import models
+from django.db import models, transaction
 from django.db.models.base import ModelBase
-from django.db.models import Q
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.db.models.query import QuerySet
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import date
@@ -17,9 +20,10 @@ from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 
 from schedule.conf import settings
-from schedule.models.rules import Rule
+from schedule.models.rules import Rule, FixedIntervalRule
 from schedule.models.calendars import Calendar
 from schedule.utils import OccurrenceReplacer
+from schedule.utils import LRUCache, localize_all
 from schedule.utils import get_model_bases
 
 freq_dict_order = {
@@ -42,10 +46,178 @@ param_dict_order = {
     'bysecond' : 6
 }
 
+# the largest shift of wall clock times a DST transition can cause
+WALL_CLOCK_SLACK = datetime.timedelta(days=1)
+
+# compiled rrules shared by every Event instance of the process, see
+# Event.get_rrule_object
+rrule_cache = LRUCache(settings.RRULE_CACHE_SIZE)
+
+# sent with the ``events`` changed by QuerySet.update, which sends no
+# post_save signals, so that they are handled like saved ones
+events_changed = Signal(providing_args=['events'])
+
+
+def _bulk_update(queryset, rows, batch_size=50):
+    """
+    Writes the dict ``rows``, mapping primary keys to dicts of field values,
+    with one UPDATE per ``batch_size`` rows, or one per row before Django 1.8
+    which lacks conditional expressions.
+    """
+    try:
+        from django.db.models import Case, Value, When
+    except ImportError:
+        for pk, values in rows.items():
+            queryset.filter(pk=pk).update(**values)
+        return
+    pks = list(rows)
+    for i in range(0, len(pks), batch_size):
+        batch = pks[i:i + batch_size]
+        fields = set(field for pk in batch for field in rows[pk])
+        updates = {}
+        for field in fields:
+            output_field = queryset.model._meta.get_field(field)
+            updates[field] = Case(
+                default=F(field), output_field=output_field,
+                *[When(pk=pk, then=Value(rows[pk][field], output_field=output_field))
+                  for pk in batch if field in rows[pk]])
+        queryset.filter(pk__in=batch).update(**updates)
+
+
 class EventManager(models.Manager):
     def get_for_object(self, content_object, distinction=None, inherit=True):
         return EventRelation.objects.get_events_for_object(content_object, distinction, inherit)
 
+    # The bounds of an event were computed in its own timezone, and expanding
+    # its rule in another one may shift the occurrences by a few hours, so
+    # the methods below compare them with a margin of WALL_CLOCK_SLACK.
+
+    def in_range(self, events, start, end):
+        """
+        Narrows the queryset ``events`` down to the events which may occur
+        from ``start`` to ``end``, according to their first_occurrence_start
+        and last_occurrence_end, and the events with a persisted occurrence
+        moved into that range.  Events whose bounds are unknown are kept.
+        """
+        padded_start, padded_end = start - WALL_CLOCK_SLACK, end + WALL_CLOCK_SLACK
+        moved_in = Occurrence.objects.filter(event__in=events, start__lt=end, end__gte=start).values_list(
+            'event', flat=True)
+        return events.filter(
+            Q(first_occurrence_start__isnull=True) |
+            Q(first_occurrence_start__lt=padded_end) &
+            (Q(last_occurrence_end__gte=padded_start) | Q(last_occurrence_end__isnull=True)) |
+            Q(pk__in=moved_in))
+
+    def upcoming(self, events, after):
+        """
+        Leaves out of ``events``, a queryset or a list, the events whose
+        occurrences all end before ``after``.
+        """
+        padded_after = after - WALL_CLOCK_SLACK
+        if isinstance(events, QuerySet):
+            return events.filter(Q(last_occurrence_end__isnull=True) | Q(last_occurrence_end__gt=padded_after))
+        return [event for event in events if
+                event.last_occurrence_end is None or event.last_occurrence_end > padded_after]
+
+    def earliest_start(self, event):
+        """
+        Returns a time no occurrence of ``event`` starts before, or None if
+        its bounds were never computed.
+        """
+        if event.first_occurrence_start is None:
+            return None
+        return event.first_occurrence_start - WALL_CLOCK_SLACK
+
+    def occurrences_between(self, events, start, end, persisted_occurrences=None):
+        """
+        Returns the occurrences of all ``events`` from ``start`` to ``end``,
+        sorted like a Period sorts them.  Querysets are narrowed down with
+        ``in_range`` first, and the persisted occurrences relevant to that
+        range are fetched with a single query, so the number of queries does
+        not grow with the number of events.  ``persisted_occurrences`` may
+        hold these occurrences already, for a range covering this one.
+        """
+        if isinstance(events, QuerySet):
+            events = self.in_range(events, start, end).select_related('rule')
+        return sorted(self._expand(list(events), start, end, persisted_occurrences))
+
+    def iter_occurrences_between(self, events, start, end, chunk_size=100):
+        """
+        Yields the occurrences of all ``events`` from ``start`` to ``end``
+        event by event, without sorting them, so that only ``chunk_size``
+        events and their occurrences are held in memory at once.  The
+        persisted occurrences are fetched with one query per chunk.
+        """
+        if isinstance(events, QuerySet):
+            events = self.in_range(events, start, end).select_related('rule').iterator()
+        chunk = []
+        for event in events:
+            chunk.append(event)
+            if len(chunk) == chunk_size:
+                for occurrence in self._expand(chunk, start, end):
+                    yield occurrence
+                chunk = []
+        for occurrence in self._expand(chunk, start, end):
+            yield occurrence
+
+    def shift(self, events, occurrences):
+        """
+        Moves the start and the end of each event of the dict ``events`` and
+        of each persisted occurrence of the dict ``occurrences`` by the
+        ``(start_delta, end_delta)`` they map to, in one transaction.  The
+        original start and end of the occurrences of an event move along with
+        it, and its occurrence bounds are recomputed, as when it is saved.
+        The instances are updated as well, and events_changed is sent for the
+        events and for the events of the occurrences.
+        """
+        now = timezone.now()
+        event_rows, occurrence_rows = {}, defaultdict(dict)
+        for event, (start_delta, end_delta) in events.items():
+            event.start += start_delta
+            event.end += end_delta
+            event.updated_on = now
+            event.__dict__.pop('_effective_range', None)
+            event.first_occurrence_start, event.last_occurrence_end = event._compute_occurrence_bounds()
+            event_rows[event.pk] = dict((field, getattr(event, field)) for field in (
+                'start', 'end', 'updated_on', 'first_occurrence_start', 'last_occurrence_end'))
+        for occurrence, (start_delta, end_delta) in occurrences.items():
+            occurrence.start += start_delta
+            occurrence.end += end_delta
+            occurrence.updated_on = now
+            occurrence_rows[occurrence.pk].update(start=occurrence.start, end=occurrence.end, updated_on=now)
+        shifted = dict((event.pk, deltas) for event, deltas in events.items() if any(deltas))
+        with transaction.atomic():
+            originals = Occurrence.objects.filter(event__in=list(shifted)).values_list(
+                'pk', 'event', 'original_start', 'original_end') if shifted else []
+            for pk, event_id, original_start, original_end in originals:
+                start_delta, end_delta = shifted[event_id]
+                occurrence_rows[pk].update(original_start=original_start + start_delta,
+                                           original_end=original_end + end_delta)
+            _bulk_update(self.all(), event_rows)
+            _bulk_update(Occurrence.objects.all(), occurrence_rows)
+            changed = dict((event.pk, event) for event in events)
+            for occurrence in occurrences:
+                changed.setdefault(occurrence.event_id, occurrence.event)
+            events_changed.send(sender=self.model, events=list(changed.values()))
+
+    def _expand(self, events, start, end, persisted_occurrences=None):
+        persisted = defaultdict(list)
+        pks = [event.pk for event in events if event.pk is not None]
+        if pks and persisted_occurrences is None:
+            # the occurrences now in the range, and the ones which replace a
+            # generated occurrence of the range
+            persisted_occurrences = Occurrence.objects.filter(
+                Q(start__lt=end, end__gte=start) | Q(original_start__lt=end, original_end__gte=start),
+                event__in=pks)
+        for occurrence in persisted_occurrences or []:
+            persisted[occurrence.event_id].append(occurrence)
+        for event in events:
+            event_occurrences = persisted[event.pk] if event.pk is not None else []
+            for occurrence in event_occurrences:
+                occurrence.event = event
+            for occurrence in event.get_occurrences(start, end, event_occurrences):
+                yield occurrence
+
 
 @python_2_unicode_compatible
 class Event(with_metaclass(ModelBase, *get_model_bases())):
@@ -60,13 +232,18 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, verbose_name=_("creator"),
                                 related_name='creator')
     created_on = models.DateTimeField(_("created on"), auto_now_add=True)
-    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
+    updated_on = models.DateTimeField(_("updated on"), auto_now=True, db_index=True)
     rule = models.ForeignKey(Rule, null=True, blank=True, verbose_name=_("rule"),
                              help_text=_("Select '----' for a one time only event."))
     end_recurring_period = models.DateTimeField(_("end recurring period"), null=True, blank=True,
                                                 help_text=_("This date is ignored for one time only events."))
     calendar = models.ForeignKey(Calendar, null=True, blank=True, verbose_name=_("calendar"))
     color_event = models.CharField(_("Color event"), null=True, blank=True, max_length=10)
+    first_occurrence_start = models.DateTimeField(_("first occurrence start"), null=True, blank=True,
+                                                  editable=False, db_index=True)
+    last_occurrence_end = models.DateTimeField(_("last occurrence end"), null=True, blank=True,
+                                               editable=False, db_index=True,
+                                               help_text=_("Empty if the event recurs without end."))
     objects = EventManager()
 
     class Meta(object):
@@ -96,7 +273,7 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     def get_absolute_url(self):
         return reverse('event', args=[self.id])
 
-    def get_occurrences(self, start, end):
+    def get_occurrences(self, start, end, persisted_occurrences=None):
         """
         >>> rule = Rule(frequency = "MONTHLY", name = "Monthly")
         >>> rule.save()
@@ -113,9 +290,15 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         >>> occurrences = event.get_occurrences(datetime.datetime(2008,1,24), datetime.datetime(2008,3,2))
         >>> ["%s to %s" %(o.start, o.end) for o in occurrences]
         []
-`
+
+        ``persisted_occurrences`` may hold the persisted occurrences of this
+        event which are already known, saving a query; it must include at
+        least those starting before ``end`` and ending at or after ``start``,
+        or originally doing so.
         """
-        persisted_occurrences = self.occurrence_set.all()
+        if persisted_occurrences is None:
+            persisted_occurrences = self.occurrence_set.filter(
+                Q(start__lt=end, end__gte=start) | Q(original_start__lt=end, original_end__gte=start))
         occ_replacer = OccurrenceReplacer(persisted_occurrences)
         occurrences = self._get_occurrence_list(start, end)
         final_occurrences = []
@@ -134,6 +317,24 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         return final_occurrences
 
     def get_rrule_object(self, tzinfo):
+        """
+        Returns the compiled rrule of this event in ``tzinfo`` (or None for
+        one time only events).  Rules of saved events are kept in
+        ``rrule_cache`` until the event or its rule is saved or deleted.
+        """
+        if self.rule is None:
+            return None
+        if self.pk is None:
+            return self._build_rrule_object(tzinfo)
+        key = (self.pk, self.updated_on, self.rule_id, self.start,
+               getattr(tzinfo, 'zone', tzinfo))
+        rule = rrule_cache.get(key)
+        if rule is None:
+            rule = self._build_rrule_object(tzinfo)
+            rrule_cache.set(key, rule)
+        return rule
+
+    def _build_rrule_object(self, tzinfo):
         if self.rule is not None:
             params, empty = self._event_params()
             frequency = self.rule.rrule_frequency()
@@ -143,15 +344,17 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
                 dtstart = tzinfo.normalize(self.start).replace(tzinfo=None)
 
             if not empty:
+                rule = FixedIntervalRule.from_params(self.rule.frequency, dtstart, params)
+                if rule is not None:
+                    return rule
                 return rrule.rrule(frequency, dtstart=dtstart, **params)
             else:
-                year = self.start.year - 1
-                return rrule.rrule(frequency, dtstart=dtstart, until=self.start.replace(year=year))
+                return rrule.rrule(frequency, dtstart=dtstart, until=dtstart - datetime.timedelta(days=1))
 
     def _create_occurrence(self, start, end=None):
         if end is None:
             end = start + (self.end - self.start)
-        return Occurrence(event=self, start=start, end=end, original_start=start, original_end=end)
+        return OccurrenceView(self, start, end)
 
     def get_occurrence(self, date):
         use_naive = timezone.is_naive(date)
@@ -172,11 +375,17 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             except Occurrence.DoesNotExist:
                 if use_naive:
                     next_occurrence = timezone.make_naive(next_occurrence, tzinfo)
-                return self._create_occurrence(next_occurrence)
+                end = next_occurrence + (self.end - self.start)
+                return Occurrence(event=self, start=next_occurrence, end=end,
+                                  original_start=next_occurrence, original_end=end)
 
     def _get_occurrence_list(self, start, end):
         """
         returns a list of occurrences for this event from start to end.
+
+        An occurrence belongs to the list when it ends at or after ``start``
+        and starts before ``end`` (and, for recurring events, no later than
+        ``end_recurring_period``).
         """
         difference = (self.end - self.start)
         if self.rule is not None:
@@ -187,26 +396,29 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             if start.tzinfo:
                 tzinfo = start.tzinfo
 
-            occurrences = []
+            last_start = end
             if self.end_recurring_period and self.end_recurring_period < end:
-                end = self.end_recurring_period
+                last_start = self.end_recurring_period
 
             rule = self.get_rrule_object(tzinfo)
-            start = (start - difference).replace(tzinfo=None)
-            end = (end - difference).replace(tzinfo=None)
-            o_starts = []
-            o_starts.append(rule.between(start, end, inc=True))
-            o_starts.append(rule.between(start - (difference // 2), end - (difference // 2), inc=True))
-            o_starts.append(rule.between(start - difference, end - difference, inc=True))
-            for occ in o_starts:
-                for o_start in occ:
-                    o_start = tzinfo.localize(o_start)
-                    if use_naive:
-                        o_start = timezone.make_naive(o_start, tzinfo)
-                    o_end = o_start + difference
-                    occurrence = self._create_occurrence(o_start, o_end)
-                    if occurrence not in occurrences:
-                        occurrences.append(occurrence)
+            # The rule works on wall clock times, so its window is padded to
+            # absorb DST transitions; the exact bounds are checked below.
+            occurrences = []
+            seen = set()
+            o_starts = localize_all(tzinfo, rule.between(
+                self._wall_clock(start - difference, tzinfo) - WALL_CLOCK_SLACK,
+                self._wall_clock(last_start, tzinfo) + WALL_CLOCK_SLACK,
+                inc=True))
+            for o_start in o_starts:
+                if use_naive:
+                    o_start = timezone.make_naive(o_start, tzinfo)
+                if o_start >= end or o_start > last_start:
+                    break
+                o_end = o_start + difference
+                if o_end < start or o_start in seen:
+                    continue
+                seen.add(o_start)
+                occurrences.append(self._create_occurrence(o_start, o_end))
             return occurrences
         else:
             # check if event is in the period
@@ -215,6 +427,12 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             else:
                 return []
 
+    @staticmethod
+    def _wall_clock(date, tzinfo):
+        if timezone.is_naive(date):
+            return date
+        return date.astimezone(tzinfo).replace(tzinfo=None)
+
     def _occurrences_after_generator(self, after=None):
         """
         returns a generator that produces unpresisted occurrences after the
@@ -230,14 +448,12 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         if rule is None:
             if self.end > after:
                 yield self._create_occurrence(self.start, self.end)
-            raise StopIteration
-        date_iter = iter(rule)
+            return
         difference = self.end - self.start
-        while True:
-            o_start = next(date_iter)
+        for o_start in rule:
             o_start = tzinfo.localize(o_start)
             if self.end_recurring_period and o_start > self.end_recurring_period:
-                raise StopIteration
+                return
             o_end = o_start + difference
             if o_end > after:
                 yield self._create_occurrence(o_start, o_end)
@@ -249,7 +465,9 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         """
         if after is None:
             after = timezone.now()
-        occ_replacer = OccurrenceReplacer(self.occurrence_set.all())
+        # the generated occurrences end after ``after``, and so do the
+        # original slots of the persisted occurrences replacing them
+        occ_replacer = OccurrenceReplacer(self.occurrence_set.filter(original_end__gt=after))
         generator = self._occurrences_after_generator(after)
         trickies = list(self.occurrence_set.filter(original_start__lte=after, start__gte=after).order_by('start'))
         while True:
@@ -260,7 +478,7 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             if (len(trickies) > 0 and (nxt is None or nxt.start > trickies[0].start)):
                 yield trickies.pop(0)
             if (nxt is None):
-                raise StopIteration
+                return
             yield occ_replacer.get_occurrence(nxt)
 
     @property
@@ -295,7 +513,8 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             if (param in param_dict_order and param_dict_order[param] > freq_order and
                     param in start_params):
                 sp = start_params[param]
-                if sp == rule_params[param] or sp in rule_params[param]:
+                value = rule_params[param]
+                if sp == value or (isinstance(value, list) and sp in value):
                     event_params[param] = [sp]
                 else:
                     event_params = {'count' : 0}
@@ -317,32 +536,67 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
 
     @property
     def effective_start(self):
-        if self.pk and self.end_recurring_period:
-            occ_generator = self._occurrences_after_generator(self.start)
-            try:
-                return next(occ_generator).start
-            except StopIteration:
-                pass
-        elif self.pk:
-            return self.start
-        return None
+        if self.pk is None:
+            return None
+        return self._get_effective_range()[0]
 
     @property
     def effective_end(self):
-        if self.pk and self.end_recurring_period:
-            params, empty = self.event_params
-            if empty or not self.effective_start:
-                return None
-            elif self.end_recurring_period:
-                occ = None
-                occ_generator = self._occurrences_after_generator(self.start)
-                #occ_generator = iter(self.get_rrule_object())
-                for occ in occ_generator:
-                    pass
-                return occ.end
-        elif self.pk:
-            return datetime.max
-        return None
+        if self.pk is None:
+            return None
+        start, end = self._get_effective_range()
+        if start is not None and end is None:
+            return datetime.datetime.max
+        return end
+
+    def _get_effective_range(self):
+        if not hasattr(self, '_effective_range'):
+            self._effective_range = self._compute_effective_range()
+        return self._effective_range
+
+    def _compute_effective_range(self):
+        """
+        Returns the start of the first occurrence and the end of the last one
+        up to ``end_recurring_period``, or ``(None, None)`` if there are none.
+        The end is None for events without an ``end_recurring_period``.
+        """
+        if not self.end_recurring_period:
+            return self.start, None
+        difference = self.end - self.start
+        if self.rule is None:
+            if difference > datetime.timedelta(0):
+                return self.start, self.end
+            return None, None
+        tzinfo = timezone.utc
+        # loaddata parses fixed offsets, which recur the same in UTC
+        if timezone.is_aware(self.start) and hasattr(self.start.tzinfo, 'localize'):
+            tzinfo = self.start.tzinfo
+
+        def localize(date):
+            if timezone.is_naive(self.start):
+                return date
+            return tzinfo.localize(date)
+
+        rule = self.get_rrule_object(tzinfo)
+        first = rule.after(self._wall_clock(self.start - difference, tzinfo) - WALL_CLOCK_SLACK, inc=True)
+        while first is not None and localize(first) + difference <= self.start:
+            first = rule.after(first)
+        if first is None or localize(first) > self.end_recurring_period:
+            return None, None
+        last = rule.before(self._wall_clock(self.end_recurring_period, tzinfo) + WALL_CLOCK_SLACK, inc=True)
+        while localize(last) > self.end_recurring_period:
+            last = rule.before(last)
+        return localize(first), localize(last) + difference
+
+    def _compute_occurrence_bounds(self):
+        """
+        Returns the values of ``first_occurrence_start`` and
+        ``last_occurrence_end``: the effective range, except that one time
+        only events always end.
+        """
+        if self.rule is None and not self.end_recurring_period:
+            return self.start, self.end
+        return self._compute_effective_range()
 
 
 class EventRelationManager(models.Manager):
@@ -498,30 +752,68 @@ class EventRelation(with_metaclass(ModelBase, *get_model_bases())):
         return '%s(%s)-%s' % (self.event.title, self.distinction, self.content_object)
 
 
+class EventFallbackMixin(object):
+    """
+    Mixin for the fields of Occurrence whose value of None reads as the
+    attribute of the event.  The value is kept in ``_<name>`` and ``<name>``
+    is a property falling back to the event, so that the event is only
+    fetched when such a value is read, and deferring the field defers the
+    stored value only.  The column, the migrations and the serialized or
+    form value are those of the plain field.
+    """
+
+    def get_attname(self):
+        return '_%s' % self.name
+
+    def get_attname_column(self):
+        return self.get_attname(), self.db_column or self.name
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(EventFallbackMixin, self).contribute_to_class(cls, name, *args, **kwargs)
+        attname = self.attname
+
+        def get_value(instance):
+            value = getattr(instance, attname)
+            if value is None and instance.event_id:
+                return getattr(instance.event, name)
+            return value
+
+        def set_value(instance, value):
+            setattr(instance, attname, value)
+
+        setattr(cls, name, property(get_value, set_value))
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(EventFallbackMixin, self).deconstruct()
+        return name, self.plain_path, args, kwargs
+
+
+class EventFallbackCharField(EventFallbackMixin, models.CharField):
+    plain_path = 'django.db.models.CharField'
+
+
+class EventFallbackTextField(EventFallbackMixin, models.TextField):
+    plain_path = 'django.db.models.TextField'
+
+
 @python_2_unicode_compatible
 class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
     event = models.ForeignKey(Event, verbose_name=_("event"))
-    title = models.CharField(_("title"), max_length=255, blank=True, null=True)
-    description = models.TextField(_("description"), blank=True, null=True)
+    title = EventFallbackCharField(_("title"), max_length=255, blank=True, null=True)
+    description = EventFallbackTextField(_("description"), blank=True, null=True)
     start = models.DateTimeField(_("start"))
     end = models.DateTimeField(_("end"))
     cancelled = models.BooleanField(_("cancelled"), default=False)
     original_start = models.DateTimeField(_("original start"))
     original_end = models.DateTimeField(_("original end"))
     created_on = models.DateTimeField(_("created on"), auto_now_add=True)
-    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
+    updated_on = models.DateTimeField(_("updated on"), auto_now=True, db_index=True)
 
     class Meta(object):
         verbose_name = _("occurrence")
         verbose_name_plural = _("occurrences")
         app_label = 'schedule'
-
-    def __init__(self, *args, **kwargs):
-        super(Occurrence, self).__init__(*args, **kwargs)
-        if self.title is None and self.event_id:
-            self.title = self.event.title
-        if self.description is None and self.event_id:
-            self.description = self.event.description
+        index_together = (('start', 'end'),)
 
     def moved(self):
         return self.original_start != self.start or self.original_end != self.end
@@ -556,44 +848,20 @@ class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
     def get_absolute_url(self):
         if self.pk is not None:
             return reverse('occurrence', kwargs={'occurrence_id': self.pk,
-                                                 'event_id': self.event.id})
-        return reverse('occurrence_by_date', kwargs={
-            'event_id': self.event.id,
-            'year': self.start.year,
-            'month': self.start.month,
-            'day': self.start.day,
-            'hour': self.start.hour,
-            'minute': self.start.minute,
-            'second': self.start.second,
-        })
+                                                 'event_id': self.event_id})
+        return _occurrence_by_date_url('occurrence_by_date', self)
 
     def get_cancel_url(self):
         if self.pk is not None:
             return reverse('cancel_occurrence', kwargs={'occurrence_id': self.pk,
-                                                        'event_id': self.event.id})
-        return reverse('cancel_occurrence_by_date', kwargs={
-            'event_id': self.event.id,
-            'year': self.start.year,
-            'month': self.start.month,
-            'day': self.start.day,
-            'hour': self.start.hour,
-            'minute': self.start.minute,
-            'second': self.start.second,
-        })
+                                                        'event_id': self.event_id})
+        return _occurrence_by_date_url('cancel_occurrence_by_date', self)
 
     def get_edit_url(self):
         if self.pk is not None:
             return reverse('edit_occurrence', kwargs={'occurrence_id': self.pk,
-                                                      'event_id': self.event.id})
-        return reverse('edit_occurrence_by_date', kwargs={
-            'event_id': self.event.id,
-            'year': self.start.year,
-            'month': self.start.month,
-            'day': self.start.day,
-            'hour': self.start.hour,
-            'minute': self.start.minute,
-            'second': self.start.second,
-        })
+                                                      'event_id': self.event_id})
+        return _occurrence_by_date_url('edit_occurrence_by_date', self)
 
     def __str__(self):
         return ugettext("%(start)s to %(end)s") % {
@@ -605,5 +873,133 @@ class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
         return self.end < other.end
 
     def __eq__(self, other):
-        return (isinstance(other, Occurrence) and
+        return (isinstance(other, (Occurrence, OccurrenceView)) and
             self.original_start == other.original_start and self.original_end == other.original_end)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def _occurrence_by_date_url(name, occurrence):
+    return reverse(name, kwargs={
+        'event_id': occurrence.event_id,
+        'year': occurrence.start.year,
+        'month': occurrence.start.month,
+        'day': occurrence.start.day,
+        'hour': occurrence.start.hour,
+        'minute': occurrence.start.minute,
+        'second': occurrence.start.second,
+    })
+
+
+@python_2_unicode_compatible
+class OccurrenceView(object):
+    """
+    A read only occurrence generated from the rule of an event, which has not
+    been persisted.  It offers the same attributes and urls as Occurrence, at
+    a fraction of the cost of building a model instance.
+
+    ``save``, ``move``, ``cancel`` and ``uncancel`` promote it to an
+    Occurrence (the persisted counterpart, if one was saved meanwhile) and
+    return that model instance; the view itself never changes.
+    """
+    __slots__ = ('_event', '_start', '_end')
+
+    id = pk = None
+    cancelled = False
+    moved = False
+
+    def __init__(self, event, start, end):
+        self._event = event
+        self._start = start
+        self._end = end
+
+    event = property(lambda self: self._event)
+    start = original_start = property(lambda self: self._start)
+    end = original_end = property(lambda self: self._end)
+
+    @property
+    def event_id(self):
+        return self._event.id
+
+    @property
+    def title(self):
+        return self._event.title
+
+    @property
+    def description(self):
+        return self._event.description
+
+    @property
+    def seconds(self):
+        return (self._end - self._start).total_seconds()
+
+    @property
+    def minutes(self):
+        return float(self.seconds) / 60
+
+    @property
+    def hours(self):
+        return float(self.seconds) / 3600
+
+    def to_occurrence(self):
+        """
+        Returns the persisted Occurrence of this slot, or a new unsaved one.
+        """
+        try:
+            return Occurrence.objects.get(event=self._event, original_start=self._start,
+                                          original_end=self._end)
+        except Occurrence.DoesNotExist:
+            return Occurrence(event=self._event, start=self._start, end=self._end,
+                              original_start=self._start, original_end=self._end)
+
+    def save(self):
+        occurrence = self.to_occurrence()
+        occurrence.save()
+        return occurrence
+
+    def move(self, new_start, new_end):
+        occurrence = self.to_occurrence()
+        occurrence.move(new_start, new_end)
+        return occurrence
+
+    def cancel(self):
+        occurrence = self.to_occurrence()
+        occurrence.cancel()
+        return occurrence
+
+    def uncancel(self):
+        occurrence = self.to_occurrence()
+        occurrence.uncancel()
+        return occurrence
+
+    def get_absolute_url(self):
+        return _occurrence_by_date_url('occurrence_by_date', self)
+
+    def get_cancel_url(self):
+        return _occurrence_by_date_url('cancel_occurrence_by_date', self)
+
+    def get_edit_url(self):
+        return _occurrence_by_date_url('edit_occurrence_by_date', self)
+
+    def __str__(self):
+        return ugettext("%(start)s to %(end)s") % {
+            'start': date(self._start, django_settings.DATE_FORMAT),
+            'end': date(self._end, django_settings.DATE_FORMAT)
+        }
+
+    def __repr__(self):
+        return '<OccurrenceView: %s>' % self
+
+    def __lt__(self, other):
+        return self._end < other.end
+
+    def __eq__(self, other):
+        return (isinstance(other, (Occurrence, OccurrenceView)) and
+            self._start == other.original_start and self._end == other.original_end)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._start, self._end))
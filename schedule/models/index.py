@@ -0,0 +1,147 @@
+from __future__ import unicode_literals
+from django.utils.six import with_metaclass
+import datetime
+import pytz
+
+from django.conf import settings as django_settings
+from django.db import models, transaction
+from django.db.models.base import ModelBase
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from schedule.conf import settings
+from schedule.models.calendars import Calendar
+from schedule.models.events import Event, Occurrence, OccurrenceView
+from schedule.utils import get_model_bases
+
+
+class OccurrenceIndexManager(models.Manager):
+    def window(self):
+        """
+        Returns the materialized OccurrenceIndexWindow, or None while the
+        index is disabled or has not been built yet.
+        """
+        if not settings.OCCURRENCE_INDEX:
+            return None
+        return OccurrenceIndexWindow.objects.order_by('-pk').first()
+
+    def index_event(self, event, window=None):
+        """
+        Replaces the rows of ``event`` with its occurrences inside the
+        materialized window.
+        """
+        if window is None:
+            window = self.window()
+        if window is None:
+            return
+        with transaction.atomic():
+            self.filter(event=event).delete()
+            tzinfo = window.tzinfo
+            start = window.start.astimezone(tzinfo) if tzinfo else window.start
+            end = window.end.astimezone(tzinfo) if tzinfo else window.end
+            self.bulk_create([
+                self.model(calendar_id=event.calendar_id, event=event, start=occurrence.start,
+                           end=occurrence.end, original_start=occurrence.original_start,
+                           original_end=occurrence.original_end, occurrence_id=occurrence.pk,
+                           cancelled=occurrence.cancelled)
+                for occurrence in event.get_occurrences(start, end)
+            ])
+
+    def rebuild(self, now=None):
+        """
+        Moves the window to ``OCCURRENCE_INDEX_HORIZON`` days around ``now``
+        and materializes every event again.
+        """
+        if not settings.OCCURRENCE_INDEX:
+            return None
+        if now is None:
+            now = timezone.now()
+        horizon = datetime.timedelta(days=settings.OCCURRENCE_INDEX_HORIZON)
+        tzinfo = timezone.get_default_timezone() if django_settings.USE_TZ else None
+        today = now.astimezone(tzinfo).date() if tzinfo else now.date()
+        start = datetime.datetime.combine(today - horizon, datetime.time.min)
+        end = datetime.datetime.combine(today + horizon, datetime.time.min)
+        if tzinfo is not None:
+            start, end = tzinfo.localize(start), tzinfo.localize(end)
+        with transaction.atomic():
+            OccurrenceIndexWindow.objects.all().delete()
+            self.all().delete()
+            window = OccurrenceIndexWindow.objects.create(
+                start=start, end=end, tzname=getattr(tzinfo, 'zone', ''))
+            for event in Event.objects.select_related('rule'):
+                self.index_event(event, window)
+        return window
+
+    def occurrences_between(self, events, start, end):
+        """
+        Returns the sorted occurrences of ``events`` from ``start`` to ``end``
+        in one query, like Event.get_occurrences would, or None if the window
+        does not cover the range and the occurrences have to be expanded.
+        """
+        if isinstance(events, (list, tuple)) and any(event.pk is None for event in events):
+            return None
+        window = self.window()
+        if window is None or not window.covers(start, end):
+            return None
+        rows = self.filter(event__in=events, start__lt=end, end__gte=start)
+        return sorted(row.as_occurrence() for row in rows.select_related('event', 'occurrence'))
+
+
+class OccurrenceIndexWindow(with_metaclass(ModelBase, *get_model_bases())):
+    """
+    The range of time materialized by OccurrenceIndex, and the timezone the
+    rules were expanded in.
+    """
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    tzname = models.CharField(_("timezone"), max_length=63, blank=True)
+    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
+
+    class Meta(object):
+        verbose_name = _("occurrence index window")
+        verbose_name_plural = _("occurrence index windows")
+        app_label = 'schedule'
+
+    @property
+    def tzinfo(self):
+        if not self.tzname:
+            return None
+        return pytz.timezone(self.tzname)
+
+    def covers(self, start, end):
+        # aware datetimes compare as instants whatever their timezone, the
+        # rules stay expanded in the timezone of the window
+        if timezone.is_aware(start) != bool(self.tzname):
+            return False
+        return self.start <= start and end <= self.end
+
+
+class OccurrenceIndex(with_metaclass(ModelBase, *get_model_bases())):
+    """
+    One row per occurrence of every event inside the OccurrenceIndexWindow,
+    persisted or not.  Enabled by the OCCURRENCE_INDEX setting; rows are
+    refreshed whenever an event, its rule or one of its occurrences is saved.
+    """
+    calendar = models.ForeignKey(Calendar, null=True, blank=True, verbose_name=_("calendar"))
+    event = models.ForeignKey(Event, verbose_name=_("event"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    original_start = models.DateTimeField(_("original start"))
+    original_end = models.DateTimeField(_("original end"))
+    occurrence = models.ForeignKey(Occurrence, null=True, blank=True, verbose_name=_("occurrence"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+
+    objects = OccurrenceIndexManager()
+
+    class Meta(object):
+        verbose_name = _("occurrence index")
+        verbose_name_plural = _("occurrence index")
+        app_label = 'schedule'
+        index_together = (('calendar', 'start', 'end'), ('event', 'start', 'end'))
+
+    def as_occurrence(self):
+        if self.occurrence_id is None:
+            return OccurrenceView(self.event, self.start, self.end)
+        occurrence = self.occurrence
+        occurrence.event = self.event
+        return occurrence
@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 from django.utils.six.moves.builtins import str
+from django.utils.six.moves import range
 from django.utils.six import with_metaclass
 from dateutil.rrule import DAILY, MONTHLY, WEEKLY, YEARLY, HOURLY, MINUTELY, SECONDLY
+import datetime
 
 from django.db import models
 from django.db.models.base import ModelBase
@@ -18,6 +20,16 @@ freqs = (("YEARLY", _("Yearly")),
          ("MINUTELY", _("Minutely")),
          ("SECONDLY", _("Secondly")))
 
+# frequencies whose occurrences are a fixed time apart when the rule has no
+# by* params, see FixedIntervalRule
+fixed_steps = {
+    'WEEKLY': datetime.timedelta(weeks=1),
+    'DAILY': datetime.timedelta(days=1),
+    'HOURLY': datetime.timedelta(hours=1),
+    'MINUTELY': datetime.timedelta(minutes=1),
+    'SECONDLY': datetime.timedelta(seconds=1),
+}
+
 
 @python_2_unicode_compatible
 class Rule(with_metaclass(ModelBase, *get_model_bases())):
@@ -93,3 +105,89 @@ class Rule(with_metaclass(ModelBase, *get_model_bases())):
     def __str__(self):
         """Human readable string for Rule"""
         return 'Rule %s params %s' % (self.name, self.params)
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class FixedIntervalRule(object):
+    """
+    The recurrence of a rule without by* params, whose starts are simply
+    ``dtstart + k * step``.  It answers the calls events make on a dateutil
+    rrule (``between``, ``after``, ``before``, iteration and indexing) with
+    the same results, computed in closed form instead of walking the rule.
+    Like rrule it works on naive wall clock times.
+    """
+
+    def __init__(self, dtstart, step, count=None):
+        self._dtstart = dtstart.replace(microsecond=0)
+        self._step = step
+        self._step_us = _microseconds(step)
+        # rrule stops at the last date a datetime can hold
+        last = _microseconds(datetime.datetime.max - self._dtstart) // self._step_us + 1
+        self._count = last if count is None else max(0, min(count, last))
+
+    @classmethod
+    def from_params(cls, frequency, dtstart, params):
+        """
+        Returns the FixedIntervalRule equivalent to
+        ``rrule(frequency, dtstart=dtstart, **params)``, or None if there is
+        none.
+        """
+        if frequency not in fixed_steps or not set(params) <= set(['interval', 'count']):
+            return None
+        interval = params.get('interval', 1)
+        count = params.get('count')
+        if not isinstance(interval, int) or interval < 1:
+            return None
+        if count is not None and not isinstance(count, int):
+            return None
+        return cls(dtstart, fixed_steps[frequency] * interval, count)
+
+    def _first_index(self, dt, inc):
+        quotient, remainder = divmod(_microseconds(dt - self._dtstart), self._step_us)
+        if remainder or not inc:
+            quotient += 1
+        return max(quotient, 0)
+
+    def _last_index(self, dt, inc):
+        quotient, remainder = divmod(_microseconds(dt - self._dtstart), self._step_us)
+        if not remainder and not inc:
+            quotient -= 1
+        return min(quotient, self._count - 1)
+
+    def _start(self, index):
+        return self._dtstart + self._step * index
+
+    def between(self, after, before, inc=False):
+        return [self._start(index) for index in
+                range(self._first_index(after, inc), self._last_index(before, inc) + 1)]
+
+    def after(self, dt, inc=False):
+        index = self._first_index(dt, inc)
+        if index < self._count:
+            return self._start(index)
+        return None
+
+    def before(self, dt, inc=False):
+        index = self._last_index(dt, inc)
+        if index >= 0:
+            return self._start(index)
+        return None
+
+    def count(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._start(index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._start(index) for index in range(*item.indices(self._count))]
+        if item < 0:
+            item += self._count
+        if not 0 <= item < self._count:
+            raise IndexError(item)
+        return self._start(item)
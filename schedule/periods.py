@@ -1,18 +1,55 @@
 from __future__ import unicode_literals
-from django.utils.six.moves.builtins import range
+from django.utils.six.moves.builtins import range, zip
+from bisect import bisect_left, bisect_right
+import copy
 import pytz
 import datetime
 import calendar as standardlib_calendar
 
 from django.conf import settings
+from django.db.models import Q
+from django.db.models.query import QuerySet
 from django.utils.translation import ugettext
 from django.utils.encoding import python_2_unicode_compatible
 from django.template.defaultfilters import date as date_filter
 from django.utils.dates import WEEKDAYS, WEEKDAYS_ABBR
-from schedule.conf.settings import SHOW_CANCELLED_OCCURRENCES
-from schedule.models import Occurrence
+from schedule import cache
+from schedule.conf.settings import SHOW_CANCELLED_OCCURRENCES, EXPANSION_CACHE_SIZE
+from schedule.models import Event, Occurrence, OccurrenceIndex, OccurrenceView
+from schedule.utils import LRUCache
 from django.utils import timezone
 
+# occurrences of recently expanded windows, see PeriodContext.get_occurrences
+expansion_cache = LRUCache(EXPANSION_CACHE_SIZE)
+# the number of windows kept for the same events, timezone and data version
+EXPANSION_WINDOWS = 4
+
+
+def _copy_instance(instance):
+    clone = copy.copy(instance)
+    clone._state = copy.copy(instance._state)
+    return clone
+
+
+def copy_occurrences(occurrences):
+    """
+    Returns copies of ``occurrences`` and of their events, so that the
+    callers never share the instances kept in ``expansion_cache``.
+    """
+    events = {}
+    copies = []
+    for occurrence in occurrences:
+        event = events.get(id(occurrence.event))
+        if event is None:
+            event = events[id(occurrence.event)] = _copy_instance(occurrence.event)
+        if isinstance(occurrence, OccurrenceView):
+            copies.append(OccurrenceView(event, occurrence.start, occurrence.end))
+        else:
+            occurrence = _copy_instance(occurrence)
+            occurrence.event = event
+            copies.append(occurrence)
+    return copies
+
 weekday_names = []
 weekday_abbrs = []
 
@@ -30,13 +67,208 @@ else:
         weekday_abbrs.append(WEEKDAYS_ABBR[i])
 
 
+class OccurrencePool(object):
+    """
+    The occurrences of a period, indexed so that its sub periods find theirs
+    in O(log n + k).  Occurrences are grouped by the order of magnitude of
+    their duration; an occurrence overlapping a range starts between the
+    range start minus the longest duration of its group and the range end,
+    which bisect finds in the sorted starts of the group.
+    """
+
+    def __init__(self, occurrences):
+        self.occurrences = occurrences
+        groups = {}
+        for index, occurrence in enumerate(occurrences):
+            seconds = int((occurrence.end - occurrence.start).total_seconds())
+            groups.setdefault(max(seconds, 0).bit_length(), []).append((occurrence.start, index))
+        self._groups = []
+        for members in groups.values():
+            members.sort()
+            indexes = [index for start, index in members]
+            longest = max(occurrences[index].end - occurrences[index].start for index in indexes)
+            self._groups.append(([start for start, index in members], indexes, longest))
+
+    def between(self, start, end):
+        """
+        Returns the occurrences starting at or before ``end`` and ending at or
+        after ``start``, in the order of the pool.
+        """
+        found = []
+        for starts, indexes, longest in self._groups:
+            for index in indexes[bisect_left(starts, start - longest):bisect_right(starts, end)]:
+                if self.occurrences[index].end >= start:
+                    found.append(index)
+        found.sort()
+        return [self.occurrences[index] for index in found]
+
+
+class TimeSlot(object):
+    """
+    A slice of a period, as listed by Period.get_time_slots; ``occurrences``
+    holds the occurrences of the period overlapping it.
+    """
+
+    def __init__(self, start, end, occurrences=None):
+        self.start = start
+        self.end = end
+        self.occurrences = occurrences if occurrences is not None else []
+
+    def get_occurrences(self):
+        return self.occurrences
+
+    def has_occurrences(self):
+        return bool(self.occurrences)
+
+
+class PeriodContext(object):
+    """
+    The state shared by a period and every sub period created from it: the
+    events, the timezone, the persisted occurrences of the root range, which
+    are fetched once, and the occurrence pool of the root period.
+    ``queries`` counts the lookups made through the context, one for the
+    persisted occurrences and one for the occurrences of each range, so the
+    cost of rendering a period tree can be asserted, or logged outside of
+    tests.
+    """
+
+    def __init__(self, events, start, end, tzinfo=None, persisted_occurrences=None):
+        self.events = events
+        self.start = start
+        self.end = end
+        self.tzinfo = tzinfo
+        self.queries = 0
+        self.occurrence_pool = None
+        # occurrence counts of days, keyed by their utc start and end
+        self.day_occupancy = {}
+        self._occupancy_ranges = []
+        self._persisted_occurrences = persisted_occurrences
+
+    def get_persisted_occurrences(self):
+        """
+        Returns the persisted occurrences of the events which are in the
+        range of the context, or replace an occurrence of that range.
+        """
+        if self._persisted_occurrences is None:
+            events = self.events
+            if not isinstance(events, QuerySet):
+                events = [event.pk for event in events if event.pk is not None]
+            if isinstance(events, QuerySet) or events:
+                self.queries += 1
+                self._persisted_occurrences = list(Occurrence.objects.filter(
+                    Q(start__lt=self.end, end__gte=self.start) |
+                    Q(original_start__lt=self.end, original_end__gte=self.start),
+                    event__in=events))
+            else:
+                self._persisted_occurrences = []
+        return self._persisted_occurrences
+
+    def count_day_occurrences(self, period):
+        """
+        Fills ``day_occupancy`` for the days of ``period`` with a single sweep
+        over its occurrences, counting them like Period.has_occurrences would.
+        """
+        for start, end in self._occupancy_ranges:
+            if start <= period.utc_start and period.utc_end <= end:
+                return
+        days = []
+        day = Day(self.events, period.start, tzinfo=period.tzinfo, context=self)
+        while day.utc_start < period.utc_end:
+            days.append((day.utc_start, day.utc_end))
+            day = Day(self.events, day.end, tzinfo=period.tzinfo, context=self)
+        ends = [end for start, end in days]
+        counts = [0] * len(days)
+        for occurrence in period.occurrences:
+            if occurrence.cancelled and not SHOW_CANCELLED_OCCURRENCES:
+                continue
+            index = bisect_left(ends, occurrence.start)
+            while index < len(days) and days[index][0] <= occurrence.end:
+                counts[index] += 1
+                index += 1
+        self.day_occupancy.update(zip(days, counts))
+        self._occupancy_ranges.append((period.utc_start, period.utc_end))
+
+    def get_occurrences(self, start, end, window=None):
+        """
+        Returns the sorted occurrences of the events from ``start`` to
+        ``end``, from the occurrence index if it covers the range.  Otherwise
+        they are expanded and kept in the OCCURRENCE_CACHE.  While
+        ``expansion_cache`` is enabled in front of it, the occurrences of
+        ``window``, a range around them, are expanded instead, so that the
+        neighbouring periods are found there.
+        """
+        self.queries += 1
+        occurrences = OccurrenceIndex.objects.occurrences_between(self.events, start, end)
+        if occurrences is not None:
+            return occurrences
+        versions = self._get_calendar_versions()
+        key = self._get_expansion_key(start, versions)
+        if window is None or key is None:
+            # only expansion_cache serves the neighbours from the window
+            window = start, end
+        if key is not None:
+            windows = expansion_cache.get(key, [])
+            for window_start, window_end, expanded in windows:
+                if window_start <= start and end <= window_end:
+                    break
+            else:
+                expanded = cache.occurrences_between(self.events, window[0], window[1],
+                                                     [calendar_id for calendar_id, version in versions])
+                windows = windows[1 - EXPANSION_WINDOWS:] + [(window[0], window[1], expanded)]
+                expansion_cache.set(key, windows)
+            return copy_occurrences(
+                occurrence for occurrence in expanded if self._occurs_between(occurrence, start, end))
+        expanded = cache.occurrences_between(self.events, window[0], window[1])
+        if expanded is not None:
+            return [occurrence for occurrence in expanded if self._occurs_between(occurrence, start, end)]
+        persisted_occurrences = None
+        if self.start <= start and end <= self.end:
+            persisted_occurrences = self.get_persisted_occurrences()
+        return Event.objects.occurrences_between(self.events, start, end, persisted_occurrences)
+
+    def _get_calendar_versions(self):
+        if expansion_cache.maxsize <= 0 or not isinstance(self.events, QuerySet):
+            return None
+        return cache.get_versions(self.events)
+
+    def _get_expansion_key(self, start, versions):
+        if versions is None:
+            return None
+        try:
+            sql = str(self.events.query)
+        except Exception:
+            # empty querysets have no SQL
+            return None
+        return sql, getattr(start.tzinfo, 'zone', None), tuple(versions)
+
+    @staticmethod
+    def _occurs_between(occurrence, start, end):
+        """
+        Tells whether Event.get_occurrences(start, end) would return
+        ``occurrence``, which was expanded for a range around it.
+        """
+        recurring = occurrence.event.rule_id is not None
+        if occurrence.start >= end or occurrence.end < start:
+            return False
+        if occurrence.pk is None:
+            return recurring or occurrence.end > start
+        if not occurrence.cancelled:
+            return True
+        # cancelled occurrences only show up in place of their original
+        return occurrence.original_start < end and (
+            occurrence.original_end >= start if recurring else occurrence.original_end > start)
+
+
 class Period(object):
     """
     This class represents a period of time. It can return a set of occurrences
     based on its events, and its time period (start and end).
     """
+    # whether a cached expansion covers the previous and next periods too
+    prefetch_neighbours = True
+
     def __init__(self, events, start, end, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, context=None):
 
         self.utc_start = self._normalize_timezone_to_utc(start, tzinfo)
 
@@ -45,8 +277,10 @@ class Period(object):
         self.events = events
         self.tzinfo = self._get_tzinfo(tzinfo)
         self.occurrence_pool = occurrence_pool
-        if parent_persisted_occurrences is not None:
-            self._persisted_occurrences = parent_persisted_occurrences
+        if context is None:
+            context = PeriodContext(events, self.start, self.end, self.tzinfo,
+                                    parent_persisted_occurrences)
+        self.context = context
 
     def _normalize_timezone_to_utc(self, point_in_time, tzinfo):
         if point_in_time.tzinfo is not None:
@@ -71,16 +305,14 @@ class Period(object):
         return tzinfo if settings.USE_TZ else None
 
     def _get_sorted_occurrences(self):
-        occurrences = []
         if hasattr(self, "occurrence_pool") and self.occurrence_pool is not None:
-            for occurrence in self.occurrence_pool:
-                if occurrence.start <= self.utc_end and occurrence.end >= self.utc_start:
-                    occurrences.append(occurrence)
-            return occurrences
-        for event in self.events:
-            event_occurrences = event.get_occurrences(self.start, self.end)
-            occurrences += event_occurrences
-        return sorted(occurrences)
+            if isinstance(self.occurrence_pool, OccurrencePool):
+                return self.occurrence_pool.between(self.utc_start, self.utc_end)
+            return [occurrence for occurrence in self.occurrence_pool
+                    if occurrence.start <= self.utc_end and occurrence.end >= self.utc_start]
+        if self.context.occurrence_pool is not None:
+            return self.context.occurrence_pool.between(self.utc_start, self.utc_end)
+        return self.context.get_occurrences(self.start, self.end, self._get_prefetch_window())
 
     def cached_get_sorted_occurrences(self):
         if hasattr(self, '_occurrences'):
@@ -91,11 +323,7 @@ class Period(object):
     occurrences = property(cached_get_sorted_occurrences)
 
     def get_persisted_occurrences(self):
-        if hasattr(self, '_persisted_occurrenes'):
-            return self._persisted_occurrences
-        else:
-            self._persisted_occurrences = Occurrence.objects.filter(event__in=self.events)
-            return self._persisted_occurrences
+        return self.context.get_persisted_occurrences()
 
     def classify_occurrence(self, occurrence):
         if occurrence.cancelled and not SHOW_CANCELLED_OCCURRENCES:
@@ -130,26 +358,97 @@ class Period(object):
         return self.occurrences
 
     def has_occurrences(self):
+        count = self.context.day_occupancy.get((self.utc_start, self.utc_end))
+        if count is not None:
+            return count > 0
         return any(self.classify_occurrence(o) for o in self.occurrences)
 
+    def occurrence_count(self):
+        count = self.context.day_occupancy.get((self.utc_start, self.utc_end))
+        if count is not None:
+            return count
+        return len([o for o in self.occurrences if self.classify_occurrence(o)])
+
     def get_time_slot(self, start, end):
         if start >= self.start and end <= self.end:
-            return Period(self.events, start, end)
+            occurrences = [occurrence for occurrence in self.occurrences
+                           if occurrence.start < end and occurrence.end >= start]
+            return Period(self.events, start, end, occurrence_pool=occurrences, context=self.context)
         return Period([], start, end)
 
+    def get_time_slots(self, start, increment, count):
+        """
+        Returns ``count`` consecutive TimeSlots of ``increment`` beginning at
+        ``start``, holding the occurrences of this period which start before
+        the end of the slot and end at or after its start.  The occurrences
+        are assigned to the slots in a single sweep.
+        """
+        slots = [TimeSlot(start + increment * i, start + increment * (i + 1)) for i in range(count)]
+        starts = [slot.start for slot in slots]
+        ends = [slot.end for slot in slots]
+        for occurrence in self.occurrences:
+            for slot in slots[bisect_right(ends, occurrence.start):bisect_right(starts, occurrence.end)]:
+                slot.occurrences.append(occurrence)
+        return slots
+
+    def get_occurrence_pool(self):
+        if not hasattr(self, '_occurrence_pool_index'):
+            self._occurrence_pool_index = OccurrencePool(self.occurrences)
+            if self.context.occurrence_pool is None and self.occurrence_pool is None:
+                self.context.occurrence_pool = self._occurrence_pool_index
+        return self._occurrence_pool_index
+
     def create_sub_period(self, cls, start=None, tzinfo=None):
         if tzinfo is None:
             tzinfo = self.tzinfo
         start = start or self.start
-        return cls(self.events, start, self.get_persisted_occurrences(), self.occurrences, tzinfo)
+        return cls(self.events, start, occurrence_pool=self.get_occurrence_pool(), tzinfo=tzinfo,
+                   context=self.context)
 
     def get_periods(self, cls, tzinfo=None):
         if tzinfo is None:
             tzinfo = self.tzinfo
-        period = self.create_sub_period(cls)
+        periods = []
+        period = self.create_sub_period(cls, self.start, tzinfo)
         while period.start < self.end:
-            yield self.create_sub_period(cls, period.start, tzinfo)
-            period = next(period)
+            periods.append(period)
+            period = self.create_sub_period(cls, period.end, tzinfo)
+        # the sub periods are consecutive, so each occurrence lands in a run
+        # of them starting with the first one ending at or after its start
+        ends = [period.utc_end for period in periods]
+        pools = [[] for period in periods]
+        for occurrence in self.occurrences:
+            index = bisect_left(ends, occurrence.start)
+            while index < len(periods) and periods[index].utc_start <= occurrence.end:
+                pools[index].append(occurrence)
+                index += 1
+        for period, pool in zip(periods, pools):
+            period.occurrence_pool = pool
+            yield period
+
+    def _get_prefetch_window(self):
+        # periods with neighbours expand them along with their own range
+        if not self.prefetch_neighbours or not hasattr(self, '_get_prev_date'):
+            return None
+        return self.prev_start(), self._get_local_range(self.end)[1]
+
+    def _get_local_range(self, date):
+        start, end = self._get_range(date)
+        if self.tzinfo is not None:
+            return start.astimezone(self.tzinfo), end.astimezone(self.tzinfo)
+        return start, end
+
+    def prev_start(self):
+        """
+        The start of the previous period, without building it.
+        """
+        return self._get_local_range(self._get_prev_date())[0]
+
+    def next_start(self):
+        """
+        The start of the next period, without building it.
+        """
+        return self._get_local_range(self.end)[0]
 
     @property
     def start(self):
@@ -166,14 +465,20 @@ class Period(object):
 
 @python_2_unicode_compatible
 class Year(Period):
-    def __init__(self, events, date=None, parent_persisted_occurrences=None, tzinfo=pytz.utc):
+    # expanding the neighbours of a year would expand three years at once
+    prefetch_neighbours = False
+
+    def __init__(self, events, date=None, parent_persisted_occurrences=None, tzinfo=pytz.utc,
+                 occurrence_pool=None, context=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_year_range(date)
-        super(Year, self).__init__(events, start, end, parent_persisted_occurrences, tzinfo=tzinfo)
+        super(Year, self).__init__(events, start, end, parent_persisted_occurrences,
+                                   occurrence_pool, tzinfo=tzinfo, context=context)
 
     def get_months(self):
+        self.context.count_day_occurrences(self)
         return self.get_periods(Month)
 
     def next_year(self):
@@ -181,10 +486,12 @@ class Year(Period):
     next = __next__ = next_year
 
     def prev_year(self):
-        start = datetime.datetime(self.start.year - 1, self.start.month, self.start.day)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return Year(self.events, self._get_prev_date(), tzinfo=self.tzinfo)
     prev = prev_year
 
+    def _get_prev_date(self):
+        return datetime.datetime(self.start.year - 1, self.start.month, self.start.day)
+
     def _get_year_range(self, year):
         # If tzinfo is not none get the local start of the year and convert it to utc.
         naive_start = datetime.datetime(year.year, datetime.datetime.min.month, datetime.datetime.min.day)
@@ -199,6 +506,7 @@ class Year(Period):
             end = local_end.astimezone(pytz.utc)
 
         return start, end
+    _get_range = _get_year_range
 
     def __str__(self):
         return self.start.year
@@ -211,18 +519,20 @@ class Month(Period):
     and day periods within the date.
     """
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, context=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_month_range(date)
         super(Month, self).__init__(events, start, end,
-                                    parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                    parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo, context=context)
 
     def get_weeks(self):
+        self.context.count_day_occurrences(self)
         return self.get_periods(Week)
 
     def get_days(self):
+        self.context.count_day_occurrences(self)
         return self.get_periods(Day)
 
     def get_day(self, daynumber):
@@ -236,10 +546,12 @@ class Month(Period):
     next = __next__ = next_month
 
     def prev_month(self):
-        start = (self.start - datetime.timedelta(days=1)).replace(day=1, tzinfo=self.tzinfo)
-        return Month(self.events, start, tzinfo=self.tzinfo)
+        return Month(self.events, self._get_prev_date(), tzinfo=self.tzinfo)
     prev = prev_month
 
+    def _get_prev_date(self):
+        return (self.start - datetime.timedelta(days=1)).replace(day=1, tzinfo=self.tzinfo)
+
     def current_year(self):
         return Year(self.events, self.start, tzinfo=self.tzinfo)
 
@@ -270,6 +582,7 @@ class Month(Period):
             end = local_end.astimezone(pytz.utc)
 
         return start, end
+    _get_range = _get_month_range
 
     def __str__(self):
         return self.name()
@@ -287,18 +600,21 @@ class Week(Period):
     The Week period that has functions for retrieving Day periods within it
     """
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, context=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_week_range(date)
         super(Week, self).__init__(events, start, end,
-                                   parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                   parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo, context=context)
 
     def prev_week(self):
-        return Week(self.events, self.start - datetime.timedelta(days=7), tzinfo=self.tzinfo)
+        return Week(self.events, self._get_prev_date(), tzinfo=self.tzinfo)
     prev = prev_week
 
+    def _get_prev_date(self):
+        return self.start - datetime.timedelta(days=7)
+
     def next_week(self):
         return Week(self.events, self.end, tzinfo=self.tzinfo)
     next = __next__ = next_week
@@ -340,6 +656,7 @@ class Week(Period):
             end = naive_end
 
         return start, end
+    _get_range = _get_week_range
 
     def __str__(self):
         date_format = 'l, %s' % settings.DATE_FORMAT
@@ -352,13 +669,13 @@ class Week(Period):
 @python_2_unicode_compatible
 class Day(Period):
     def __init__(self, events, date=None, parent_persisted_occurrences=None,
-                 occurrence_pool=None, tzinfo=pytz.utc):
+                 occurrence_pool=None, tzinfo=pytz.utc, context=None):
         self.tzinfo = self._get_tzinfo(tzinfo)
         if date is None:
             date = timezone.now()
         start, end = self._get_day_range(date)
         super(Day, self).__init__(events, start, end,
-                                  parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
+                                  parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo, context=context)
 
     def _get_day_range(self, date):
 
@@ -381,6 +698,7 @@ class Day(Period):
             end = naive_end
 
         return start, end
+    _get_range = _get_day_range
 
     def __str__(self):
         date_format = 'l, %s' % settings.DATE_FORMAT
@@ -390,9 +708,12 @@ class Day(Period):
         }
 
     def prev_day(self):
-        return Day(self.events, self.start - datetime.timedelta(days=1), tzinfo=self.tzinfo)
+        return Day(self.events, self._get_prev_date(), tzinfo=self.tzinfo)
     prev = prev_day
 
+    def _get_prev_date(self):
+        return self.start - datetime.timedelta(days=1)
+
     def next_day(self):
         return Day(self.events, self.end, tzinfo=self.tzinfo)
     next = __next__ = next_day
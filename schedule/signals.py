@@ -1,6 +1,28 @@
-from django.db.models.signals import pre_save
+import threading
+import weakref
 
-from schedule.models import Event, Calendar
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.utils import timezone
+
+from schedule.cache import bump_calendar_versions, get_cache
+from schedule.conf import settings
+from schedule.models import Event, Calendar, Rule, Occurrence, OccurrenceIndex, EventChange
+from schedule.models.events import events_changed, rrule_cache
+
+# the events each thread is deleting by id, whose cascaded occurrences must
+# not index or log them again.  The references are weak, so that an event
+# whose deletion raised is forgotten along with the instance.
+_deleting = threading.local()
+
+
+def _deleting_events():
+    if not hasattr(_deleting, 'events'):
+        _deleting.events = weakref.WeakValueDictionary()
+    return _deleting.events
+
+
+def _deleted_with_event(occurrence, **kwargs):
+    return kwargs.get('signal') is post_delete and occurrence.event_id in _deleting_events()
 
 
 def optional_calendar(sender, **kwargs):
@@ -18,4 +40,161 @@ def optional_calendar(sender, **kwargs):
         event.calendar = calendar
     return True
 
+
+def compute_event_bounds(sender, instance, **kwargs):
+    # also runs for the raw saves of loaddata, which skip Event.save
+    instance.__dict__.pop('_effective_range', None)
+    try:
+        instance.first_occurrence_start, instance.last_occurrence_end = instance._compute_occurrence_bounds()
+    except Rule.DoesNotExist:
+        # a fixture may load the rule after the event, leave them unknown
+        instance.first_occurrence_start = instance.last_occurrence_end = None
+
+
+def forget_event_rrules(sender, instance, **kwargs):
+    rrule_cache.discard(lambda key: key[0] == instance.pk)
+
+
+def forget_rule_rrules(sender, instance, **kwargs):
+    rrule_cache.discard(lambda key: key[2] == instance.pk)
+    # the events of a changed rule are changed as well, bumping updated_on
+    # lets other processes notice it through the key of their rrule_cache
+    if kwargs.get('signal') is post_save:
+        Event.objects.filter(rule=instance).update(updated_on=timezone.now())
+
+
+def update_rule_event_bounds(sender, instance, **kwargs):
+    for event in Event.objects.filter(rule=instance):
+        event.rule = instance
+        first, last = event._compute_occurrence_bounds()
+        Event.objects.filter(pk=event.pk).update(first_occurrence_start=first, last_occurrence_end=last)
+
+
+def index_event(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        OccurrenceIndex.objects.index_event(instance)
+
+
+def index_rule_events(sender, instance, **kwargs):
+    window = OccurrenceIndex.objects.window()
+    if window is not None:
+        for event in Event.objects.filter(rule=instance):
+            OccurrenceIndex.objects.index_event(event, window)
+
+
+def index_occurrence_event(sender, instance, **kwargs):
+    if kwargs.get('raw') or _deleted_with_event(instance, **kwargs):
+        return
+    window = OccurrenceIndex.objects.window()
+    if window is not None:
+        OccurrenceIndex.objects.index_event(Event.objects.get(pk=instance.event_id), window)
+
+
+def invalidate_event_calendar(sender, instance, **kwargs):
+    if get_cache() is None:
+        return
+    calendar_ids = [instance.calendar_id]
+    if kwargs.get('signal') is pre_save and instance.pk is not None:
+        # the event may leave its previous calendar
+        calendar_ids += Event.objects.filter(pk=instance.pk).values_list('calendar', flat=True)
+    bump_calendar_versions(calendar_ids)
+
+
+def invalidate_occurrence_calendar(sender, instance, **kwargs):
+    if get_cache() is not None:
+        bump_calendar_versions(Event.objects.filter(pk=instance.event_id).values_list('calendar', flat=True))
+
+
+def invalidate_rule_calendars(sender, instance, **kwargs):
+    if get_cache() is not None:
+        bump_calendar_versions(Event.objects.filter(rule=instance).values_list('calendar', flat=True))
+
+
+def invalidate_calendar(sender, instance, **kwargs):
+    bump_calendar_versions([instance.pk])
+
+
+def remember_event_calendar(sender, instance, **kwargs):
+    if settings.CHANGE_LOG and not kwargs.get('raw') and instance.pk is not None:
+        instance._previous_calendar_ids = list(
+            Event.objects.filter(pk=instance.pk).values_list('calendar', flat=True))
+
+
+def log_event_change(sender, instance, **kwargs):
+    if not settings.CHANGE_LOG or kwargs.get('raw'):
+        return
+    # an event moved to another calendar leaves the previous one
+    calendar_ids = [instance.calendar_id] + getattr(instance, '_previous_calendar_ids', [])
+    EventChange.objects.log((calendar_id, instance.pk) for calendar_id in calendar_ids)
+
+
+def log_occurrence_change(sender, instance, **kwargs):
+    if not settings.CHANGE_LOG or kwargs.get('raw') or _deleted_with_event(instance, **kwargs):
+        return
+    EventChange.objects.log(Event.objects.filter(pk=instance.event_id).values_list('calendar', 'pk'))
+
+
+def log_rule_change(sender, instance, **kwargs):
+    if settings.CHANGE_LOG:
+        EventChange.objects.log(Event.objects.filter(rule=instance).values_list('calendar', 'pk'))
+
+
+def forget_changed_rrules(sender, events, **kwargs):
+    pks = set(event.pk for event in events)
+    rrule_cache.discard(lambda key: key[0] in pks)
+
+
+def index_changed_events(sender, events, **kwargs):
+    window = OccurrenceIndex.objects.window()
+    if window is not None:
+        for event in events:
+            OccurrenceIndex.objects.index_event(event, window)
+
+
+def invalidate_changed_calendars(sender, events, **kwargs):
+    bump_calendar_versions([event.calendar_id for event in events])
+
+
+def log_changed_events(sender, events, **kwargs):
+    EventChange.objects.log((event.calendar_id, event.pk) for event in events)
+
+
+def mark_deleted_event(sender, instance, **kwargs):
+    _deleting_events()[instance.pk] = instance
+
+
+def unmark_deleted_event(sender, instance, **kwargs):
+    _deleting_events().pop(instance.pk, None)
+
 pre_save.connect(optional_calendar)
+pre_save.connect(compute_event_bounds, sender=Event)
+post_save.connect(forget_event_rrules, sender=Event)
+post_delete.connect(forget_event_rrules, sender=Event)
+post_save.connect(forget_rule_rrules, sender=Rule)
+post_delete.connect(forget_rule_rrules, sender=Rule)
+post_save.connect(update_rule_event_bounds, sender=Rule)
+post_save.connect(index_event, sender=Event)
+post_save.connect(index_rule_events, sender=Rule)
+post_save.connect(index_occurrence_event, sender=Occurrence)
+post_delete.connect(index_occurrence_event, sender=Occurrence)
+pre_delete.connect(mark_deleted_event, sender=Event)
+post_delete.connect(unmark_deleted_event, sender=Event)
+pre_save.connect(invalidate_event_calendar, sender=Event)
+post_save.connect(invalidate_event_calendar, sender=Event)
+post_delete.connect(invalidate_event_calendar, sender=Event)
+post_save.connect(invalidate_occurrence_calendar, sender=Occurrence)
+post_delete.connect(invalidate_occurrence_calendar, sender=Occurrence)
+pre_delete.connect(invalidate_rule_calendars, sender=Rule)
+post_save.connect(invalidate_rule_calendars, sender=Rule)
+post_save.connect(invalidate_calendar, sender=Calendar)
+post_delete.connect(invalidate_calendar, sender=Calendar)
+pre_save.connect(remember_event_calendar, sender=Event)
+post_save.connect(log_event_change, sender=Event)
+post_delete.connect(log_event_change, sender=Event)
+post_save.connect(log_occurrence_change, sender=Occurrence)
+post_delete.connect(log_occurrence_change, sender=Occurrence)
+post_save.connect(log_rule_change, sender=Rule)
+events_changed.connect(forget_changed_rrules)
+events_changed.connect(index_changed_events)
+events_changed.connect(invalidate_changed_calendars)
+events_changed.connect(log_changed_events)
@@ -1,5 +1,4 @@
 from __future__ import division
-from django.utils.six.moves.builtins import range
 import datetime
 from django.conf import settings
 from django import template
@@ -9,9 +8,10 @@ from django.utils.html import escape
 from django.utils import timezone
 from django.utils.six.moves.urllib.parse import urlencode
 
-from schedule.conf.settings import CHECK_EVENT_PERM_FUNC, CHECK_CALENDAR_PERM_FUNC, SCHEDULER_PREVNEXT_LIMIT_SECONDS
+from schedule.conf.settings import SCHEDULER_PREVNEXT_LIMIT_SECONDS
 from schedule.models import Calendar
 from schedule.periods import weekday_names, weekday_abbrs
+from schedule.utils import get_request_cache
 
 register = template.Library()
 
@@ -54,9 +54,10 @@ def daily_table(context, day, start=8, end=20, increment=30):
       increment - size of a time slot (in minutes)
     """
     user = context['request'].user
-    addable = CHECK_EVENT_PERM_FUNC(None, user)
+    cache = get_request_cache(context['request'])
+    addable = cache.has_permission('event', None, user)
     if 'calendar' in context:
-        addable &= CHECK_CALENDAR_PERM_FUNC(context['calendar'], user)
+        addable &= cache.has_permission('calendar', context['calendar'], user)
     context['addable'] = addable
 
     day_part = day.get_time_slot(day.start + datetime.timedelta(hours=start), day.start + datetime.timedelta(hours=end))
@@ -82,11 +83,14 @@ def options(context, occurrence):
     })
     context['view_occurrence'] = occurrence.get_absolute_url()
     user = context['request'].user
-    if CHECK_EVENT_PERM_FUNC(occurrence.event, user) and CHECK_CALENDAR_PERM_FUNC(occurrence.event.calendar, user):
+    cache = get_request_cache(context['request'])
+    event = occurrence.event
+    calendar = cache.get_calendar(event)
+    if cache.has_permission('event', event, user) and cache.has_permission('calendar', calendar, user):
         context['edit_occurrence'] = occurrence.get_edit_url()
         context['cancel_occurrence'] = occurrence.get_cancel_url()
-        context['delete_event'] = reverse('delete_event', args=(occurrence.event.id,))
-        context['edit_event'] = reverse('edit_event', args=(occurrence.event.calendar.slug, occurrence.event.id,))
+        context['delete_event'] = reverse('delete_event', args=(event.id,))
+        context['edit_event'] = reverse('edit_event', args=(calendar.slug, event.id,))
     else:
         context['edit_event'] = context['delete_event'] = ''
     return context
@@ -193,14 +197,15 @@ def querystring_for_date(date, num=6):
 @register.simple_tag
 def prev_url(target, calendar, period):
     now = timezone.now()
-    delta = now - period.prev().start
+    prev_start = period.prev_start()
+    delta = now - prev_start
     slug = calendar.slug
     if delta.total_seconds() > SCHEDULER_PREVNEXT_LIMIT_SECONDS:
         return ''
 
     return '<a href="%s%s"><span class="glyphicon glyphicon-circle-arrow-left"></span></a>' % (
         reverse(target, kwargs=dict(calendar_slug=slug)),
-        querystring_for_date(period.prev().start))
+        querystring_for_date(prev_start))
 
 
 @register.simple_tag
@@ -208,13 +213,14 @@ def next_url(target, calendar, period):
     now = timezone.now()
     slug = calendar.slug
 
-    delta = period.next().start - now
+    next_start = period.next_start()
+    delta = next_start - now
     if delta.total_seconds() > SCHEDULER_PREVNEXT_LIMIT_SECONDS:
         return ''
 
     return '<a href="%s%s"><span class="glyphicon glyphicon-circle-arrow-right"></span></a>' % (
         reverse(target, kwargs=dict(calendar_slug=slug)),
-        querystring_for_date(period.next().start))
+        querystring_for_date(next_start))
 
 
 @register.inclusion_tag("schedule/_prevnext.html")
@@ -251,13 +257,7 @@ def _cook_slots(period, increment):
         num = (period.end - period.start).seconds // tdiff.seconds
     else:
         num = 24  # hours in a day
-    s = period.start
-    slots = []
-    for i in range(num):
-        sl = period.get_time_slot(s, s + tdiff)
-        slots.append(sl)
-        s = s + tdiff
-    return slots
+    return period.get_time_slots(period.start, tdiff, num)
 
 
 @register.simple_tag
@@ -9,7 +9,8 @@ from schedule.views import (
         OccurrenceView, EditOccurrenceView, DeleteEventView,
         EditEventView, CreateEventView, OccurrencePreview,
         CreateOccurrenceView, CancelOccurrenceView, FullCalendarView, 
-        api_select_create, api_move_or_resize_by_code, api_occurrences)
+        api_select_create, api_move_or_resize_by_code, api_occurrences,
+        api_occurrences_batch, api_occurrences_delta, api_move_or_resize_batch)
 
 urlpatterns = [
     # urls for Calendars
@@ -97,10 +98,15 @@ urlpatterns = [
     url(r'^ical/calendar/(.*)/$', CalendarICalendar(), name='calendar_ical'),
     
     # api urls
+    url(r'^api/occurrences/batch/$', api_occurrences_batch, name='api_occurrences_batch'),
+    url(r'^api/occurrences/delta/$', api_occurrences_delta, name='api_occurrences_delta'),
     url(r'^api/occurrences', api_occurrences, name='api_occurences'),
     url(r'^api/move_or_resize/$', 
         api_move_or_resize_by_code,
         name='api_move_or_resize'),
+    url(r'^api/move_or_resize/batch/$',
+        api_move_or_resize_batch,
+        name='api_move_or_resize_batch'),
     url(r'^api/select_create/$', 
         api_select_create,
         name='api_select_create'),
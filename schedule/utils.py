@@ -1,9 +1,16 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from functools import wraps
+import datetime
 import heapq
+import itertools
+import threading
 from annoying.functions import get_object_or_None
 from django.http import HttpResponseRedirect, HttpResponseNotFound
 from django.conf import settings
+from django.db.models.query import QuerySet
 from django.utils import timezone
+from django.utils.encoding import force_text
 from django.utils.module_loading import import_string
 from schedule.conf.settings import (
         CHECK_EVENT_PERM_FUNC,
@@ -11,6 +18,61 @@ from schedule.conf.settings import (
         CHECK_OCCURRENCE_PERM_FUNC,
         CALENDAR_VIEW_PERM)
 
+class LRUCache(object):
+    """
+    A small thread safe mapping that forgets its least recently used entries
+    once it holds more than ``maxsize`` of them. ``hits`` and ``misses``
+    count the outcome of every ``get``.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        """
+        Removes every entry whose key satisfies ``predicate``.
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class EventListManager(object):
     """
     This class is responsible for doing functions on a list of events. It is
@@ -18,6 +80,10 @@ class EventListManager(object):
     from these events in as a group
     """
 
+    # the span of original starts whose persisted occurrences are fetched at
+    # once by occurrences_after
+    chunk = datetime.timedelta(days=28)
+
     def __init__(self, events):
         self.events = events
 
@@ -26,34 +92,70 @@ class EventListManager(object):
         It is often useful to know what the next occurrence is given a list of
         events.  This function produces a generator that yields the
         the most recent occurrence after the date ``after`` from any of the
-        events in ``self.events``
+        events in ``self.events``, sorted by start.
+
+        The events which ended before ``after`` are left out, and the rule of
+        the others is only expanded once the merge reaches their first
+        occurrence.  The persisted occurrences are fetched ``chunk`` by
+        ``chunk`` as the merge goes.
         """
-        from schedule.models import Occurrence
+        from schedule.models import Event, Occurrence
 
         if after is None:
             after = timezone.now()
-        occ_replacer = OccurrenceReplacer(
-            Occurrence.objects.filter(event__in=self.events))
-        generators = [event._occurrences_after_generator(after) for event in self.events]
-        occurrences = []
+        events = Event.objects.upcoming(self.events, after)
+        if isinstance(events, QuerySet):
+            events = list(events)
+        if not events:
+            return
+        by_pk = dict((event.pk, event) for event in events)
 
-        for generator in generators:
-            try:
-                heapq.heappush(occurrences, (next(generator), generator))
-            except StopIteration:
-                pass
+        heap = []
+        seq = itertools.count()
 
-        while True:
-            if len(occurrences) == 0:
-                raise StopIteration
+        def push(generator, event_id):
+            for occurrence in generator:
+                heapq.heappush(heap, (occurrence.start, event_id, next(seq), occurrence, generator))
+                return
 
-            generator = occurrences[0][1]
+        # the events not yet started, by the earliest start of their
+        # occurrences, popped from the end once the merge reaches them.  The
+        # events whose bounds are unknown start right away.
+        pending = []
+        for index, event in enumerate(events):
+            earliest = Event.objects.earliest_start(event)
+            if earliest is None:
+                push(event._occurrences_after_generator(after), event.pk or 0)
+            else:
+                pending.append((earliest, index, event))
+        pending.sort(reverse=True)
 
-            try:
-                next_occurence = heapq.heapreplace(occurrences, (next(generator), generator))[0]
-            except StopIteration:
-                next_occurence = heapq.heappop(occurrences)[0]
-            yield occ_replacer.get_occurrence(next_occurence)
+        def load(start, end):
+            occurrences = Occurrence.objects.filter(event__in=list(by_pk), original_start__lt=end)
+            if start is None:
+                occurrences = occurrences.filter(original_end__gt=after)
+            else:
+                occurrences = occurrences.filter(original_start__gte=start)
+            occurrences = list(occurrences)
+            for occurrence in occurrences:
+                occurrence.event = by_pk[occurrence.event_id]
+            return OccurrenceReplacer(occurrences)
+
+        occ_replacer = loaded_until = None
+        while heap or pending:
+            while pending and (not heap or pending[-1][0] <= heap[0][0]):
+                event = pending.pop()[2]
+                push(event._occurrences_after_generator(after), event.pk or 0)
+            if not heap:
+                continue
+            start, event_id, _, occurrence, generator = heapq.heappop(heap)
+            push(generator, event_id)
+            if loaded_until is None or start >= loaded_until:
+                # the generated occurrences come by start, which is their
+                # original start, so the previous chunks are done with
+                occ_replacer = load(loaded_until, max(start, after) + self.chunk)
+                loaded_until = max(start, after) + self.chunk
+            yield occ_replacer.get_occurrence(occurrence)
 
 
 class OccurrenceReplacer(object):
@@ -65,9 +167,14 @@ class OccurrenceReplacer(object):
     """
 
     def __init__(self, persisted_occurrences):
-        lookup = [((occ.event, occ.original_start, occ.original_end), occ) for
+        lookup = [((occ.event_id, occ.original_start, occ.original_end), occ) for
                   occ in persisted_occurrences]
         self.lookup = dict(lookup)
+        # sorted by start for get_additional_occurrences, which only has to
+        # look as far back as the longest occurrence
+        self._by_start = sorted(self.lookup.values(), key=lambda occ: occ.start)
+        self._starts = [occ.start for occ in self._by_start]
+        self._longest = max([occ.end - occ.start for occ in self._by_start] or [datetime.timedelta(0)])
 
     def get_occurrence(self, occ):
         """
@@ -75,12 +182,12 @@ class OccurrenceReplacer(object):
         has already been matched
         """
         return self.lookup.pop(
-            (occ.event, occ.original_start, occ.original_end),
+            (occ.event_id, occ.original_start, occ.original_end),
             occ)
 
     def has_occurrence(self, occ):
         try:
-            return (occ.event, occ.original_start, occ.original_end) in self.lookup
+            return (occ.event_id, occ.original_start, occ.original_end) in self.lookup
         except TypeError:
             if not self.lookup:
                 return False
@@ -89,54 +196,164 @@ class OccurrenceReplacer(object):
 
     def get_additional_occurrences(self, start, end):
         """
-        Return persisted occurrences which are now in the period
+        Return persisted occurrences which are now in the period, and have
+        not been matched by get_occurrence, sorted by start
+        """
+        additional = []
+        for index in range(bisect_left(self._starts, start - self._longest), bisect_left(self._starts, end)):
+            occ = self._by_start[index]
+            if (occ.end >= start and not occ.cancelled and
+                    self.lookup.get((occ.event_id, occ.original_start, occ.original_end)) is occ):
+                additional.append(occ)
+        return additional
+
+
+# the largest difference between a wall clock time and UTC
+UTC_OFFSET_BOUND = datetime.timedelta(days=1)
+
+
+def localize_all(tzinfo, dates):
+    """
+    Returns ``[tzinfo.localize(date) for date in dates]`` for a sorted list of
+    naive ``dates``.  Only the dates within a day of a DST transition of the
+    pytz timezone are localized one by one; the others share the offset of
+    their transition period, which is looked up once.
+    """
+    transitions = getattr(tzinfo, '_utc_transition_times', None)
+    if not transitions or not dates:
+        return [tzinfo.localize(date) for date in dates]
+    index = max(bisect_right(transitions, dates[0]) - 1, 0)
+    localized = []
+    period = None
+    for date in dates:
+        while index < len(transitions) and date - transitions[index] >= UTC_OFFSET_BOUND:
+            index += 1
+            period = None
+        if index < len(transitions) and date - transitions[index] > -UTC_OFFSET_BOUND:
+            localized.append(tzinfo.localize(date))
+        elif period is None:
+            date = tzinfo.localize(date)
+            period = date.tzinfo
+            localized.append(date)
+        else:
+            localized.append(date.replace(tzinfo=period))
+    return localized
+
+
+class RequestCache(object):
+    """
+    The objects resolved while handling a request and the permission
+    verdicts of its users, shared by the permission decorators, the views
+    and the template tags so that each lookup and check runs once.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._verdicts = {}
+
+    def get_object(self, model, **lookup):
+        """
+        Returns the instance of ``model`` matching the single field lookup,
+        e.g. ``pk=1`` or ``slug='main'``, or None.
+        """
+        (field, value), = lookup.items()
+        key = (model, field, force_text(value))
+        if key not in self._objects:
+            obj = get_object_or_None(model, **lookup)
+            self._objects[key] = obj
+            if obj is not None:
+                self.add(obj)
+        return self._objects[key]
+
+    def add(self, obj):
+        self._objects[(type(obj), 'pk', force_text(obj.pk))] = obj
+
+    def get_calendar(self, event):
         """
-        return [occ for _, occ in list(self.lookup.items()) if (occ.start < end and occ.end >= start and not occ.cancelled)]
+        Returns the calendar of ``event``, fetched once per calendar.
+        """
+        from schedule.models import Calendar
+        if event.calendar_id is None:
+            return None
+        calendar = self.get_object(Calendar, pk=event.calendar_id)
+        event.calendar = calendar
+        return calendar
+
+    def has_permission(self, kind, obj, user):
+        """
+        Returns the verdict of the CHECK_<kind>_PERM_FUNC setting, ``kind``
+        being 'calendar', 'event' or 'occurrence', for ``obj`` and ``user``.
+        Unsaved objects are checked every time.
+        """
+        check = {
+            'calendar': CHECK_CALENDAR_PERM_FUNC,
+            'event': CHECK_EVENT_PERM_FUNC,
+            'occurrence': CHECK_OCCURRENCE_PERM_FUNC,
+        }[kind]
+        if obj is not None and obj.pk is None:
+            return check(obj, user)
+        key = (kind, None if obj is None else (type(obj), obj.pk), getattr(user, 'pk', None))
+        if key not in self._verdicts:
+            self._verdicts[key] = bool(check(obj, user))
+        return self._verdicts[key]
+
+
+def get_request_cache(request):
+    """
+    Returns the RequestCache of ``request``.
+    """
+    if not hasattr(request, '_schedule_cache'):
+        request._schedule_cache = RequestCache()
+    return request._schedule_cache
 
 
 def get_occurrence(request, *args, **kwargs):
     from schedule.models import Occurrence
     occurrence = None
+    cache = get_request_cache(request)
     if 'occurrence_id' in kwargs:
-        occurrence = get_object_or_None(Occurrence, 
-            id=kwargs['occurrence_id'])
+        occurrence = cache.get_object(Occurrence, 
+            pk=kwargs['occurrence_id'])
     elif request.GET:
-        occurrence = get_object_or_None(Occurrence, 
-            id=request.GET.get('occurrence_id', None))
+        occurrence = cache.get_object(Occurrence, 
+            pk=request.GET.get('occurrence_id', None))
     elif request.POST:
-        occurrence = get_object_or_None(Occurrence, 
-            id=request.POST.get('occurrence_id', None))
+        occurrence = cache.get_object(Occurrence, 
+            pk=request.POST.get('occurrence_id', None))
     return occurrence
 
 def get_event(occurrence, request, *args, **kwargs):
     from schedule.models import Event
     event = None
+    cache = get_request_cache(request)
     if occurrence:
         event = occurrence.event
+        cache.add(event)
     elif 'event_id' in kwargs:
-        event = get_object_or_None(Event, 
-            id=kwargs['event_id'])
+        event = cache.get_object(Event, 
+            pk=kwargs['event_id'])
     elif request.GET:
-        event = get_object_or_None(Event, 
-            id=request.GET.get('event_id', None))
+        event = cache.get_object(Event, 
+            pk=request.GET.get('event_id', None))
     elif request.POST:
-        event = get_object_or_None(Event, 
-            id=request.POST.get('event_id', None))
+        event = cache.get_object(Event, 
+            pk=request.POST.get('event_id', None))
     return event
 
 def get_calendar(event, request, *args, **kwargs):
     from schedule.models import Calendar
     calendar = None
+    cache = get_request_cache(request)
     if event:
-        calendar = event.calendar
+        calendar = cache.get_calendar(event)
     elif 'calendar_slug' in kwargs:
-        calendar = get_object_or_None(Calendar, 
+        calendar = cache.get_object(Calendar, 
             slug=kwargs['calendar_slug'])
     elif request.GET:
-        calendar = get_object_or_None(Calendar, 
+        calendar = cache.get_object(Calendar, 
             slug=request.GET.get('calendar_slug', None))
     elif request.POST:
-        calendar = get_object_or_None(Calendar, 
+        calendar = cache.get_object(Calendar, 
             slug=request.POST.get('calendar_slug', None))
     return calendar
 
@@ -155,9 +372,10 @@ def check_occurrence_permissions(function):
             return HttpResponseRedirect(settings.LOGIN_URL)
         occurrence, event, calendar = get_objects(request, *args, **kwargs)
         if calendar and event:
-            allowed = (CHECK_EVENT_PERM_FUNC(event, user) and \
-                CHECK_CALENDAR_PERM_FUNC(calendar, user) and \
-                CHECK_OCCURRENCE_PERM_FUNC(occurrence, user))
+            cache = get_request_cache(request)
+            allowed = (cache.has_permission('event', event, user) and \
+                cache.has_permission('calendar', calendar, user) and \
+                cache.has_permission('occurrence', occurrence, user))
             if not allowed:
                 return HttpResponseRedirect(settings.LOGIN_URL)
             # all checks passed
@@ -174,8 +392,9 @@ def check_event_permissions(function):
             return HttpResponseRedirect(settings.LOGIN_URL)
         occurrence, event, calendar = get_objects(request, *args, **kwargs)
         if calendar:
-            allowed = (CHECK_EVENT_PERM_FUNC(event, user) and \
-                CHECK_CALENDAR_PERM_FUNC(calendar, user))
+            cache = get_request_cache(request)
+            allowed = (cache.has_permission('event', event, user) and \
+                cache.has_permission('calendar', calendar, user))
             if not allowed:
                 return HttpResponseRedirect(settings.LOGIN_URL)
             # all checks passed
@@ -193,7 +412,7 @@ def check_calendar_permissions(function):
                 return HttpResponseRedirect(settings.LOGIN_URL)
             occurrence, event, calendar = get_objects(request, *args, **kwargs)
             if calendar:
-                allowed = CHECK_CALENDAR_PERM_FUNC(calendar, user)
+                allowed = get_request_cache(request).has_permission('calendar', calendar, user)
                 if not allowed:
                     return HttpResponseRedirect(settings.LOGIN_URL)
                 # all checks passed
@@ -202,6 +421,16 @@ def check_calendar_permissions(function):
         return function(request, *args, **kwargs)
     return decorator
 
+def has_calendars_permission(calendars, user):
+    """
+    Returns whether ``user`` may view every calendar of ``calendars``, as
+    check_calendar_permissions checks the calendar of a single request.
+    """
+    if not CALENDAR_VIEW_PERM:
+        return True
+    return bool(user) and all(CHECK_CALENDAR_PERM_FUNC(calendar, user) for calendar in calendars)
+
+
 def coerce_date_dict(date_dict):
     """
     given a dictionary (presumed to be from request.GET) it returns a tuple
@@ -228,6 +457,35 @@ def coerce_date_dict(date_dict):
     return modified and ret_val or {}
 
 
+OCCURRENCE_ID_FORMAT = '%Y%m%d%H%M%S'
+
+
+def get_occurrence_api_id(occurrence):
+    """
+    Returns the id of ``occurrence`` in the occurrence api: the pk of a
+    persisted occurrence, or "<event id>-<original start>" for a generated
+    one, with the original start in UTC down to the second.
+    """
+    if occurrence.id:
+        return occurrence.id
+    original_start = occurrence.original_start
+    if timezone.is_aware(original_start):
+        original_start = original_start.astimezone(timezone.utc)
+    return '%s-%s' % (occurrence.event_id, original_start.strftime(OCCURRENCE_ID_FORMAT))
+
+
+def parse_occurrence_api_id(occurrence_id):
+    """
+    Returns the event id and the original start encoded by
+    get_occurrence_api_id for a generated occurrence, or raises ValueError.
+    """
+    event_id, original_start = occurrence_id.split('-')
+    original_start = datetime.datetime.strptime(original_start, OCCURRENCE_ID_FORMAT)
+    if settings.USE_TZ:
+        original_start = timezone.make_aware(original_start, timezone.utc)
+    return int(event_id), original_start
+
+
 def get_model_bases():
     from django.db.models import Model
     baseStrings = getattr(settings, 'SCHEDULER_BASE_CLASSES', None)
@@ -4,9 +4,11 @@ import datetime
 import dateutil.parser
 from django.utils.six.moves.urllib.parse import quote
 
-from django.db.models import Q, F
+from django.db.models import F
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+                         HttpResponseNotFound, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.http import HttpResponseRedirect, Http404
@@ -14,17 +16,21 @@ from django.views.generic.base import TemplateResponseMixin
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import (
         UpdateView, CreateView, DeleteView, ModelFormMixin, ProcessFormView)
+from django.utils.decorators import method_decorator
 from django.utils.http import is_safe_url
 
 from schedule.conf.settings import (GET_EVENTS_FUNC, OCCURRENCE_CANCEL_REDIRECT,
                                     EVENT_NAME_PLACEHOLDER, CHECK_EVENT_PERM_FUNC, 
-                                    CHECK_OCCURRENCE_PERM_FUNC, USE_FULLCALENDAR)
+                                    CHECK_OCCURRENCE_PERM_FUNC, USE_FULLCALENDAR,
+                                    STREAM_API_OCCURRENCES)
+from schedule import cache
 from schedule.forms import EventForm, OccurrenceForm
-from schedule.models import Calendar, Occurrence, Event
+from schedule.models import Calendar, Occurrence, Event, EventChange, OccurrenceIndex
 from schedule.periods import weekday_names
 from schedule.utils import (check_event_permissions, 
     check_calendar_permissions, coerce_date_dict, 
-    check_occurrence_permissions)
+    check_occurrence_permissions, get_occurrence_api_id, parse_occurrence_api_id,
+    has_calendars_permission, get_request_cache)
 
 
 class CalendarViewPermissionMixin(object):
@@ -47,6 +53,27 @@ class OccurrenceEditPermissionMixin(object):
         return check_occurrence_permissions(view)
 
 
+class RequestCacheMixin(object):
+    """
+    Gets the object of the view from the RequestCache, where the permission
+    decorators have already put it.
+    """
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super(RequestCacheMixin, self).get_object(queryset)
+        pk = self.kwargs.get(self.pk_url_kwarg)
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        if pk is not None:
+            obj = get_request_cache(self.request).get_object(self.model, pk=pk)
+        elif slug is not None:
+            obj = get_request_cache(self.request).get_object(self.model, **{self.get_slug_field(): slug})
+        else:
+            return super(RequestCacheMixin, self).get_object(queryset)
+        if obj is None:
+            raise Http404
+        return obj
+
+
 class TemplateKwargMixin(TemplateResponseMixin):
     def get_template_names(self):
         if 'template_name' in self.kwargs:
@@ -65,7 +92,7 @@ class CancelButtonMixin(object):
             return super(CancelButtonMixin, self).post(request, *args, **kwargs)
 
 
-class CalendarMixin(CalendarViewPermissionMixin, TemplateKwargMixin):
+class CalendarMixin(CalendarViewPermissionMixin, RequestCacheMixin, TemplateKwargMixin):
     model = Calendar
     slug_url_kwarg = 'calendar_slug'
 
@@ -90,9 +117,29 @@ class FullCalendarView(CalendarMixin, DetailView):
         return context
 
 
+def _get_period_view_events(request, calendar_slug=None, **kwargs):
+    calendar = get_request_cache(request).get_object(Calendar, slug=calendar_slug)
+    if calendar is None:
+        return None
+    return GET_EVENTS_FUNC(request, calendar)
+
+
+def _get_period_view_extra(request, calendar_slug=None, **kwargs):
+    # the events of GET_EVENTS_FUNC may depend on the user, and the pages
+    # show the calendar and the current day in the current timezone
+    calendar = get_request_cache(request).get_object(Calendar, slug=calendar_slug)
+    user = getattr(request, 'user', None)
+    if not settings.USE_TZ:
+        return calendar.pk, calendar.name, getattr(user, 'pk', None), timezone.now().date()
+    local_timezone = timezone.get_current_timezone()
+    return (calendar.pk, calendar.name, getattr(user, 'pk', None),
+            timezone.localtime(timezone.now(), local_timezone).date(), str(local_timezone))
+
+
 class CalendarByPeriodsView(CalendarMixin, DetailView):
     template_name = 'schedule/calendar_by_period.html'
 
+    @method_decorator(cache.condition_on_events(_get_period_view_events, _get_period_view_extra))
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
         context = self.get_context_data(request, **kwargs)
@@ -130,7 +177,7 @@ class CalendarByPeriodsView(CalendarMixin, DetailView):
         return context
 
 
-class OccurrenceMixin(CalendarViewPermissionMixin, TemplateKwargMixin):
+class OccurrenceMixin(CalendarViewPermissionMixin, RequestCacheMixin, TemplateKwargMixin):
     model = Occurrence
     pk_url_kwarg = 'occurrence_id'
     form_class = OccurrenceForm
@@ -139,7 +186,7 @@ class OccurrenceMixin(CalendarViewPermissionMixin, TemplateKwargMixin):
 class OccurrenceEditMixin(CancelButtonMixin, OccurrenceEditPermissionMixin, OccurrenceMixin):
     def get_initial(self):
         initial_data = super(OccurrenceEditMixin, self).get_initial()
-        _, self.object = get_occurrence(**self.kwargs)
+        _, self.object = get_occurrence(request=self.request, **self.kwargs)
         return initial_data
 
 
@@ -171,7 +218,7 @@ class CancelOccurrenceView(OccurrenceEditMixin, ModelFormMixin, ProcessFormView)
     template_name = 'schedule/cancel_occurrence.html'
 
     def post(self, request, *args, **kwargs):
-        event, occurrence = get_occurrence(**kwargs)
+        event, occurrence = get_occurrence(request=request, **kwargs)
         self.success_url = kwargs.get('next',
                         get_next_url(request, event.get_absolute_url()))
         if "cancel" not in request.POST:
@@ -179,7 +226,7 @@ class CancelOccurrenceView(OccurrenceEditMixin, ModelFormMixin, ProcessFormView)
         return HttpResponseRedirect(self.success_url)
 
 
-class EventMixin(CalendarViewPermissionMixin, TemplateKwargMixin):
+class EventMixin(CalendarViewPermissionMixin, RequestCacheMixin, TemplateKwargMixin):
     model = Event
     pk_url_kwarg = 'event_id'
 
@@ -263,19 +310,21 @@ class DeleteEventView(EventEditMixin, DeleteView):
         return next_url
 
 
-def get_occurrence(event_id, occurrence_id=None, year=None, month=None, day=None, hour=None, minute=None, second=None):
+def get_occurrence(event_id, occurrence_id=None, year=None, month=None, day=None, hour=None, minute=None, second=None,
+                   request=None):
     """
     Because occurrences don't have to be persisted, there must be two ways to
     retrieve them. both need an event, but if its persisted the occurrence can
     be retrieved with an id. If it is not persisted it takes a date to
     retrieve it.  This function returns an event and occurrence regardless of
-    which method is used.
+    which method is used.  The objects already resolved for ``request`` are
+    reused.
     """
     if(occurrence_id):
-        occurrence = get_object_or_404(Occurrence, id=occurrence_id)
+        occurrence = _get_object_or_404(request, Occurrence, pk=occurrence_id)
         event = occurrence.event
     elif(all((year, month, day, hour, minute, second))):
-        event = get_object_or_404(Event, id=event_id)
+        event = _get_object_or_404(request, Event, pk=event_id)
         occurrence = event.get_occurrence(
             datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)))
         if occurrence is None:
@@ -285,6 +334,15 @@ def get_occurrence(event_id, occurrence_id=None, year=None, month=None, day=None
     return event, occurrence
 
 
+def _get_object_or_404(request, model, **lookup):
+    if request is None:
+        return get_object_or_404(model, **lookup)
+    obj = get_request_cache(request).get_object(model, **lookup)
+    if obj is None:
+        raise Http404
+    return obj
+
+
 def check_next_url(next_url):
     """
     Checks to make sure the next url is not redirecting to another page.
@@ -304,43 +362,156 @@ def get_next_url(request, default):
         next_url = _next_url
     return next_url
 
-@check_calendar_permissions
-def api_occurrences(request):
+def _get_api_calendar(request):
+    return get_request_cache(request).get_object(Calendar, slug=request.GET.get('calendar_slug'))
+
+
+def _get_api_events(request):
+    calendar = _get_api_calendar(request)
+    return calendar.events.all() if calendar is not None else None
+
+
+def _get_api_range(request):
     utc=pytz.UTC
     # version 2 of full calendar
     if '-' in request.GET.get('start'):
         convert = lambda d: datetime.datetime.strptime(d, '%Y-%m-%d')
     else:
         convert = lambda d: datetime.datetime.utcfromtimestamp(float(d))
-    start = utc.localize(convert(request.GET.get('start')))
-    end = utc.localize(convert(request.GET.get('end')))
-    calendar = get_object_or_404(Calendar, slug=request.GET.get('calendar_slug'))
+    return utc.localize(convert(request.GET.get('start'))), utc.localize(convert(request.GET.get('end')))
+
+
+@check_calendar_permissions
+@cache.condition_on_events(_get_api_events)
+def api_occurrences(request):
+    start, end = _get_api_range(request)
+    calendar = _get_api_calendar(request)
+    if calendar is None:
+        raise Http404
+    # read before expanding, changes made meanwhile are sent again
+    sync_token = EventChange.objects.sync_token()
     response_data =[]
-    if Occurrence.objects.all().count() > 0:
-        i = Occurrence.objects.latest('id').id + 1
+    event_list = calendar.events.all()
+    occurrences = OccurrenceIndex.objects.occurrences_between(event_list, start, end)
+    if occurrences is None and STREAM_API_OCCURRENCES:
+        occurrences = Event.objects.iter_occurrences_between(event_list, start, end)
+        response = StreamingHttpResponse(_stream_json_list(occurrences), content_type="application/json")
     else:
-        i = 1
-    event_list = calendar.events.filter(start__lte=end).filter(
-        Q(end_recurring_period__gte=start) | Q(end_recurring_period__isnull=True) )
-    for event in event_list:
-        occurrences = event.get_occurrences(start, end)
+        if occurrences is None:
+            occurrences = cache.occurrences_between(event_list, start, end, [calendar.pk])
+        if occurrences is None:
+            occurrences = Event.objects.occurrences_between(event_list, start, end)
         for occurrence in occurrences:
-            if occurrence.id:
-                occurrence_id = occurrence.id
-                existed = True
-            else:
-                occurrence_id = i + occurrence.event.id
-                existed = False
-            response_data.append({
-                "id": occurrence_id,
-                "title": occurrence.title,
-                "start": occurrence.start.isoformat(),
-                "end": occurrence.end.isoformat(),
-                "existed" : existed,
-                "event_id" : occurrence.event.id,
-            })
+            response_data.append(_api_occurrence_data(occurrence))
+        response = HttpResponse(json.dumps(response_data), content_type="application/json")
+    if sync_token is not None:
+        response['X-Sync-Token'] = str(sync_token)
+    return response
+
+
+@check_calendar_permissions
+def api_occurrences_delta(request):
+    """
+    Returns the occurrences of a calendar in a range which changed since
+    the ``sync_token`` returned by api_occurrences (in its X-Sync-Token
+    header) or by a previous call.  The client replaces the occurrences of
+    each event listed in ``events`` with those listed in ``occurrences``;
+    deleted events are listed without occurrences.  Answers 410 Gone when
+    the changes following the token have been pruned and the whole range
+    has to be fetched again.
+    """
+    calendar = _get_api_calendar(request)
+    new_token = EventChange.objects.sync_token()
+    if calendar is None or new_token is None:
+        raise Http404
+    try:
+        token = int(request.GET.get('sync_token'))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest('Invalid sync token')
+    start, end = _get_api_range(request)
+    event_ids = EventChange.objects.changed_events(calendar, token)
+    if event_ids is None:
+        return HttpResponse('Sync token expired', status=410)
+    occurrences = []
+    if event_ids:
+        occurrences = Event.objects.occurrences_between(calendar.events.filter(pk__in=event_ids), start, end)
+    response_data = {
+        "sync_token": new_token,
+        "events": sorted(event_ids),
+        "occurrences": [_api_occurrence_data(occurrence) for occurrence in occurrences],
+    }
+    return HttpResponse(json.dumps(response_data), content_type="application/json")
+
+
+def _get_batch_calendars(request):
+    """
+    Returns the calendars of the ``calendar_slug`` parameters, which may be
+    repeated or hold several slugs separated by commas, with one query, or
+    None if one of them does not exist.
+    """
+    if not hasattr(request, '_schedule_calendars'):
+        slugs = []
+        for value in request.GET.getlist('calendar_slug'):
+            slugs.extend(slug for slug in value.split(',') if slug and slug not in slugs)
+        calendars = list(Calendar.objects.filter(slug__in=slugs)) if slugs else []
+        request._schedule_calendars = calendars if slugs and len(calendars) == len(slugs) else None
+    return request._schedule_calendars
+
+
+def _get_batch_events(request):
+    calendars = _get_batch_calendars(request)
+    return Event.objects.filter(calendar__in=calendars) if calendars is not None else None
+
+
+def api_occurrences_batch(request):
+    """
+    Returns the occurrences of several calendars in one range as a JSON
+    object mapping each calendar slug to the list api_occurrences would
+    return for it.  The events of all the calendars are expanded together.
+    """
+    calendars = _get_batch_calendars(request)
+    if calendars is None:
+        return HttpResponseNotFound('<h1>Page not found</h1>')
+    if not has_calendars_permission(calendars, request.user):
+        return HttpResponseRedirect(settings.LOGIN_URL)
+    return _api_occurrences_batch(request)
+
+
+@cache.condition_on_events(_get_batch_events)
+def _api_occurrences_batch(request):
+    start, end = _get_api_range(request)
+    calendars = _get_batch_calendars(request)
+    slugs = dict((calendar.pk, calendar.slug) for calendar in calendars)
+    event_list = _get_batch_events(request)
+    occurrences = OccurrenceIndex.objects.occurrences_between(event_list, start, end)
+    if occurrences is None:
+        occurrences = cache.occurrences_between(event_list, start, end, list(slugs))
+    if occurrences is None:
+        occurrences = Event.objects.occurrences_between(event_list, start, end)
+    response_data = dict((slug, []) for slug in slugs.values())
+    for occurrence in occurrences:
+        response_data[slugs[occurrence.event.calendar_id]].append(_api_occurrence_data(occurrence))
     return HttpResponse(json.dumps(response_data), content_type="application/json")
 
+
+def _api_occurrence_data(occurrence):
+    return {
+        "id": get_occurrence_api_id(occurrence),
+        "title": occurrence.title,
+        "start": occurrence.start.isoformat(),
+        "end": occurrence.end.isoformat(),
+        "existed" : bool(occurrence.id),
+        "event_id" : occurrence.event_id,
+    }
+
+
+def _stream_json_list(occurrences):
+    separator = '['
+    for occurrence in occurrences:
+        yield separator + json.dumps(_api_occurrence_data(occurrence))
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
 @check_calendar_permissions
 def api_move_or_resize_by_code(request):
     if request.method == 'POST':
@@ -361,6 +532,11 @@ def api_move_or_resize_by_code(request):
                 resp['status'] = "OK"
         else:
             event_id = request.POST.get('event_id')
+            if not event_id:
+                try:
+                    event_id, original_start = parse_occurrence_api_id(id)
+                except ValueError:
+                    raise Http404
             event = Event.objects.get(id=event_id)
             dts = 0
             dte = dt
@@ -369,14 +545,72 @@ def api_move_or_resize_by_code(request):
                 dts = dt
             event.end = event.end + dt
             if CHECK_EVENT_PERM_FUNC(event, request.user):
-                event.save()
+                # shift the occurrences first, saving the event indexes them
                 event.occurrence_set.all().update(
                     original_start=F('original_start') + dts,
                     original_end=F('original_end') + dte,
                 )
+                event.save()
                 resp['status'] = "OK"
     return HttpResponse(json.dumps(resp))
 
+def api_move_or_resize_batch(request):
+    """
+    Moves or resizes many occurrences at once.  The ``items`` POST parameter
+    is a JSON list of objects with the parameters api_move_or_resize_by_code
+    takes: ``id``, ``existed``, ``event_id``, ``delta`` and ``resize``.  The
+    targets are loaded with two queries and shifted in one transaction; the
+    response holds the status of each item.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        items = json.loads(request.POST.get('items', ''))
+        targets = [_get_batch_target(item) for item in items]
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return HttpResponseBadRequest('Invalid items')
+    occurrences = Occurrence.objects.select_related('event__calendar').in_bulk(
+        [pk for existed, pk, deltas in targets if existed and pk is not None])
+    events = Event.objects.select_related('rule', 'calendar').in_bulk(
+        [pk for existed, pk, deltas in targets if not existed and pk is not None])
+    occurrence_shifts, event_shifts, results = {}, {}, []
+    for item, (existed, pk, deltas) in zip(items, targets):
+        if existed:
+            target, shifts, check = occurrences.get(pk), occurrence_shifts, CHECK_OCCURRENCE_PERM_FUNC
+        else:
+            target, shifts, check = events.get(pk), event_shifts, CHECK_EVENT_PERM_FUNC
+        if target is None:
+            status = "NOT FOUND"
+        elif (check(target, request.user) and has_calendars_permission(
+                [target.event.calendar if existed else target.calendar], request.user)):
+            # several items may shift the same target
+            previous = shifts.get(target, (datetime.timedelta(0), datetime.timedelta(0)))
+            shifts[target] = (previous[0] + deltas[0], previous[1] + deltas[1])
+            status = "OK"
+        else:
+            status = "PERMISSION DENIED"
+        results.append({'id': item.get('id'), 'status': status})
+    Event.objects.shift(event_shifts, occurrence_shifts)
+    return HttpResponse(json.dumps({'status': "OK", 'results': results}), content_type="application/json")
+
+
+def _get_batch_target(item):
+    existed = item.get('existed') in (True, 'true')
+    delta = datetime.timedelta(minutes=int(item['delta']))
+    resize = item.get('resize') in (True, 'true')
+    deltas = (datetime.timedelta(0) if resize else delta, delta)
+    pk = item['id'] if existed else item.get('event_id')
+    if not existed and not pk:
+        try:
+            pk, original_start = parse_occurrence_api_id(item['id'])
+        except ValueError:
+            return existed, None, deltas
+    try:
+        return existed, int(pk), deltas
+    except (TypeError, ValueError):
+        return existed, None, deltas
+
+
 @check_calendar_permissions
 def api_select_create(request):
     if request.method == 'POST':
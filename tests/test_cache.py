@@ -0,0 +1,91 @@
+import datetime
+import json
+import pytz
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from schedule import cache
+from schedule.conf import settings
+from schedule.feeds import UpcomingEventsFeed
+from schedule.models import Calendar, Event, Rule
+from schedule.periods import Month
+
+
+class TestOccurrenceCache(TestCase):
+
+    def setUp(self):
+        settings.OCCURRENCE_CACHE = 'default'
+        caches['default'].clear()
+        self.calendar = Calendar.objects.create(name="MyCal", slug="mycal")
+        self.other = Calendar.objects.create(name="Other", slug="other")
+        self.rule = Rule.objects.create(frequency="WEEKLY")
+        self.event = Event.objects.create(
+            title='Weekly', description='', calendar=self.calendar, rule=self.rule,
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        self.date = datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)
+
+    def tearDown(self):
+        settings.OCCURRENCE_CACHE = None
+
+    def versions(self):
+        return cache.get_calendar_versions(caches['default'], [self.calendar.pk, self.other.pk])
+
+    def starts(self, period):
+        return [(o.event_id, o.start, o.cancelled) for o in period.occurrences]
+
+    def test_disabled_cache_is_not_used(self):
+        settings.OCCURRENCE_CACHE = None
+        self.assertIsNone(cache.occurrences_between(self.calendar.events.all(), self.date, self.date))
+        self.assertEqual(self.starts(Month(self.calendar.events.all(), self.date)),
+                         self.starts(Month(list(self.calendar.events.all()), self.date)))
+
+    def test_period_hits_cache(self):
+        expected = self.starts(Month(self.calendar.events.all(), self.date))
+        # only the calendars of the events are looked up
+        with self.assertNumQueries(1):
+            self.assertEqual(self.starts(Month(self.calendar.events.all(), self.date)), expected)
+        self.assertEqual(len(expected), 4)
+
+    def test_changes_invalidate(self):
+        versions = self.versions()
+        self.event.get_occurrence(datetime.datetime(2008, 2, 9, 8, 0, tzinfo=pytz.utc)).cancel()
+        self.assertNotEqual(self.versions(), versions)
+        self.assertEqual(self.starts(Month(self.calendar.events.all(), self.date))[1][2], True)
+        versions = self.versions()
+        self.rule.params = 'interval:2'
+        self.rule.save()
+        self.assertNotEqual(self.versions(), versions)
+        self.assertEqual(len(Month(self.calendar.events.all(), self.date).occurrences), 2)
+        versions = self.versions()
+        self.calendar.save()
+        self.assertNotEqual(self.versions()[0], versions[0])
+        self.assertEqual(self.versions()[1], versions[1])
+
+    def test_moved_event_invalidates_both_calendars(self):
+        Month(self.other.events.all(), self.date).occurrences
+        versions = self.versions()
+        self.event.calendar = self.other
+        self.event.save()
+        new_versions = self.versions()
+        self.assertNotEqual(new_versions[0], versions[0])
+        self.assertNotEqual(new_versions[1], versions[1])
+        self.assertEqual(len(Month(self.other.events.all(), self.date).occurrences), 4)
+
+    def test_api_occurrences(self):
+        url = reverse('api_occurences') + '?calendar_slug=mycal&start=2008-02-01&end=2008-02-15'
+        self.assertEqual(len(json.loads(self.client.get(url).content.decode())), 2)
+        # only the calendar and the calendars of its events for the ETag
+        with self.assertNumQueries(2):
+            self.assertEqual(len(json.loads(self.client.get(url).content.decode())), 2)
+        self.event.delete()
+        self.assertEqual(json.loads(self.client.get(url).content.decode()), [])
+
+    def test_upcoming_feed(self):
+        items = UpcomingEventsFeed().items(self.calendar)
+        self.assertEqual(len(items), 10)
+        with self.assertNumQueries(0):
+            self.assertEqual([o.start for o in UpcomingEventsFeed().items(self.calendar)],
+                             [o.start for o in items])
@@ -0,0 +1,120 @@
+import datetime
+import json
+import pytz
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from schedule.conf import settings
+from schedule.models import Calendar, Event, EventChange, Rule
+
+
+class TestDeltaSync(TestCase):
+    fixtures = ['schedule.json']
+
+    def setUp(self):
+        settings.CHANGE_LOG = True
+        # the tokens follow the log right away
+        settings.CHANGE_LOG_OVERLAP = 0
+        self.calendar = Calendar.objects.create(name="MyCal", slug='mycal')
+        self.other = Calendar.objects.create(name="Other", slug='other')
+        self.event = Event.objects.create(
+            title='Daily', description='', calendar=self.calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        self.single = Event.objects.create(
+            title='Once', description='', calendar=self.calendar,
+            start=datetime.datetime(2008, 1, 6, 12, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 6, 13, 0, tzinfo=pytz.utc))
+        self.client.login(username="admin", password="admin")
+        self.params = {'calendar_slug': 'mycal', 'start': '2008-01-05', 'end': '2008-01-08'}
+
+    def tearDown(self):
+        settings.CHANGE_LOG = False
+        settings.CHANGE_LOG_OVERLAP = 60
+
+    def delta(self, token):
+        response = self.client.get(reverse('api_occurrences_delta'), dict(self.params, sync_token=token))
+        return json.loads(response.content.decode())
+
+    def test_sync_token_header(self):
+        response = self.client.get(reverse('api_occurences'), self.params)
+        self.assertEqual(int(response['X-Sync-Token']), EventChange.objects.latest('pk').pk)
+        settings.CHANGE_LOG = False
+        self.assertNotIn('X-Sync-Token', self.client.get(reverse('api_occurences'), self.params))
+        response = self.client.get(reverse('api_occurrences_delta'), dict(self.params, sync_token=0))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged(self):
+        token = int(self.client.get(reverse('api_occurences'), self.params)['X-Sync-Token'])
+        # the calendar, the token, the first change and the changed events
+        with self.assertNumQueries(4):
+            delta = self.delta(token)
+        self.assertEqual(delta, {'sync_token': token, 'events': [], 'occurrences': []})
+        response = self.client.get(reverse('api_occurrences_delta'), dict(self.params, sync_token='x'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_changes(self):
+        token = int(self.client.get(reverse('api_occurences'), self.params)['X-Sync-Token'])
+        response = self.client.post(reverse('api_move_or_resize'), {
+            'id': '%d-20080107080000' % self.event.id, 'existed': 'false', 'delta': 30})
+        self.assertEqual(json.loads(response.content.decode())['status'], 'OK')
+        delta = self.delta(token)
+        self.assertEqual(delta['events'], [self.event.pk])
+        self.assertEqual([o['start'] for o in delta['occurrences']],
+                         ['2008-01-0%dT08:30:00+00:00' % day for day in (5, 6, 7)])
+
+        token = delta['sync_token']
+        self.client.post(reverse('api_select_create'), {
+            'calendar_slug': 'mycal', 'start': '2008-01-06T10:00:00+00:00', 'end': '2008-01-06T11:00:00+00:00'})
+        self.single.calendar = self.other
+        self.single.save()
+        self.event = Event.objects.get(pk=self.event.pk)
+        self.event.get_occurrence(datetime.datetime(2008, 1, 6, 8, 30, tzinfo=pytz.utc)).cancel()
+        delta = self.delta(token)
+        created = Event.objects.latest('pk')
+        self.assertEqual(delta['events'], sorted([self.event.pk, self.single.pk, created.pk]))
+        self.assertEqual(sorted((o['event_id'], o['start']) for o in delta['occurrences']), [
+            (self.event.pk, '2008-01-05T08:30:00+00:00'),
+            (self.event.pk, '2008-01-06T08:30:00+00:00'),
+            (self.event.pk, '2008-01-07T08:30:00+00:00'),
+            (created.pk, '2008-01-06T10:00:00+00:00'),
+        ])
+
+        token, pk = delta['sync_token'], self.event.pk
+        self.event.delete()
+        self.assertEqual(self.delta(token), {
+            'sync_token': EventChange.objects.latest('pk').pk, 'events': [pk], 'occurrences': []})
+
+    def test_pruned(self):
+        token = EventChange.objects.sync_token()
+        self.event.save()
+        call_command('prune_change_log', '0', stdout=StringIO())
+        self.assertEqual(EventChange.objects.count(), 1)
+        response = self.client.get(reverse('api_occurrences_delta'), dict(self.params, sync_token=token - 1))
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.delta(token)['events'], [self.event.pk])
+
+    def test_late_commits_are_sent(self):
+        settings.CHANGE_LOG_OVERLAP = 60
+        EventChange.objects.update(created_on=timezone.now() - datetime.timedelta(minutes=2))
+        latest = EventChange.objects.latest('pk').pk
+        self.assertEqual(EventChange.objects.sync_token(), latest)
+        # a transaction logs a change, another one logs and commits a later
+        # change, and the client reads the token before the first commits
+        late = EventChange(pk=latest + 1, calendar_id=self.calendar.pk, event_id=self.single.pk)
+        EventChange.objects.create(pk=latest + 2, calendar_id=self.calendar.pk, event_id=self.event.pk)
+        token = EventChange.objects.sync_token()
+        late.save()
+        self.assertEqual(self.delta(token)['events'], sorted([self.event.pk, self.single.pk]))
+
+    def test_batch_move_is_logged(self):
+        token = EventChange.objects.sync_token()
+        self.client.post(reverse('api_move_or_resize_batch'), {'items': json.dumps([
+            {'id': 'x', 'existed': False, 'event_id': self.single.id, 'delta': 60}])})
+        delta = self.delta(token)
+        self.assertEqual(delta['events'], [self.single.pk])
+        self.assertEqual([o['start'] for o in delta['occurrences']], ['2008-01-06T13:00:00+00:00'])
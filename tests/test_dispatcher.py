@@ -0,0 +1,133 @@
+import datetime
+import pytz
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from schedule.conf import settings
+from schedule.dispatcher import Dispatcher, occurrence_due
+from schedule.models import Calendar, Event, Occurrence, Rule
+
+
+def utc(day, hour=0, minute=0):
+    return datetime.datetime(2008, 1, day, hour, minute, tzinfo=pytz.utc)
+
+
+class Stop(Exception):
+    pass
+
+
+class TestDispatcher(TestCase):
+    def setUp(self):
+        self.calendar = Calendar.objects.create(name="MyCal", slug='mycal')
+        self.daily = Event.objects.create(
+            title='Daily', description='', calendar=self.calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=utc(5, 8), end=utc(5, 9))
+        self.once = Event.objects.create(
+            title='Once', description='', calendar=self.calendar, start=utc(6, 12), end=utc(6, 13))
+        self.fired = []
+        occurrence_due.connect(self.receive)
+        self.dispatcher = Dispatcher()
+        self.dispatcher.load(utc(5))
+
+    def tearDown(self):
+        occurrence_due.disconnect(self.receive)
+        self.dispatcher.unwatch()
+
+    def receive(self, sender, occurrence, **kwargs):
+        self.fired.append(occurrence)
+
+    def starts(self, occurrences):
+        return [(o.event.title, o.start.day, o.start.hour, o.start.minute) for o in occurrences]
+
+    def test_dispatch(self):
+        called = []
+        self.dispatcher.connect(called.append)
+        self.assertEqual(self.dispatcher.next_due(), utc(5, 8))
+        self.assertEqual(self.dispatcher.dispatch(utc(5, 7)), [])
+        due = self.dispatcher.dispatch(utc(7, 12))
+        self.assertEqual(self.starts(due), [
+            ('Daily', 5, 8, 0), ('Daily', 6, 8, 0), ('Once', 6, 12, 0), ('Daily', 7, 8, 0)])
+        self.assertEqual(self.fired, due)
+        self.assertEqual(called, due)
+        self.assertEqual(self.dispatcher.dispatch(utc(7, 12)), [])
+        self.assertEqual(self.dispatcher.next_due(), utc(8, 8))
+
+    def test_lead(self):
+        dispatcher = Dispatcher(events=Event.objects.filter(rule__isnull=True), lead=datetime.timedelta(hours=1))
+        dispatcher.load(utc(5))
+        self.assertEqual(dispatcher.next_due(), utc(6, 11))
+        self.assertEqual(self.starts(dispatcher.dispatch(utc(6, 11))), [('Once', 6, 12, 0)])
+
+    def test_persisted_occurrences(self):
+        self.daily.get_occurrence(utc(6, 8)).cancel()
+        self.daily.get_occurrence(utc(7, 8)).move(utc(9, 10), utc(9, 11))
+        self.dispatcher.load(utc(5))
+        self.assertEqual(self.starts(self.dispatcher.dispatch(utc(8, 12))), [
+            ('Daily', 5, 8, 0), ('Once', 6, 12, 0), ('Daily', 8, 8, 0)])
+        due = self.dispatcher.dispatch(utc(9, 12))
+        self.assertEqual(self.starts(due), [('Daily', 9, 8, 0), ('Daily', 9, 10, 0)])
+        self.assertIsNotNone(due[1].pk)
+
+    def test_watch(self):
+        self.dispatcher.watch()
+        self.dispatcher.dispatch(utc(5, 12))
+        self.daily.start, self.daily.end = utc(5, 8, 30), utc(5, 9, 30)
+        self.daily.save()
+        self.daily.get_occurrence(utc(6, 8, 30)).cancel()
+        self.once.delete()
+        self.assertEqual(self.starts(self.dispatcher.dispatch(utc(7, 12))), [('Daily', 7, 8, 30)])
+        self.daily.rule = None
+        self.daily.save()
+        self.assertIsNone(self.dispatcher.next_due())
+
+    def test_sync(self):
+        since = timezone.now()
+        # the dispatcher does not watch, as if another process made the changes
+        Event.objects.filter(pk=self.once.pk).update(start=utc(6, 16), end=utc(6, 17), updated_on=timezone.now())
+        Event.objects.filter(pk=self.daily.pk).delete()
+        self.assertGreaterEqual(self.dispatcher.sync(since), since)
+        self.assertEqual(self.starts(self.dispatcher.dispatch(utc(7))), [('Once', 6, 16, 0)])
+
+    def test_sync_deleted_occurrences(self):
+        self.daily.get_occurrence(utc(6, 8)).cancel()
+        self.dispatcher.load(utc(5))
+        since = timezone.now()
+        settings.CHANGE_LOG = True
+        try:
+            Occurrence.objects.get().delete()
+            self.dispatcher.sync(since)
+        finally:
+            settings.CHANGE_LOG = False
+        self.assertEqual(self.starts(self.dispatcher.dispatch(utc(6, 12))), [
+            ('Daily', 5, 8, 0), ('Daily', 6, 8, 0), ('Once', 6, 12, 0)])
+
+    @override_settings(USE_TZ=False)
+    def test_naive(self):
+        Event.objects.all().delete()
+        Event.objects.create(
+            title='Daily', description='', calendar=self.calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8), end=datetime.datetime(2008, 1, 5, 9),
+            end_recurring_period=datetime.datetime(2008, 1, 7))
+        dispatcher = Dispatcher()
+        dispatcher.load(datetime.datetime(2008, 1, 5))
+        self.assertEqual(dispatcher.next_due(), datetime.datetime(2008, 1, 5, 8))
+        self.assertEqual(self.starts(dispatcher.dispatch(datetime.datetime(2008, 1, 8))), [
+            ('Daily', 5, 8, 0), ('Daily', 6, 8, 0)])
+
+    def test_run(self):
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            raise Stop()
+        # the next occurrence is years away
+        self.daily.start = self.daily.start + datetime.timedelta(days=10000)
+        self.daily.end = self.daily.start + datetime.timedelta(hours=1)
+        self.daily.save()
+        self.dispatcher = Dispatcher()
+        with self.assertRaises(Stop):
+            self.dispatcher.run(poll=30, sleep=sleep)
+        self.assertEqual(waits, [30])
+        self.assertEqual(self.fired, [])
@@ -1,4 +1,7 @@
 import datetime
+import random
+from importlib import import_module
+from django.apps import apps
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 import pytz
@@ -8,6 +11,7 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 
 from schedule.models import Event, Rule, Calendar, EventRelation
+from schedule.models.events import rrule_cache
 
 
 class TestEvent(TestCase):
@@ -399,6 +403,395 @@ class TestEvent(TestCase):
         pass
 
 
+class TestRRuleCache(TestCase):
+
+    def setUp(self):
+        rrule_cache.clear()
+        self.rule = Rule.objects.create(frequency="WEEKLY")
+        self.event = Event.objects.create(**{
+            'title': 'Recurring event',
+            'start': datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            'end_recurring_period': datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc),
+            'rule': self.rule,
+            'calendar': Calendar.objects.create(name="MyCal"),
+        })
+
+    def test_compiled_rule_is_reused(self):
+        rule = self.event.get_rrule_object(pytz.utc)
+        self.assertEqual((rrule_cache.hits, rrule_cache.misses), (0, 1))
+        self.assertIs(self.event.get_rrule_object(pytz.utc), rule)
+        self.assertIs(Event.objects.get(pk=self.event.pk).get_rrule_object(pytz.utc), rule)
+        self.assertEqual((rrule_cache.hits, rrule_cache.misses), (2, 1))
+
+    def test_expansion_uses_cache(self):
+        self.event.get_occurrences(datetime.datetime(2008, 1, 1, tzinfo=pytz.utc),
+                                   datetime.datetime(2008, 2, 1, tzinfo=pytz.utc))
+        self.event.get_occurrence(datetime.datetime(2008, 1, 12, 8, 0, tzinfo=pytz.utc))
+        next(self.event.occurrences_after(datetime.datetime(2008, 1, 1, tzinfo=pytz.utc)))
+        self.assertEqual((rrule_cache.hits, rrule_cache.misses), (2, 1))
+
+    def test_event_save_invalidates(self):
+        self.event.get_rrule_object(pytz.utc)
+        self.event.start = datetime.datetime(2008, 1, 6, 8, 0, tzinfo=pytz.utc)
+        self.event.save()
+        self.assertEqual(len(rrule_cache), 0)
+        rule = self.event.get_rrule_object(pytz.utc)
+        self.assertEqual(rule[0], datetime.datetime(2008, 1, 6, 8, 0))
+
+    def test_rule_save_invalidates(self):
+        stale = self.event.get_rrule_object(pytz.utc)
+        updated_on = self.event.updated_on
+        self.rule.frequency = "DAILY"
+        self.rule.save()
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertGreater(event.updated_on, updated_on)
+        rule = event.get_rrule_object(pytz.utc)
+        self.assertIsNot(rule, stale)
+        self.assertEqual(rule[1], datetime.datetime(2008, 1, 6, 8, 0))
+
+    def test_unsaved_events_are_not_cached(self):
+        event = Event(rule=self.rule, start=self.event.start, end=self.event.end)
+        event.get_rrule_object(pytz.utc)
+        self.assertEqual(len(rrule_cache), 0)
+
+
+def legacy_occurrence_starts(event, start, end):
+    """
+    The three probe scan _get_occurrence_list used to do.
+    """
+    difference = event.end - event.start
+    tzinfo = start.tzinfo
+    if event.end_recurring_period and event.end_recurring_period < end:
+        end = event.end_recurring_period
+    rule = event.get_rrule_object(tzinfo)
+    start = (start - difference).replace(tzinfo=None)
+    end = (end - difference).replace(tzinfo=None)
+    o_starts = set()
+    for shift in (datetime.timedelta(0), difference // 2, difference):
+        for o_start in rule.between(start - shift, end - shift, inc=True):
+            o_starts.add(tzinfo.localize(o_start))
+    return o_starts
+
+
+class TestOccurrenceListScan(TestCase):
+    """
+    Compares the single pass scan of Event._get_occurrence_list against a
+    brute force walk of the rule and against the former three probe scan.
+    """
+    timezones = [pytz.utc, pytz.timezone('Europe/Amsterdam'), pytz.timezone('America/New_York')]
+    durations = {
+        'HOURLY': [0, 15, 60, 150, 24 * 60],
+        'DAILY': [0, 60, 24 * 60, 3 * 24 * 60],
+        'WEEKLY': [60, 24 * 60, 10 * 24 * 60, 20 * 24 * 60],
+    }
+
+    def setUp(self):
+        self.rules = dict((frequency, Rule.objects.create(frequency=frequency))
+                          for frequency in self.durations)
+
+    def brute_force_starts(self, event, start, end):
+        difference = event.end - event.start
+        tzinfo = start.tzinfo
+        o_starts = set()
+        # candidates more than two days off the window cannot overlap it
+        lower = (start - difference).astimezone(tzinfo).replace(tzinfo=None) - datetime.timedelta(days=2)
+        for o_start in event.get_rrule_object(tzinfo):
+            if o_start < lower:
+                continue
+            o_start = tzinfo.localize(o_start)
+            if o_start >= end or o_start > event.end_recurring_period:
+                break
+            if o_start + difference >= start:
+                o_starts.add(o_start)
+        return o_starts
+
+    def test_matches_brute_force_and_legacy_scan(self):
+        rnd = random.Random(2008)
+        for i in range(150):
+            frequency = rnd.choice(sorted(self.durations))
+            tzinfo = rnd.choice(self.timezones)
+            event_start = tzinfo.localize(datetime.datetime(2014, rnd.randint(1, 12), rnd.randint(1, 28),
+                                                            rnd.randint(0, 23), rnd.choice([0, 30])))
+            event = Event(
+                title='Random event',
+                start=event_start,
+                end=event_start + datetime.timedelta(minutes=rnd.choice(self.durations[frequency])),
+                end_recurring_period=event_start + datetime.timedelta(days=rnd.randint(1, 120)),
+                rule=self.rules[frequency],
+            )
+            start = event_start + datetime.timedelta(hours=rnd.randint(-100, 24 * 60), minutes=rnd.randint(0, 59))
+            end = start + datetime.timedelta(hours=rnd.randint(1, 24 * 40))
+            start = tzinfo.normalize(start)
+            end = tzinfo.normalize(end)
+
+            occurrences = event._get_occurrence_list(start, end)
+            o_starts = [o.start for o in occurrences]
+            self.assertEqual(len(o_starts), len(set(o_starts)))
+            self.assertEqual(o_starts, sorted(o_starts))
+            expected = self.brute_force_starts(event, start, end)
+            self.assertEqual(set(o_starts), expected)
+            # everything the former scan found inside the window is still
+            # found (it compared end_recurring_period by wall clock time,
+            # _occurrences_after_generator and the new scan compare instants)
+            legacy = set(o for o in legacy_occurrence_starts(event, start, end)
+                         if o < end and o + (event.end - event.start) >= start and
+                         o <= event.end_recurring_period)
+            self.assertTrue(legacy <= expected)
+
+    def test_long_event_has_no_gaps(self):
+        # an event lasting longer than twice the rule interval overlaps the
+        # window with occurrences the former probes could not reach
+        event = Event(
+            title='Long daily event',
+            start=datetime.datetime(2008, 1, 1, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 4, 8, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 2, 1, 0, 0, tzinfo=pytz.utc),
+            rule=self.rules['DAILY'],
+        )
+        start = datetime.datetime(2008, 1, 10, 0, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 1, 10, 12, 0, tzinfo=pytz.utc)
+        occurrences = event._get_occurrence_list(start, end)
+        self.assertEqual([o.start.day for o in occurrences], [7, 8, 9, 10])
+
+    def test_occurrence_starting_just_before_window_end(self):
+        event = Event(
+            title='Daily event',
+            start=datetime.datetime(2008, 1, 1, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 1, 9, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 2, 1, 0, 0, tzinfo=pytz.utc),
+            rule=self.rules['DAILY'],
+        )
+        occurrences = event._get_occurrence_list(datetime.datetime(2008, 1, 10, 0, 0, tzinfo=pytz.utc),
+                                                 datetime.datetime(2008, 1, 10, 8, 30, tzinfo=pytz.utc))
+        self.assertEqual([o.start for o in occurrences],
+                         [datetime.datetime(2008, 1, 10, 8, 0, tzinfo=pytz.utc)])
+
+    def test_hourly_occurrences_across_dst_are_unique(self):
+        tzinfo = pytz.timezone('Europe/Amsterdam')
+        event = Event(
+            title='Hourly event',
+            start=tzinfo.localize(datetime.datetime(2014, 3, 29, 0, 0)),
+            end=tzinfo.localize(datetime.datetime(2014, 3, 29, 0, 30)),
+            end_recurring_period=tzinfo.localize(datetime.datetime(2014, 4, 5, 0, 0)),
+            rule=self.rules['HOURLY'],
+        )
+        occurrences = event._get_occurrence_list(tzinfo.localize(datetime.datetime(2014, 3, 30, 0, 0)),
+                                                 tzinfo.localize(datetime.datetime(2014, 3, 30, 6, 0)))
+        o_starts = [o.start for o in occurrences]
+        self.assertEqual(len(o_starts), len(set(o_starts)))
+
+
+class TestOccurrencesBetween(TestCase):
+
+    def setUp(self):
+        self.calendar = Calendar.objects.create(name="MyCal")
+        self.rule = Rule.objects.create(frequency="DAILY")
+        self.start = datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 2, 8, tzinfo=pytz.utc)
+
+    def create_event(self, day):
+        return Event.objects.create(
+            title='Event %d' % day, description='', calendar=self.calendar, rule=self.rule,
+            start=datetime.datetime(2008, 1, day, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, day, 9, 0, tzinfo=pytz.utc))
+
+    def test_matches_get_occurrences(self):
+        events = [self.create_event(day) for day in range(1, 4)]
+        events[0].get_occurrence(datetime.datetime(2008, 2, 2, 8, 0, tzinfo=pytz.utc)).move(
+            datetime.datetime(2008, 3, 2, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 3, 2, 9, 0, tzinfo=pytz.utc))
+        events[1].get_occurrence(datetime.datetime(2008, 3, 3, 8, 0, tzinfo=pytz.utc)).move(
+            datetime.datetime(2008, 2, 3, 12, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 2, 3, 13, 0, tzinfo=pytz.utc))
+        events[2].get_occurrence(datetime.datetime(2008, 2, 4, 8, 0, tzinfo=pytz.utc)).cancel()
+        expected = []
+        for event in events:
+            expected += event.get_occurrences(self.start, self.end)
+        occurrences = Event.objects.occurrences_between(Event.objects.all(), self.start, self.end)
+        self.assertEqual([(o.event_id, o.id, o.start, o.end, o.cancelled) for o in occurrences],
+                         [(o.event_id, o.id, o.start, o.end, o.cancelled) for o in sorted(expected)])
+        self.assertEqual(len(occurrences), 21)
+
+    def test_query_count_does_not_depend_on_events(self):
+        for day in range(1, 11):
+            event = self.create_event(day)
+            event.get_occurrence(datetime.datetime(2008, 2, 5, 8, 0, tzinfo=pytz.utc)).cancel()
+        with self.assertNumQueries(2):
+            occurrences = Event.objects.occurrences_between(Event.objects.all(), self.start, self.end)
+            [(o.title, o.event.rule) for o in occurrences]
+        self.assertEqual(len(occurrences), 70)
+
+    def test_iter_in_chunks(self):
+        events = [self.create_event(day) for day in range(1, 6)]
+        events[3].get_occurrence(datetime.datetime(2008, 3, 3, 8, 0, tzinfo=pytz.utc)).move(
+            datetime.datetime(2008, 2, 3, 12, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 2, 3, 13, 0, tzinfo=pytz.utc))
+        expected = Event.objects.occurrences_between(Event.objects.all(), self.start, self.end)
+        # the events, then the persisted occurrences of each chunk
+        with self.assertNumQueries(4):
+            occurrences = list(Event.objects.iter_occurrences_between(
+                Event.objects.all(), self.start, self.end, chunk_size=2))
+        self.assertEqual(sorted((o.event_id, o.start, bool(o.id)) for o in occurrences),
+                         sorted((o.event_id, o.start, bool(o.id)) for o in expected))
+        self.assertEqual(len(occurrences), 36)
+
+
+class TestInRange(TestCase):
+
+    def setUp(self):
+        self.calendar = Calendar.objects.create(name="MyCal")
+        self.weekly = Rule.objects.create(frequency="WEEKLY")
+        self.start = datetime.datetime(2012, 6, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2012, 7, 1, tzinfo=pytz.utc)
+
+    def create_event(self, title, start, rule=None, end_recurring_period=None):
+        return Event.objects.create(
+            title=title, calendar=self.calendar, rule=rule, end_recurring_period=end_recurring_period,
+            start=start, end=start + datetime.timedelta(hours=2))
+
+    def test_prefilter(self):
+        dates = [datetime.datetime(year, month, 28, 22, 30, tzinfo=pytz.utc)
+                 for year in (2008, 2012) for month in (5, 6, 7)]
+        kept = set()
+        for date in dates:
+            self.create_event('once', date)
+            if self.start - datetime.timedelta(hours=2) < date < self.end:
+                kept.add(('once', date))
+            self.create_event('ended', date - datetime.timedelta(days=100), self.weekly, date)
+            if self.start - datetime.timedelta(hours=2) < date:
+                kept.add(('ended', date - datetime.timedelta(days=100)))
+            self.create_event('weekly', date, self.weekly)
+            if date < self.end:
+                kept.add(('weekly', date))
+        moved = self.create_event('moved', dates[0])
+        moved.get_occurrence(dates[0]).move(self.start, self.start + datetime.timedelta(hours=1))
+        kept.add(('moved', dates[0]))
+        events = Event.objects.in_range(Event.objects.all(), self.start, self.end)
+        self.assertEqual(set((event.title, event.start) for event in events), kept)
+
+    def test_occurrences_match_full_expansion(self):
+        generator = random.Random(2012)
+        tzinfo = pytz.timezone('Europe/Amsterdam')
+        for i in range(40):
+            start = datetime.datetime(2011, 1, 1, tzinfo=pytz.utc) + datetime.timedelta(
+                hours=generator.randint(0, 24 * 700))
+            end_recurring_period = None
+            if generator.random() < 0.7:
+                end_recurring_period = start + datetime.timedelta(hours=generator.randint(0, 24 * 200))
+            self.create_event('event %d' % i, start, generator.choice([None, self.weekly]), end_recurring_period)
+        for i in range(30):
+            start = tzinfo.localize(datetime.datetime(2011, 1, 1) + datetime.timedelta(
+                days=generator.randint(0, 800)))
+            end = start + datetime.timedelta(days=generator.choice([1, 7, 31]))
+            expected = []
+            for event in Event.objects.all():
+                expected += event.get_occurrences(start, end)
+            occurrences = Event.objects.occurrences_between(Event.objects.all(), start, end)
+            self.assertEqual([(o.event_id, o.start) for o in occurrences],
+                             [(o.event_id, o.start) for o in sorted(expected)])
+
+
+def legacy_effective_range(event):
+    """
+    The walk over every occurrence effective_start and effective_end used to do.
+    """
+    difference = event.end - event.start
+    first = last = None
+    for o_start in event.get_rrule_object(pytz.utc):
+        o_start = pytz.utc.localize(o_start)
+        if o_start > event.end_recurring_period:
+            break
+        if o_start + difference > event.start:
+            first = first or o_start
+            last = o_start + difference
+    return first, last
+
+
+class TestEffectiveRange(TestCase):
+
+    def create_event(self, frequency, params=None, **kwargs):
+        data = {
+            'title': 'Recurring event',
+            'start': datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            'end_recurring_period': datetime.datetime(2010, 5, 5, 0, 0, tzinfo=pytz.utc),
+            'rule': Rule.objects.create(frequency=frequency, params=params),
+            'calendar': Calendar.objects.create(name="MyCal"),
+        }
+        data.update(kwargs)
+        return Event.objects.create(**data)
+
+    def test_matches_walk(self):
+        events = [
+            self.create_event('HOURLY'),
+            self.create_event('DAILY', 'interval:3'),
+            self.create_event('WEEKLY', 'byweekday:5,6'),
+            self.create_event('MONTHLY', 'bymonthday:5,20;count:7'),
+            self.create_event('YEARLY'),
+            self.create_event('DAILY', end=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)),
+            self.create_event('DAILY', end_recurring_period=datetime.datetime(2008, 1, 5, 7, 0, tzinfo=pytz.utc)),
+            self.create_event('WEEKLY', 'byweekday:0'),
+        ]
+        for event in events:
+            event = Event.objects.get(pk=event.pk)
+            expected = legacy_effective_range(event)
+            self.assertEqual((event.effective_start, event.effective_end), expected)
+            self.assertEqual((event.first_occurrence_start, event.last_occurrence_end), expected)
+        self.assertEqual(legacy_effective_range(events[-1]), (None, None))
+
+    def test_migration_matches_models(self):
+        # 0004 computes the bounds of the existing rows with its own copy
+        migration = import_module('schedule.migrations.0004_event_occurrence_bounds')
+        amsterdam = pytz.timezone('Europe/Amsterdam')
+        events = [
+            self.create_event('HOURLY'),
+            self.create_event('DAILY', 'interval:3'),
+            self.create_event('WEEKLY', 'byweekday:5,6'),
+            self.create_event('MONTHLY', 'bymonthday:5,20;count:7'),
+            self.create_event('WEEKLY', 'byweekday:0'),
+            self.create_event('DAILY', end_recurring_period=None),
+            self.create_event('DAILY', start=amsterdam.localize(datetime.datetime(2008, 3, 1, 8, 0)),
+                              end=amsterdam.localize(datetime.datetime(2008, 3, 1, 9, 0))),
+            Event.objects.create(title='Once', start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+                                 end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc)),
+        ]
+        # rows are read back in UTC, whatever zone the events were saved in
+        expected = [Event.objects.get(pk=event.pk)._compute_occurrence_bounds() for event in events]
+        Event.objects.update(first_occurrence_start=None, last_occurrence_end=None)
+        migration.compute_occurrence_bounds(apps, None)
+        for event, bounds in zip(events, expected):
+            event = Event.objects.get(pk=event.pk)
+            self.assertEqual((event.first_occurrence_start, event.last_occurrence_end), bounds)
+
+    def test_unbounded_events(self):
+        event = self.create_event('DAILY', end_recurring_period=None)
+        self.assertEqual((event.effective_start, event.effective_end), (event.start, datetime.datetime.max))
+        self.assertEqual((event.first_occurrence_start, event.last_occurrence_end), (event.start, None))
+        single = Event.objects.create(title='Once', start=event.start, end=event.end)
+        self.assertEqual((single.first_occurrence_start, single.last_occurrence_end), (event.start, event.end))
+        self.assertIsNone(Event(start=event.start, end=event.end).effective_start)
+
+    def test_range_is_cached_until_save(self):
+        event = self.create_event('HOURLY')
+        end = event.effective_end
+        event.get_rrule_object = None
+        self.assertEqual(event.effective_end, end)
+        del event.get_rrule_object
+        event.end_recurring_period = datetime.datetime(2009, 1, 1, 0, 0, tzinfo=pytz.utc)
+        event.save()
+        self.assertEqual(event.effective_end, datetime.datetime(2009, 1, 1, 1, 0, tzinfo=pytz.utc))
+        self.assertEqual(event.last_occurrence_end, event.effective_end)
+
+    def test_rule_save_updates_bounds(self):
+        event = self.create_event('DAILY', 'count:3')
+        self.assertEqual(event.last_occurrence_end, datetime.datetime(2008, 1, 7, 9, 0, tzinfo=pytz.utc))
+        event.rule.params = 'count:5'
+        event.rule.save()
+        self.assertEqual(Event.objects.get(pk=event.pk).last_occurrence_end,
+                         datetime.datetime(2008, 1, 9, 9, 0, tzinfo=pytz.utc))
+
+
 class TestEventRelationManager(TestCase):
 
     def test_get_events_for_object(self):
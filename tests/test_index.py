@@ -0,0 +1,125 @@
+import datetime
+import json
+import threading
+import pytz
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from schedule.conf import settings
+from schedule.models import Calendar, Event, Occurrence, OccurrenceIndex, OccurrenceIndexWindow, Rule
+from schedule import signals
+from schedule.periods import Month
+
+
+class TestOccurrenceIndex(TestCase):
+
+    def setUp(self):
+        settings.OCCURRENCE_INDEX = True
+        self.now = datetime.datetime(2015, 6, 15, 12, 0, tzinfo=pytz.utc)
+        self.calendar = Calendar.objects.create(name="MyCal", slug="mycal")
+        self.rule = Rule.objects.create(frequency="WEEKLY")
+        self.event = Event.objects.create(
+            title='Weekly', calendar=self.calendar, rule=self.rule,
+            start=datetime.datetime(2015, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2015, 1, 5, 9, 0, tzinfo=pytz.utc))
+        self.single = Event.objects.create(
+            title='Once', calendar=self.calendar,
+            start=datetime.datetime(2015, 6, 3, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2015, 6, 3, 9, 0, tzinfo=pytz.utc))
+
+    def tearDown(self):
+        settings.OCCURRENCE_INDEX = False
+
+    def live_occurrences(self, date):
+        settings.OCCURRENCE_INDEX = False
+        try:
+            return sorted(Month(Event.objects.all(), date).occurrences)
+        finally:
+            settings.OCCURRENCE_INDEX = True
+
+    def assertSameOccurrences(self, first, second):
+        self.assertEqual([(o.event_id, o.id, o.start, o.end, o.cancelled) for o in first],
+                         [(o.event_id, o.id, o.start, o.end, o.cancelled) for o in second])
+
+    def test_disabled_index_is_not_used(self):
+        settings.OCCURRENCE_INDEX = False
+        self.assertIsNone(OccurrenceIndex.objects.rebuild(self.now))
+        self.assertIsNone(OccurrenceIndex.objects.occurrences_between(
+            Event.objects.all(), self.now, self.now + datetime.timedelta(days=7)))
+        self.assertEqual(OccurrenceIndex.objects.count(), 0)
+
+    def test_unbuilt_index_falls_back(self):
+        self.assertIsNone(OccurrenceIndex.objects.occurrences_between(
+            Event.objects.all(), self.now, self.now + datetime.timedelta(days=7)))
+
+    def test_period_uses_index(self):
+        window = OccurrenceIndex.objects.rebuild(self.now)
+        self.assertEqual(window.start, datetime.datetime(2013, 12, 14, tzinfo=pytz.utc))
+        expected = self.live_occurrences(self.now)
+        with self.assertNumQueries(2):
+            occurrences = Month(Event.objects.all(), self.now).occurrences
+        self.assertSameOccurrences(occurrences, expected)
+        self.assertEqual(len(occurrences), 6)
+
+    def test_outside_window_falls_back(self):
+        OccurrenceIndex.objects.rebuild(self.now)
+        date = datetime.datetime(2017, 6, 1, tzinfo=pytz.utc)
+        self.assertIsNone(OccurrenceIndex.objects.occurrences_between(
+            Event.objects.all(), date, date + datetime.timedelta(days=7)))
+        self.assertEqual(len(Month(Event.objects.all(), date).occurrences), 4)
+
+    @override_settings(TIME_ZONE='Europe/Amsterdam')
+    def test_other_timezone_uses_index(self):
+        OccurrenceIndex.objects.rebuild(self.now)
+        self.assertEqual(OccurrenceIndexWindow.objects.get().tzname, 'Europe/Amsterdam')
+        url = reverse('api_occurences') + '?calendar_slug=mycal&start=2015-06-01&end=2015-06-08'
+        with CaptureQueriesContext(connection) as queries:
+            occurrences = json.loads(self.client.get(url).content.decode())
+        self.assertIn('schedule_occurrenceindex', queries[-1]['sql'])
+        # expanded in Amsterdam, the weekly event keeps starting at 9:00 there
+        self.assertEqual([o['start'] for o in occurrences], ['2015-06-01T07:00:00+00:00', '2015-06-03T08:00:00+00:00'])
+
+    def test_saves_update_index(self):
+        OccurrenceIndex.objects.rebuild(self.now)
+        occurrence = self.event.get_occurrence(datetime.datetime(2015, 6, 8, 8, 0, tzinfo=pytz.utc))
+        occurrence.move(datetime.datetime(2015, 7, 2, 8, 0, tzinfo=pytz.utc),
+                        datetime.datetime(2015, 7, 2, 9, 0, tzinfo=pytz.utc))
+        cancelled = self.event.get_occurrence(datetime.datetime(2015, 6, 15, 8, 0, tzinfo=pytz.utc))
+        cancelled.cancel()
+        self.single.start = datetime.datetime(2015, 6, 4, 8, 0, tzinfo=pytz.utc)
+        self.single.end = datetime.datetime(2015, 6, 4, 9, 0, tzinfo=pytz.utc)
+        self.single.save()
+        self.rule.params = 'interval:2'
+        self.rule.save()
+        for date in (self.now, datetime.datetime(2015, 7, 1, tzinfo=pytz.utc)):
+            self.assertSameOccurrences(Month(Event.objects.all(), date).occurrences,
+                                       self.live_occurrences(date))
+        occurrence.delete()
+        self.assertSameOccurrences(Month(Event.objects.all(), self.now).occurrences,
+                                   self.live_occurrences(self.now))
+
+    def test_deletions_of_other_threads_are_ignored(self):
+        OccurrenceIndex.objects.rebuild(self.now)
+        occurrence = self.event.get_occurrence(datetime.datetime(2015, 6, 8, 8, 0, tzinfo=pytz.utc))
+        occurrence.cancel()
+        occurrence = Occurrence.objects.get(event=self.event)
+        # another thread starts deleting the same event
+        thread = threading.Thread(target=signals.mark_deleted_event, args=(Event, self.event))
+        thread.start()
+        thread.join()
+        occurrence.delete()
+        row = OccurrenceIndex.objects.get(event=self.event, original_start=occurrence.original_start)
+        self.assertIsNone(row.occurrence_id)
+        self.assertFalse(row.cancelled)
+
+    def test_deleting_event_removes_rows(self):
+        OccurrenceIndex.objects.rebuild(self.now)
+        self.event.get_occurrence(datetime.datetime(2015, 6, 8, 8, 0, tzinfo=pytz.utc)).cancel()
+        pk = self.event.pk
+        self.event.delete()
+        self.assertFalse(OccurrenceIndex.objects.filter(event_id=pk).exists())
+        self.assertFalse(Occurrence.objects.exists())
+        self.assertEqual(OccurrenceIndexWindow.objects.count(), 1)
@@ -1,10 +1,13 @@
 import datetime
+import json
 import pytz
 
+from django.core import serializers
+from django.forms.models import model_to_dict
 from django.test import TestCase
 
 from schedule.models import Event, Rule, Calendar
-from schedule.models.events import Occurrence
+from schedule.models.events import Occurrence, OccurrenceView
 from schedule.periods import Period
 
 
@@ -81,6 +84,39 @@ class TestOccurrence(TestCase):
         self.assertNotEqual(self.recurring_event.get_occurrences(start=self.start, end=self.end)[0],
                             event2)
 
+    def test_loading_does_not_fetch_events(self):
+        for occurrence in self.recurring_event.get_occurrences(start=self.start, end=self.end):
+            occurrence.save()
+        with self.assertNumQueries(1):
+            occurrences = list(Occurrence.objects.all())
+        self.assertEqual(len(occurrences), 3)
+        self.assertIsNone(occurrences[0]._description)
+        # the fallback to the event is read lazily
+        with self.assertNumQueries(1):
+            self.assertIsNone(occurrences[0].description)
+        self.recurring_event.description = 'Weekly'
+        self.recurring_event.save()
+        with self.assertNumQueries(1):
+            occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+            self.assertEqual([o.description for o in occurrences], ['Weekly'] * 3)
+        occurrences[0].description = 'Changed'
+        occurrences[0].save()
+        self.assertEqual(Occurrence.objects.get(pk=occurrences[0].pk).description, 'Changed')
+
+    def test_deferred_fallback(self):
+        occurrence = Occurrence.objects.create(event=self.recurring_event, start=self.start, end=self.end,
+                                               original_start=self.start, original_end=self.end)
+        Occurrence.objects.create(event=self.recurring_event, title='Own', start=self.start, end=self.end,
+                                  original_start=self.start, original_end=self.end)
+        # the occurrence, its deferred title and its event
+        with self.assertNumQueries(3):
+            self.assertEqual(Occurrence.objects.defer('title').get(pk=occurrence.pk).title, 'Recent Event')
+        self.assertEqual(Occurrence.objects.defer('title').get(title='Own').title, 'Own')
+        self.assertEqual(Occurrence.objects.filter(title__isnull=True).get().pk, occurrence.pk)
+        # forms and serializers see the column
+        self.assertIsNone(model_to_dict(occurrence)['title'])
+        self.assertIsNone(json.loads(serializers.serialize('json', [occurrence]))[0]['fields']['title'])
+
     def test_create_occurrence_without_event(self):
         """
         may be required for creating formsets, for example in admin
@@ -88,4 +124,56 @@ class TestOccurrence(TestCase):
         o = Occurrence()
 
 
+class TestOccurrenceView(TestCase):
+    def setUp(self):
+        rule = Rule.objects.create(frequency="WEEKLY")
+        cal = Calendar.objects.create(name="MyCal")
+        self.event = Event.objects.create(**{
+            'title': 'Recent Event',
+            'description': 'Weekly',
+            'start': datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            'end_recurring_period': datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc),
+            'rule': rule,
+            'calendar': cal
+        })
+        self.start = datetime.datetime(2008, 1, 12, 0, 0, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 1, 27, 0, 0, tzinfo=pytz.utc)
+
+    def test_generated_occurrences_are_views(self):
+        occurrence = self.event.get_occurrences(self.start, self.end)[0]
+        self.assertIsInstance(occurrence, OccurrenceView)
+        self.assertEqual(occurrence.title, 'Recent Event')
+        self.assertEqual(occurrence.description, 'Weekly')
+        self.assertEqual(occurrence.event_id, self.event.id)
+        self.assertEqual(occurrence.original_start, occurrence.start)
+        self.assertFalse(occurrence.moved)
+        self.assertFalse(occurrence.cancelled)
+        self.assertIsNone(occurrence.id)
+        self.assertEqual(occurrence.hours, 1)
+        with self.assertRaises(AttributeError):
+            occurrence.start = self.start
+        with self.assertRaises(AttributeError):
+            occurrence.color = 'red'
+
+    def test_same_surface_as_occurrence(self):
+        view = self.event.get_occurrences(self.start, self.end)[0]
+        model = view.to_occurrence()
+        self.assertIsInstance(model, Occurrence)
+        self.assertIsNone(model.pk)
+        self.assertEqual(view, model)
+        self.assertEqual(model, view)
+        self.assertEqual(str(view), str(model))
+        self.assertEqual(view.get_absolute_url(), model.get_absolute_url())
+        self.assertEqual(view.get_edit_url(), model.get_edit_url())
+        self.assertEqual(view.get_cancel_url(), model.get_cancel_url())
 
+    def test_promotion_persists_once(self):
+        view = self.event.get_occurrences(self.start, self.end)[0]
+        cancelled = view.cancel()
+        self.assertTrue(cancelled.pk)
+        uncancelled = view.uncancel()
+        self.assertEqual(uncancelled.pk, cancelled.pk)
+        self.assertEqual(Occurrence.objects.count(), 1)
+        self.assertIsNone(view.pk)
+        self.assertEqual(self.event.get_occurrences(self.start, self.end)[0].pk, cancelled.pk)
@@ -1,13 +1,17 @@
 from django.utils.six.moves.builtins import zip
 from django.utils.six.moves.builtins import range
 import datetime
+import random
 import pytz
 
 from django.test import TestCase
 from django.conf import settings
+from django.core.cache import caches
 
+from schedule import cache
+from schedule.conf import settings as schedule_settings
 from schedule.models import Event, Rule, Calendar
-from schedule.periods import Period, Month, Day, Year, Week
+from schedule.periods import Period, Month, Day, Year, Week, OccurrencePool, expansion_cache
 
 class TestPeriod(TestCase):
 
@@ -288,6 +292,215 @@ class TestOccurrencePool(TestCase):
         period = Period(parent_period.events, start, end, parent_period.get_persisted_occurrences(), parent_period.occurrences)
         self.assertEqual(parent_period.occurrences, period.occurrences)
 
+    def test_pool_between(self):
+        class Span(object):
+            def __init__(self, start, end):
+                self.start, self.end = start, end
+
+        random_state = random.Random(7)
+        base = datetime.datetime(2008, 1, 1, tzinfo=pytz.utc)
+        spans = []
+        for i in range(300):
+            start = base + datetime.timedelta(minutes=random_state.randint(0, 60 * 24 * 60))
+            length = datetime.timedelta(minutes=random_state.choice([0, 1, 30, 90, 600, 60 * 24 * 9]))
+            spans.append(Span(start, start + length))
+        pool = OccurrencePool(spans)
+        for i in range(200):
+            start = base + datetime.timedelta(minutes=random_state.randint(-600, 60 * 24 * 61))
+            end = start + datetime.timedelta(minutes=random_state.choice([0, 60, 60 * 24, 60 * 24 * 7]))
+            self.assertEqual(pool.between(start, end),
+                             [span for span in spans if span.start <= end and span.end >= start])
+
+    def test_sub_periods_from_pool(self):
+        month = Month(Event.objects.all(), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc))
+        for sub_periods in (month.get_weeks(), month.get_days()):
+            for period in sub_periods:
+                expected = [occurrence for occurrence in month.occurrences
+                            if occurrence.start <= period.utc_end and occurrence.end >= period.utc_start]
+                self.assertEqual(period.occurrences, expected)
+        for day in month.get_days():
+            self.assertEqual(day.occurrences, Period(Event.objects.all(), day.start, day.end).occurrences)
+        self.assertEqual(len(list(month.get_days())), 29)
+        self.assertEqual(len(list(month.get_weeks())), 5)
+
+
+class TestPeriodContext(TestCase):
+
+    def setUp(self):
+        rule = Rule.objects.create(frequency="WEEKLY")
+        cal = Calendar.objects.create(name="MyCal")
+        self.event = Event.objects.create(
+            title='Weekly', description='', calendar=cal, rule=rule,
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        occurrence = self.event.get_occurrence(datetime.datetime(2008, 3, 8, 8, 0, tzinfo=pytz.utc))
+        occurrence.move(datetime.datetime(2008, 3, 9, 8, 0, tzinfo=pytz.utc),
+                        datetime.datetime(2008, 3, 9, 9, 0, tzinfo=pytz.utc))
+
+    def test_sub_periods_share_context(self):
+        year = Year(Event.objects.all(), datetime.datetime(2008, 1, 1, tzinfo=pytz.utc))
+        month = next(year.get_months())
+        day = next(next(month.get_weeks()).get_days())
+        self.assertIs(month.context, year.context)
+        self.assertIs(day.context, year.context)
+        self.assertIs(day.get_persisted_occurrences(), year.get_persisted_occurrences())
+        self.assertEqual(len(year.get_persisted_occurrences()), 1)
+
+    def test_constant_queries_for_year(self):
+        year = Year(Event.objects.all(), datetime.datetime(2008, 1, 1, tzinfo=pytz.utc))
+        with self.assertNumQueries(2):
+            days = [day for month in year.get_months() for week in month.get_weeks()
+                    for day in week.get_days()
+                    if day.start.month == month.start.month and day.has_occurrences()]
+            year.get_persisted_occurrences()
+        self.assertEqual(year.context.queries, 2)
+        self.assertEqual(len(days), 52)
+        self.assertEqual([occurrence.start for occurrence in days[9].occurrences],
+                         [datetime.datetime(2008, 3, 9, 8, 0, tzinfo=pytz.utc)])
+
+
+class TestDayOccupancy(TestCase):
+
+    def setUp(self):
+        cal = Calendar.objects.create(name="MyCal")
+        rule = Rule.objects.create(frequency="DAILY", params="interval:3")
+        self.event = Event.objects.create(
+            title='Every third day', description='', calendar=cal, rule=rule,
+            start=datetime.datetime(2008, 1, 30, 22, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 31, 2, 0, tzinfo=pytz.utc))
+        Event.objects.create(
+            title='Two days', description='', calendar=cal,
+            start=datetime.datetime(2008, 2, 10, 10, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 2, 11, 20, 0, tzinfo=pytz.utc))
+        self.event.get_occurrence(datetime.datetime(2008, 2, 5, 22, 0, tzinfo=pytz.utc)).cancel()
+
+    def assertOccupancy(self, month):
+        for week in month.get_weeks():
+            for day in week.get_days():
+                if day.start.month != month.start.month:
+                    continue
+                self.assertIn((day.utc_start, day.utc_end), month.context.day_occupancy)
+                scanned = Day(Event.objects.all(), day.start, tzinfo=day.tzinfo)
+                self.assertEqual(day.occurrence_count(), scanned.occurrence_count())
+                self.assertEqual(day.has_occurrences(), scanned.has_occurrences())
+
+    def test_month_occupancy(self):
+        month = Month(Event.objects.all(), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc))
+        self.assertOccupancy(month)
+        self.assertEqual(month.get_day(11).occurrence_count(), 2)
+        self.assertEqual(month.get_day(5).occurrence_count(), 0)
+
+    def test_year_occupancy(self):
+        year = Year(Event.objects.all(), datetime.datetime(2008, 1, 1, tzinfo=pytz.utc))
+        for month in year.get_months():
+            self.assertEqual(len(year.context._occupancy_ranges), 1)
+        self.assertOccupancy(Month(Event.objects.all(), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc),
+                                   context=year.context))
+
+    def test_aware_month_occupancy(self):
+        tzinfo = pytz.timezone('America/Vancouver')
+        self.assertOccupancy(Month(Event.objects.all(), datetime.datetime(2008, 3, 1), tzinfo=tzinfo))
+
+
+class TestExpansionCache(TestCase):
+
+    def setUp(self):
+        # the cached expansions are keyed on the calendar versions
+        schedule_settings.OCCURRENCE_CACHE = 'default'
+        caches['default'].clear()
+        expansion_cache.maxsize = 16
+        cal = Calendar.objects.create(name="MyCal")
+        rule = Rule.objects.create(frequency="WEEKLY")
+        self.event = Event.objects.create(
+            title='Weekly', description='', calendar=cal, rule=rule,
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        Event.objects.create(
+            title='Once', description='', calendar=cal,
+            start=datetime.datetime(2008, 2, 29, 22, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 3, 1, 0, 0, tzinfo=pytz.utc))
+        # moved out of february, moved into it and cancelled
+        self.event.get_occurrence(datetime.datetime(2008, 2, 23, 8, 0, tzinfo=pytz.utc)).move(
+            datetime.datetime(2008, 3, 1, 8, 0, tzinfo=pytz.utc), datetime.datetime(2008, 3, 1, 9, 0, tzinfo=pytz.utc))
+        self.event.get_occurrence(datetime.datetime(2008, 3, 8, 8, 0, tzinfo=pytz.utc)).move(
+            datetime.datetime(2008, 2, 28, 8, 0, tzinfo=pytz.utc), datetime.datetime(2008, 2, 28, 9, 0, tzinfo=pytz.utc))
+        self.event.get_occurrence(datetime.datetime(2008, 2, 2, 8, 0, tzinfo=pytz.utc)).cancel()
+        cancelled = self.event.get_occurrence(datetime.datetime(2008, 3, 15, 8, 0, tzinfo=pytz.utc))
+        cancelled.move(datetime.datetime(2008, 2, 27, 8, 0, tzinfo=pytz.utc),
+                       datetime.datetime(2008, 2, 27, 9, 0, tzinfo=pytz.utc))
+        cancelled.cancel()
+
+    def tearDown(self):
+        schedule_settings.OCCURRENCE_CACHE = None
+        expansion_cache.maxsize = 0
+        expansion_cache.discard(lambda key: True)
+
+    def uncached(self, period):
+        schedule_settings.OCCURRENCE_CACHE = None
+        try:
+            return [(o.event_id, o.start, o.cancelled) for o in type(period)(
+                Event.objects.all(), period.start, tzinfo=period.tzinfo).occurrences]
+        finally:
+            schedule_settings.OCCURRENCE_CACHE = 'default'
+
+    def test_neighbours_hit_cache(self):
+        for tzinfo in (pytz.utc, pytz.timezone('America/Vancouver')):
+            for cls in (Month, Week, Day):
+                period = cls(Event.objects.all(), datetime.datetime(2008, 2, 29), tzinfo=tzinfo)
+                self.assertEqual([(o.event_id, o.start, o.cancelled) for o in period.occurrences],
+                                 self.uncached(period))
+                for neighbour in (period.prev(), next(period)):
+                    # only the calendars of the events are read
+                    with self.assertNumQueries(1):
+                        occurrences = neighbour.occurrences
+                    self.assertEqual([(o.event_id, o.start, o.cancelled) for o in occurrences],
+                                     self.uncached(neighbour))
+
+    def test_changes_miss_cache(self):
+        month = Month(Event.objects.all(), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc))
+        self.assertEqual(len(month.occurrences), 5)
+        self.event.get_occurrence(datetime.datetime(2008, 3, 22, 8, 0, tzinfo=pytz.utc)).cancel()
+        march = next(month)
+        with self.assertNumQueries(3):
+            occurrences = march.occurrences
+        self.assertEqual([(o.event_id, o.start, o.cancelled) for o in occurrences], self.uncached(march))
+        self.assertEqual(len(expansion_cache), 2)
+
+    def test_cached_occurrences_are_copied(self):
+        date = datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)
+        for occurrence in Month(Event.objects.all(), date).occurrences:
+            occurrence.event.title = 'Changed'
+            if occurrence.pk is not None:
+                occurrence.title = 'Changed'
+        occurrences = Month(Event.objects.all(), date).occurrences
+        self.assertEqual(set(o.title for o in occurrences), set(['Weekly', 'Once']))
+        self.assertEqual(set(o.event.title for o in occurrences), set(['Weekly', 'Once']))
+
+    def test_lists_are_not_cached(self):
+        Month(list(Event.objects.all()), datetime.datetime(2008, 2, 1, tzinfo=pytz.utc)).occurrences
+        self.assertEqual(len(expansion_cache), 0)
+
+    def test_years_expand_alone(self):
+        date = datetime.datetime(2008, 3, 1, tzinfo=pytz.utc)
+        self.assertIsNone(Year(Event.objects.all(), date)._get_prefetch_window())
+        month = Month(Event.objects.all(), date)
+        self.assertEqual(month._get_prefetch_window(), (month.prev().start, next(month).end))
+
+    def test_disabled_expansion_cache_expands_the_period(self):
+        expansion_cache.maxsize = 0
+        march = Month(Event.objects.all(), datetime.datetime(2008, 3, 1, tzinfo=pytz.utc))
+        march.occurrences
+        # the entry of the month itself, found after looking up the calendars
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(cache.occurrences_between(Event.objects.all(), march.start, march.end))
+
+    def test_neighbour_starts(self):
+        for tzinfo in (pytz.utc, pytz.timezone('America/Vancouver')):
+            for cls in (Year, Month, Week, Day):
+                period = cls(Event.objects.all(), datetime.datetime(2008, 3, 1), tzinfo=tzinfo)
+                self.assertEqual(period.prev_start(), period.prev().start)
+                self.assertEqual(period.next_start(), next(period).start)
+
 
 class TestAwareDay(TestCase):
     def setUp(self):
@@ -406,6 +619,11 @@ class TestAwareYear(TestCase):
         self.assertEqual(start, self.year.start)
         self.assertEqual(end, self.year.end)
 
+    def test_positional_tzinfo(self):
+        year = Year(Event.objects.all(), self.timezone.localize(datetime.datetime(2013, 12, 17, 9, 0)),
+                    None, self.timezone)
+        self.assertEqual((year.tzinfo, year.start), (self.timezone, self.year.start))
+
 class TestStrftimeRefactor(TestCase):
     """
         Test for the refactor of strftime
@@ -1,10 +1,14 @@
 # coding=utf-8
+import datetime
+import pytz
+
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.utils import timezone
 from schedule.models.calendars import Calendar
 from schedule.models.events import Event, Occurrence
+from schedule.models.rules import Rule
 from schedule import utils
 
 
@@ -88,3 +92,41 @@ class TestPermissions(TestCase):
 
         utils.CHECK_EVENT_PERM_FUNC = default_event_check
         utils.CHECK_CALENDAR_PERM_FUNC = default_cal_check
+
+    def test_checks_run_once_per_request(self):
+        calls = []
+
+        def check_event_perms(ob, user):
+            calls.append(('event', ob))
+            return True
+
+        def check_calendar_perms(ob, user):
+            calls.append(('calendar', ob))
+            return True
+
+        default_event_check = utils.CHECK_EVENT_PERM_FUNC
+        default_cal_check = utils.CHECK_CALENDAR_PERM_FUNC
+        utils.CHECK_EVENT_PERM_FUNC = check_event_perms
+        utils.CHECK_CALENDAR_PERM_FUNC = check_calendar_perms
+        try:
+            self.client.login(username='ann', password='ann')
+            hourly = Event.objects.create(
+                title='hourly', calendar=self.cal1, rule=Rule.objects.create(frequency='HOURLY'),
+                start=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+                end=datetime.datetime(2008, 1, 5, 9, 30, tzinfo=pytz.utc),
+                end_recurring_period=datetime.datetime(2008, 1, 5, 12, 0, tzinfo=pytz.utc))
+            response = self.client.get(reverse('day_calendar', kwargs={'calendar_slug': self.cal1.slug}),
+                                       {'year': 2008, 'month': 1, 'day': 5})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(sorted(set(calls), key=calls.index), [
+                ('event', None), ('calendar', self.cal1), ('event', hourly)])
+            self.assertEqual(len(calls), 3)
+
+            # the session, the user, the event shared by the decorator and
+            # the view, its calendar and the rule choices of the form
+            with self.assertNumQueries(5):
+                self.client.get(reverse('edit_event', kwargs={'calendar_slug': self.cal1.slug,
+                                                              'event_id': self.event1.id}))
+        finally:
+            utils.CHECK_EVENT_PERM_FUNC = default_event_check
+            utils.CHECK_CALENDAR_PERM_FUNC = default_cal_check
@@ -1,6 +1,11 @@
+import datetime
+import random
+
+from dateutil import rrule
 from django.test import TestCase
+import pytz
 
-from schedule.models import Rule
+from schedule.models import Event, Rule, FixedIntervalRule
 
 class TestPeriod(TestCase):
 
@@ -11,3 +16,53 @@ class TestPeriod(TestCase):
         rule = Rule(params = "count:1;bysecond:1;byminute:1,2,4,5")
         expected =  {'count': 1, 'byminute': [1, 2, 4, 5], 'bysecond': 1}
         self.assertEqual(rule.get_params(), expected)
+
+
+class TestFixedIntervalRule(TestCase):
+
+    def test_matches_rrule(self):
+        generator = random.Random(2016)
+        frequencies = ['WEEKLY', 'DAILY', 'HOURLY', 'MINUTELY', 'SECONDLY']
+        for i in range(300):
+            frequency = generator.choice(frequencies)
+            params = {}
+            if generator.random() < 0.5:
+                params['interval'] = generator.randint(1, 5)
+            if generator.random() < 0.3:
+                params['count'] = generator.randint(0, 50)
+            dtstart = datetime.datetime(2015, 1, 1) + datetime.timedelta(
+                seconds=generator.randint(0, 86400 * 60), microseconds=generator.randint(0, 999999))
+            frequency_code = Rule(frequency=frequency).rrule_frequency()
+            expected = rrule.rrule(frequency_code, dtstart=dtstart, **params)
+            rule = FixedIntervalRule.from_params(frequency, dtstart, params)
+            span = {'WEEKLY': 86400 * 100, 'DAILY': 86400 * 20, 'HOURLY': 86400,
+                    'MINUTELY': 3600, 'SECONDLY': 120}[frequency]
+            for j in range(5):
+                # probe exact occurrence starts as well as arbitrary instants
+                if j % 2 and list(expected[:1]):
+                    after = generator.choice(list(expected[:20]))
+                else:
+                    after = dtstart + datetime.timedelta(seconds=generator.randint(-span, span),
+                                                         microseconds=generator.randint(0, 999999))
+                before = after + datetime.timedelta(seconds=generator.randint(0, span))
+                for inc in (True, False):
+                    self.assertEqual(rule.between(after, before, inc=inc),
+                                     expected.between(after, before, inc=inc))
+                    self.assertEqual(rule.after(after, inc=inc), expected.after(after, inc=inc))
+                    self.assertEqual(rule.before(before, inc=inc), expected.before(before, inc=inc))
+            self.assertEqual(list(rule[:30]), list(expected[:30]))
+            self.assertEqual(rule[3:12:2], expected[3:12:2])
+            if 'count' in params:
+                self.assertEqual(list(rule), list(expected))
+                self.assertEqual(rule.count(), expected.count())
+
+    def test_only_plain_rules_use_it(self):
+        start = datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc)
+        for frequency, params, fixed in (('DAILY', None, True),
+                                         ('WEEKLY', 'interval:2;count:10', True),
+                                         ('HOURLY', 'byhour:8,9', False),
+                                         ('MONTHLY', None, False),
+                                         ('DAILY', 'interval:1,2', False)):
+            event = Event(rule=Rule(frequency=frequency, params=params), start=start, end=end)
+            self.assertEqual(isinstance(event.get_rrule_object(pytz.utc), FixedIntervalRule), fixed)
@@ -6,7 +6,7 @@ from django.utils.html import escape
 from schedule.models import Event, Rule, Calendar
 from schedule.periods import Period, Day
 
-from schedule.templatetags.scheduletags import querystring_for_date, prev_url, next_url, create_event_url
+from schedule.templatetags.scheduletags import querystring_for_date, prev_url, next_url, create_event_url, _cook_slots
 
 
 class TestTemplateTags(TestCase):
@@ -70,3 +70,19 @@ class TestTemplateTags(TestCase):
         query_string = create_event_url(context, self.cal, slot.start)
         expected = ('/event/create/MyCalSlug/?year={0}&month=1&day=4&hour=7&minute=0&second=0'.format(datetime.datetime.now().year))
         self.assertEqual(query_string['create_event_url'], escape(expected))
+
+    def test_cook_slots(self):
+        year = datetime.datetime.now().year
+        Event.objects.create(title='Lunch', calendar=self.cal,
+                             start=datetime.datetime(year, 1, 12, 11, 45, tzinfo=pytz.utc),
+                             end=datetime.datetime(year, 1, 12, 13, 0, tzinfo=pytz.utc))
+        day = Day(Event.objects.all(), datetime.datetime(year, 1, 12, tzinfo=pytz.utc))
+        with self.assertNumQueries(2):
+            day_part = day.get_time_slot(day.start + datetime.timedelta(hours=8),
+                                         day.start + datetime.timedelta(hours=20))
+            slots = _cook_slots(day_part, 15)
+        self.assertEqual(len(slots), 48)
+        self.assertEqual(slots[0].start, datetime.datetime(year, 1, 12, 8, 0, tzinfo=pytz.utc))
+        self.assertEqual(slots[-1].end, datetime.datetime(year, 1, 12, 20, 0, tzinfo=pytz.utc))
+        self.assertEqual([slot.start.hour * 60 + slot.start.minute for slot in slots if slot.occurrences],
+                         [480, 495, 510, 525, 540, 705, 720, 735, 750, 765, 780])
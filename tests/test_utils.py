@@ -1,10 +1,12 @@
 import datetime
+import itertools
+import pytz
 
 from django.test import TestCase
 from django.utils import timezone
 
-from schedule.models import Event, Rule, Calendar
-from schedule.utils import EventListManager
+from schedule.models import Event, Rule, Calendar, Occurrence
+from schedule.utils import EventListManager, OccurrenceReplacer, localize_all
 
 
 class TestEventListManager(TestCase):
@@ -47,3 +49,80 @@ class TestEventListManager(TestCase):
         self.assertEqual(next(occurrences).event, self.event1)
         occurrences = eml.occurrences_after()
         self.assertEqual(list(occurrences), [])
+
+    def test_persisted_occurrences_keep_their_event(self):
+        self.event2.get_occurrence(datetime.datetime(2008, 1, 6, 9, 0, tzinfo=self.default_tzinfo)).cancel()
+        eml = EventListManager([self.event1, self.event2])
+        with self.assertNumQueries(1):
+            occurrences = eml.occurrences_after(datetime.datetime(2008, 1, 6, 0, 0, tzinfo=self.default_tzinfo))
+            occurrence = next(occurrences)
+            self.assertTrue(occurrence.cancelled)
+            self.assertEqual((occurrence.event, occurrence.title), (self.event2, 'Recent Event'))
+
+    def test_ended_events_are_not_expanded(self):
+        def expand(after):
+            self.fail("the rule of an ended event was expanded")
+        self.event2._occurrences_after_generator = expand
+        eml = EventListManager([self.event1, self.event2])
+        occurrences = list(eml.occurrences_after(datetime.datetime(2009, 6, 1, 0, 0, tzinfo=self.default_tzinfo)))
+        self.assertEqual(len(occurrences), 18)
+        self.assertTrue(all(o.event == self.event1 for o in occurrences))
+        eml = EventListManager(Event.objects.filter(pk__in=[self.event1.pk, self.event2.pk]))
+        occurrences = eml.occurrences_after(datetime.datetime(2009, 6, 1, 0, 0, tzinfo=self.default_tzinfo))
+        self.assertEqual(len(list(occurrences)), 18)
+
+    def test_persisted_occurrences_are_loaded_by_chunk(self):
+        moved = self.event2.get_occurrence(datetime.datetime(2009, 4, 20, 9, 0, tzinfo=self.default_tzinfo))
+        moved.move(moved.start + datetime.timedelta(minutes=30), moved.end + datetime.timedelta(minutes=30))
+        eml = EventListManager([self.event1, self.event2])
+        eml.chunk = datetime.timedelta(days=7)
+        occurrences = eml.occurrences_after(datetime.datetime(2009, 4, 1, 0, 0, tzinfo=self.default_tzinfo))
+        with self.assertNumQueries(1):
+            first = list(itertools.islice(occurrences, 8))
+        self.assertEqual([o.start.day for o in first], [1, 1, 2, 3, 4, 5, 6, 7])
+        # one more chunk from April 8, and one from April 15
+        with self.assertNumQueries(2):
+            occurrence = list(itertools.islice(occurrences, 15))[-1]
+        self.assertEqual(occurrence.pk, moved.pk)
+        self.assertEqual(occurrence.start.minute, 30)
+
+
+class TestOccurrenceReplacer(TestCase):
+
+    def occurrence(self, day, moved_to=None, cancelled=False, hours=1):
+        original_start = datetime.datetime(2008, 1, day, 8, 0, tzinfo=pytz.utc)
+        start = datetime.datetime(2008, 1, moved_to or day, 8, 0, tzinfo=pytz.utc)
+        return Occurrence(event_id=1, start=start, end=start + datetime.timedelta(hours=hours),
+                          original_start=original_start, original_end=original_start + datetime.timedelta(hours=1),
+                          cancelled=cancelled)
+
+    def test_additional_occurrences(self):
+        occurrences = [self.occurrence(day, moved_to=day + 10) for day in range(1, 10)]
+        long_one = self.occurrence(2, moved_to=3, hours=72)
+        cancelled = self.occurrence(20, moved_to=14, cancelled=True)
+        replacer = OccurrenceReplacer(occurrences + [long_one, cancelled])
+        start = datetime.datetime(2008, 1, 14, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 1, 17, tzinfo=pytz.utc)
+        self.assertEqual([o.start.day for o in replacer.get_additional_occurrences(start, end)], [14, 15, 16])
+        self.assertEqual(replacer.get_occurrence(self.occurrence(5)).start.day, 15)
+        self.assertEqual([o.start.day for o in replacer.get_additional_occurrences(start, end)], [14, 16])
+        start = datetime.datetime(2008, 1, 5, tzinfo=pytz.utc)
+        self.assertEqual(replacer.get_additional_occurrences(start, start + datetime.timedelta(days=1)), [long_one])
+        self.assertEqual(OccurrenceReplacer([]).get_additional_occurrences(start, end), [])
+
+
+class TestLocalizeAll(TestCase):
+
+    def test_matches_localize(self):
+        for zone in ('UTC', 'Europe/Amsterdam', 'America/Sao_Paulo', 'Australia/Lord_Howe', 'Asia/Kolkata'):
+            tzinfo = pytz.timezone(zone)
+            for step in (datetime.timedelta(minutes=97), datetime.timedelta(hours=7),
+                         datetime.timedelta(days=1)):
+                start = datetime.datetime(2014, 1, 1, 0, 10)
+                dates = [start + step * i for i in range(int(400 * 86400 / step.total_seconds()))]
+                localized = localize_all(tzinfo, dates)
+                self.assertEqual([(d, d.tzinfo) for d in localized],
+                                 [(d, d.tzinfo) for d in (tzinfo.localize(date) for date in dates)])
+
+    def test_empty(self):
+        self.assertEqual(localize_all(pytz.timezone('Europe/Amsterdam'), []), [])
@@ -1,14 +1,19 @@
+import json
 import pytz
 import datetime
 
 from django.test.utils import override_settings
 from django.test import TestCase
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
+from django.db import models
 
 from schedule.models.calendars import Calendar
-from schedule.models.events import Event
+from schedule.models.events import Event, Occurrence
 from schedule.models.rules import Rule
 
+from schedule import utils, views
+from schedule.conf import settings
 from schedule.views import coerce_date_dict
 
 from schedule.conf.settings import USE_FULLCALENDAR
@@ -34,6 +39,12 @@ class TestViews(TestCase):
         url = reverse('day_calendar', kwargs={'calendar_slug': self.calendar.slug})
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
+        settings.OCCURRENCE_CACHE = 'default'
+        try:
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        finally:
+            settings.OCCURRENCE_CACHE = None
 
         self.client.login(username="admin", password="admin")
 
@@ -87,6 +98,19 @@ class TestUrls(TestCase):
                          (datetime.datetime(2000, 11, 1, 0, 0, tzinfo=pytz.utc),
                           datetime.datetime(2000, 12, 1, 0, 0, tzinfo=pytz.utc)))
 
+    def test_fixture_events_are_expanded(self):
+        # loaddata saves the events raw, without calling Event.save
+        self.assertFalse(Event.objects.filter(first_occurrence_start__isnull=True).exists())
+        for bounds in ('computed', 'unknown'):
+            response = self.client.get(reverse("month_calendar", kwargs={"calendar_slug": 'example'}),
+                                       {'year': 2008, 'month': 11})
+            self.assertEqual(len(response.context[0]["periods"]['month'].get_occurrences()), 13)
+            response = self.client.get(reverse('api_occurences'), {
+                'calendar_slug': 'example', 'start': '2008-11-01', 'end': '2008-12-01'})
+            self.assertEqual(len(json.loads(response.content.decode())), 13)
+            # as for the rows written by bulk_create
+            Event.objects.update(first_occurrence_start=None, last_occurrence_end=None)
+
     def test_event_creation_anonymous_user(self):
         self.response = self.client.get(reverse("calendar_create_event",
                                       kwargs={"calendar_slug": 'example'}), {})
@@ -145,3 +169,207 @@ class TestUrls(TestCase):
         self.response = self.client.get(reverse("delete_event", kwargs={"event_id": 1}), {})
         self.assertEqual(self.response.status_code, 404)
         self.client.logout()
+
+
+class TestOccurrenceApi(TestCase):
+    fixtures = ['schedule.json']
+
+    def setUp(self):
+        self.calendar = Calendar.objects.create(name="MyCal", slug='MyCalSlug')
+        self.event = Event.objects.create(
+            title='Daily', description='', calendar=self.calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        self.other = Event.objects.create(
+            title='Other', description='', calendar=self.calendar, rule=self.event.rule,
+            start=datetime.datetime(2008, 1, 5, 10, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 11, 0, tzinfo=pytz.utc))
+        self.event.get_occurrence(datetime.datetime(2008, 1, 6, 8, 0, tzinfo=pytz.utc)).save()
+        self.client.login(username="admin", password="admin")
+
+    def get_occurrences(self):
+        response = self.client.get(reverse('api_occurences'), {
+            'calendar_slug': 'MyCalSlug', 'start': '2008-01-05', 'end': '2008-01-08'})
+        return json.loads(response.content.decode())
+
+    def test_ids(self):
+        # the calendar, the events and their persisted occurrences
+        with self.assertNumQueries(3):
+            occurrences = self.get_occurrences()
+        ids = [occurrence['id'] for occurrence in occurrences]
+        self.assertEqual(len(set(ids)), 6)
+        persisted = Occurrence.objects.get()
+        self.assertIn(persisted.id, ids)
+        self.assertIn('%d-20080105080000' % self.event.id, ids)
+        self.assertIn('%d-20080105100000' % self.other.id, ids)
+        self.assertEqual([o['existed'] for o in occurrences if o['id'] == persisted.id], [True])
+        self.assertEqual(ids, [o['id'] for o in self.get_occurrences()])
+
+    def test_streaming(self):
+        expected = self.get_occurrences()
+        views.STREAM_API_OCCURRENCES = True
+        try:
+            response = self.client.get(reverse('api_occurences'), {
+                'calendar_slug': 'MyCalSlug', 'start': '2008-01-05', 'end': '2008-01-08'})
+            self.assertTrue(response.streaming)
+            occurrences = json.loads(b''.join(response.streaming_content).decode())
+            self.assertEqual(sorted(occurrences, key=lambda o: (o['event_id'], o['start'])),
+                             sorted(expected, key=lambda o: (o['event_id'], o['start'])))
+            response = self.client.get(reverse('api_occurences'), {
+                'calendar_slug': 'MyCalSlug', 'start': '2007-01-05', 'end': '2007-01-08'})
+            self.assertEqual(json.loads(b''.join(response.streaming_content).decode()), [])
+        finally:
+            views.STREAM_API_OCCURRENCES = False
+
+    def test_conditional_get(self):
+        url = reverse('api_occurences') + '?calendar_slug=MyCalSlug&start=2008-01-05&end=2008-01-08'
+        # the versions live in the occurrence cache
+        self.assertNotIn('ETag', self.client.get(url))
+        settings.OCCURRENCE_CACHE = 'default'
+        caches['default'].clear()
+        try:
+            response = self.client.get(url)
+            # deleting an occurrence would not move it forward
+            self.assertNotIn('Last-Modified', response)
+            # the calendar and the calendars of its events
+            with self.assertNumQueries(2):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            other_range = self.client.get(url.replace('2008-01-08', '2008-01-09'),
+                                          HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(other_range.status_code, 200)
+            Occurrence.objects.get().delete()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        finally:
+            settings.OCCURRENCE_CACHE = None
+
+    def test_conditional_period_views(self):
+        settings.OCCURRENCE_CACHE = 'default'
+        caches['default'].clear()
+        try:
+            url = reverse('month_calendar', kwargs={'calendar_slug': 'MyCalSlug'}) + '?year=2008&month=1'
+            response = self.client.get(url)
+            self.assertNotIn('Last-Modified', response)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.event.title = 'Renamed'
+            self.event.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 200)
+            # the pages show the calendar as well
+            self.calendar.name = 'Renamed'
+            self.calendar.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+            url = reverse('calendar_ical', args=[self.calendar.pk])
+            response = self.client.get(url)
+            self.assertNotIn('Last-Modified', response)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        finally:
+            settings.OCCURRENCE_CACHE = None
+
+    def test_batch(self):
+        other = Calendar.objects.create(name="Other", slug='other')
+        Event.objects.create(
+            title='Once', description='', calendar=other,
+            start=datetime.datetime(2008, 1, 6, 12, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 6, 13, 0, tzinfo=pytz.utc))
+        Calendar.objects.create(name="Empty", slug='empty')
+        url = reverse('api_occurrences_batch')
+        # the calendars, the events and their persisted occurrences
+        with self.assertNumQueries(3):
+            response = self.client.get(url + '?calendar_slug=MyCalSlug,other&calendar_slug=empty'
+                                       '&start=2008-01-05&end=2008-01-08')
+        occurrences = json.loads(response.content.decode())
+        self.assertEqual(sorted(occurrences), ['MyCalSlug', 'empty', 'other'])
+        self.assertEqual(occurrences['MyCalSlug'], self.get_occurrences())
+        self.assertEqual([o['title'] for o in occurrences['other']], ['Once'])
+        self.assertEqual(occurrences['empty'], [])
+        response = self.client.get(url, {'calendar_slug': 'MyCalSlug,missing',
+                                          'start': '2008-01-05', 'end': '2008-01-08'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_permissions(self):
+        Calendar.objects.create(name="Other", slug='other')
+        utils.CALENDAR_VIEW_PERM = True
+        utils.CHECK_CALENDAR_PERM_FUNC = lambda calendar, user: calendar.slug == 'MyCalSlug'
+        try:
+            params = {'start': '2008-01-05', 'end': '2008-01-08'}
+            response = self.client.get(reverse('api_occurrences_batch'), dict(params, calendar_slug='MyCalSlug'))
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse('api_occurrences_batch'), dict(params, calendar_slug='MyCalSlug,other'))
+            self.assertEqual(response.status_code, 302)
+        finally:
+            utils.CALENDAR_VIEW_PERM = settings.CALENDAR_VIEW_PERM
+            utils.CHECK_CALENDAR_PERM_FUNC = settings.CHECK_CALENDAR_PERM_FUNC
+
+    def test_move_or_resize_batch(self):
+        persisted = Occurrence.objects.get()
+        self.other.end_recurring_period = datetime.datetime(2008, 1, 10, 10, 30, tzinfo=pytz.utc)
+        self.other.save()
+        items = [
+            {'id': persisted.id, 'existed': True, 'delta': 60},
+            {'id': '%d-20080107080000' % self.event.id, 'existed': False, 'delta': 30},
+            {'id': '%d-20080107080000' % self.event.id, 'existed': False, 'delta': 30, 'resize': True},
+            {'id': 'x', 'existed': False, 'event_id': self.other.id, 'delta': 60},
+            {'id': 'missing', 'existed': False, 'delta': 60},
+        ]
+        # the targets, the session, the user, the savepoints, the original
+        # starts of the occurrences of the events and one update per model,
+        # or per row before Django 1.8
+        with self.assertNumQueries(9 if hasattr(models, 'Case') else 10):
+            response = self.client.post(reverse('api_move_or_resize_batch'), {'items': json.dumps(items)})
+        self.assertEqual([r['status'] for r in json.loads(response.content.decode())['results']],
+                         ['OK', 'OK', 'OK', 'OK', 'NOT FOUND'])
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual((event.start, event.end), (datetime.datetime(2008, 1, 5, 8, 30, tzinfo=pytz.utc),
+                                                    datetime.datetime(2008, 1, 5, 10, 0, tzinfo=pytz.utc)))
+        persisted = Occurrence.objects.get()
+        self.assertEqual((persisted.start, persisted.original_start),
+                         (datetime.datetime(2008, 1, 6, 9, 0, tzinfo=pytz.utc),
+                          datetime.datetime(2008, 1, 6, 8, 30, tzinfo=pytz.utc)))
+        for event in Event.objects.filter(calendar=self.calendar):
+            self.assertEqual((event.first_occurrence_start, event.last_occurrence_end),
+                             event._compute_occurrence_bounds())
+        # the last occurrence of the other event moved past its end
+        self.assertEqual(Event.objects.get(pk=self.other.pk).last_occurrence_end,
+                         datetime.datetime(2008, 1, 9, 12, 0, tzinfo=pytz.utc))
+
+        views.CHECK_EVENT_PERM_FUNC = lambda event, user: event.pk != self.other.pk
+        try:
+            response = self.client.post(reverse('api_move_or_resize_batch'), {'items': json.dumps(items[2:4])})
+        finally:
+            views.CHECK_EVENT_PERM_FUNC = settings.CHECK_EVENT_PERM_FUNC
+        self.assertEqual([r['status'] for r in json.loads(response.content.decode())['results']],
+                         ['OK', 'PERMISSION DENIED'])
+        self.assertEqual(Event.objects.get(pk=self.other.pk).start, datetime.datetime(2008, 1, 5, 11, 0, tzinfo=pytz.utc))
+        response = self.client.post(reverse('api_move_or_resize_batch'), {'items': '[{"id": 1}]'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_move_or_resize_batch_without_case(self):
+        # as on Django 1.7, which has no conditional expressions
+        case = getattr(models, 'Case', None)
+        if case is not None:
+            del models.Case
+        try:
+            response = self.client.post(reverse('api_move_or_resize_batch'), {'items': json.dumps([
+                {'id': Occurrence.objects.get().id, 'existed': True, 'delta': 60},
+                {'id': '%d-20080107080000' % self.event.id, 'existed': False, 'delta': 30}])})
+        finally:
+            if case is not None:
+                models.Case = case
+        self.assertEqual([r['status'] for r in json.loads(response.content.decode())['results']], ['OK', 'OK'])
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual((event.start, event.end), (datetime.datetime(2008, 1, 5, 8, 30, tzinfo=pytz.utc),
+                                                    datetime.datetime(2008, 1, 5, 9, 30, tzinfo=pytz.utc)))
+        persisted = Occurrence.objects.get()
+        self.assertEqual((persisted.start, persisted.original_start),
+                         (datetime.datetime(2008, 1, 6, 9, 0, tzinfo=pytz.utc),
+                          datetime.datetime(2008, 1, 6, 8, 30, tzinfo=pytz.utc)))
+
+    def test_move_by_id(self):
+        response = self.client.post(reverse('api_move_or_resize'), {
+            'id': '%d-20080107080000' % self.event.id, 'existed': 'false', 'delta': 30})
+        self.assertEqual(json.loads(response.content.decode())['status'], 'OK')
+        self.assertEqual(Event.objects.get(pk=self.event.pk).start,
+                         datetime.datetime(2008, 1, 5, 8, 30, tzinfo=pytz.utc))
+        response = self.client.post(reverse('api_move_or_resize'), {
+            'id': 'bogus', 'existed': 'false', 'delta': 30})
+        self.assertEqual(response.status_code, 404)